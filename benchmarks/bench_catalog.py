@@ -0,0 +1,60 @@
+# benchmarks/bench_catalog.py
+#
+# Shows that listing a directory of libraries through the catalog stays cheap as
+# the number of libraries grows: the first listing describes every library, later
+# ones only stat them, and an edit re-describes just the library it touched.
+#
+#   python benchmarks/bench_catalog.py --counts 100 1000 5000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from studyvault import catalog, file_manager  # noqa: E402
+from studyvault.edits import Splice, commit  # noqa: E402
+
+
+def write_libraries(directory, count, sections):
+    for n in range(count):
+        with open(os.path.join(directory, f"lib_{n:05d}.md"), 'w', encoding='utf-8') as f:
+            f.write(f"# Library {n}\n")
+            for i in range(sections):
+                f.write(f"\n\n## Section {i}\nSome notes about topic {i} of library {n}.\n")
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog listing time vs number of libraries.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--sections", type=int, default=50, help="sections per library")
+    args = parser.parse_args()
+
+    file_manager.console.quiet = True
+    print(f"{'libraries':>10} {'first ms':>10} {'cached ms':>10} {'reload ms':>10} {'one edit ms':>12}")
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as directory:
+            write_libraries(directory, count, args.sections)
+            first = timed(catalog.list_libraries, directory)
+            cached = timed(catalog.list_libraries, directory)
+            # A new process has to read the catalog file back.
+            catalog._catalogs.clear()
+            reload = timed(catalog.list_libraries, directory)
+
+            path = os.path.join(directory, "lib_00000.md")
+            commit(path, [Splice(os.path.getsize(path), b"", b"\n\n## Added\nnew notes\n")])
+            edited = timed(catalog.list_libraries, directory)
+            print(f"{count:>10} {first * 1000:>10.1f} {cached * 1000:>10.1f} {reload * 1000:>10.1f} "
+                  f"{edited * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_changes.py
+#
+# Shows what an edit made outside StudyVault costs the next session: with the
+# fingerprint sidecar the section map and search index are patched around the
+# changed region, without it they are rebuilt from the whole file.
+#
+#   python benchmarks/bench_changes.py --sections 5000 50000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synth import generate_library  # noqa: E402
+from studyvault import changes, library, search_index  # noqa: E402
+
+
+def edit_outside(path):
+    """Insert a few lines in the middle of the file, the way an editor would save it."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    middle = data.index(b"\n", len(data) // 2) + 1
+    data = data[:middle] + b"Edited in another editor.\n## Added Elsewhere\nmore notes\n" + data[middle:]
+    with open(path + ".swp", 'wb') as f:
+        f.write(data)
+    os.replace(path + ".swp", path)
+
+
+def reopen(path):
+    """Load the section map and search index as a new session would."""
+    library.forget_library(path)
+    search_index.close_index(path)
+    start = time.perf_counter()
+    library.get_library(path)
+    search_index.open_index(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache refresh time after an outside edit.")
+    parser.add_argument("--sections", type=int, nargs="+", default=[5000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'sections':>10} {'MB':>8} {'patched ms':>12} {'rebuilt ms':>12}")
+    for sections in args.sections:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "library.md")
+            generate_library(path, sections)
+            reopen(path)
+
+            edit_outside(path)
+            patched = reopen(path)
+
+            edit_outside(path)
+            os.remove(changes.fingerprint_path(path))
+            rebuilt = reopen(path)
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"{sections:>10} {size:>8.1f} {patched * 1000:>12.1f} {rebuilt * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# benchmarks/bench_export.py
+#
+# Compares a cold PDF export (no HTML or layout cache) with a re-export after a
+# one-line edit, which only renders and lays out the edited section.
+#
+#   python benchmarks/bench_export.py --pages 2000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from studyvault import file_manager, pdf_export, render  # noqa: E402
+from studyvault.fileio import remove_file  # noqa: E402
+from bench_search import write_library  # noqa: E402
+
+# write_library() sections take about one seventh of a page each.
+SECTIONS_PER_PAGE = 7
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs cached PDF export time.")
+    parser.add_argument("--pages", type=int, default=2000, help="approximate PDF page count")
+    args = parser.parse_args()
+
+    file_manager.console.quiet = True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "library.md")
+        output = os.path.join(tmp, "library.pdf")
+        write_library(path, args.pages * SECTIONS_PER_PAGE)
+
+        remove_file(render.cache_path(path))
+        remove_file(pdf_export.cache_path(path))
+        cold, _ = timed(pdf_export.export, path, output)
+        warm, _ = timed(pdf_export.export, path, output)
+        file_manager.update_text_in_file(path, "rare-marker line", "rare-marker line (edited)")
+        edited, (rendered, reused) = timed(pdf_export.export, path, output)
+
+    print(f"cold export:          {cold:7.2f}s")
+    print(f"unchanged re-export:  {warm:7.2f}s")
+    print(f"after one-line edit:  {edited:7.2f}s  ({rendered} section(s) laid out, {reused} reused)")
+    print(f"edited / cold:        {edited / cold:7.1%}")
+
+
+if __name__ == "__main__":
+    main()
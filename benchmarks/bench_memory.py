@@ -0,0 +1,92 @@
+# benchmarks/bench_memory.py
+#
+# Tracks peak RSS of each file_manager read/write path on a large library.
+# Every operation runs in a fresh interpreter so its high-water mark is its own.
+#
+#   python benchmarks/bench_memory.py --mb 500
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "algorithm binary cache compiler database entropy function graph hash index "
+    "kernel lambda matrix network object pointer queue recursion stack thread"
+).split()
+
+OPERATIONS = {
+    "import": "pass",
+    "list_sections": "file_manager.list_sections(path)",
+    "get_section_content": "file_manager.get_section_content(path, file_manager.list_sections(path)[-1][0])",
+    "search_sections": "file_manager.search_sections(path, 'rare-marker')",
+    "search_in_file": "file_manager.search_in_file(path, 'rare-marker')",
+    "update_text_in_file": "file_manager.update_text_in_file(path, 'rare-marker', 'rare-marker!')",
+    "delete_keyword_from_lines": "file_manager.delete_keyword_from_lines(path, 'rare', [3, 4, 5])",
+    "append_to_section": (
+        "import builtins; builtins.input = lambda *a: 'yes'; "
+        "file_manager.append_to_section(path, 'Section 7 cache', 'end', None, 'appended line')"
+    ),
+    "append_to_file": "file_manager.append_to_file(path, 'New', 'body')",
+}
+
+CHILD = """
+import resource, sys, json
+sys.path.insert(0, {root!r})
+from studyvault import file_manager
+file_manager.console.quiet = True
+path = {path!r}
+{statement}
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(peak * (1 if sys.platform == 'darwin' else 1024)))
+"""
+
+
+def write_library(path, megabytes, seed=0):
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Benchmark Library\nrare-marker\n")
+        n = 0
+        while f.tell() < target:
+            f.write(f"\n\n## Section {n} {WORDS[n % len(WORDS)]}\n")
+            for _ in range(8):
+                f.write(" ".join(rng.choices(WORDS, k=14)) + "\n")
+            n += 1
+
+
+def peak_rss(path, statement):
+    code = CHILD.format(root=ROOT, path=path, statement=statement)
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS per file_manager operation.")
+    parser.add_argument("--mb", type=int, default=200, help="library size in MB")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "library.md")
+        write_library(path, args.mb)
+        size = os.path.getsize(path)
+        print(f"library: {size / 1e6:.1f} MB")
+        for name, statement in OPERATIONS.items():
+            results[name] = peak_rss(path, statement)
+            print(f"{name:>26}: {results[name] / 1e6:8.1f} MB peak RSS")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"library_bytes": size, "peak_rss": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_search.py
+#
+# Shows that indexed search latency stays flat as a library grows, while the
+# plain line scan grows with file size.
+#
+#   python benchmarks/bench_search.py --sizes 1000 10000 50000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from studyvault import file_manager, search, search_index  # noqa: E402
+
+WORDS = (
+    "algorithm binary cache compiler database entropy function graph hash index "
+    "kernel lambda matrix network object pointer queue recursion stack thread "
+    "vector widget yield zero"
+).split()
+QUERIES = ["recursion", "binary tree", "Kernel", "rare-marker", "thread pool"]
+
+
+def write_library(path, sections, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Benchmark Library\n")
+        for n in range(sections):
+            f.write(f"\n\n## Section {n} {rng.choice(WORDS)}\n")
+            for _ in range(5):
+                f.write(" ".join(rng.choices(WORDS, k=12)) + "\n")
+            if n % 997 == 0:
+                f.write("rare-marker line\n")
+
+
+def timed(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed vs scanning search latency.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    file_manager.console.quiet = True
+    print(f"{'sections':>10} {'MB':>8} {'build s':>9} {'query':>14} {'indexed ms':>11} {'scan ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.md")
+            write_library(path, size)
+            megabytes = os.path.getsize(path) / 1e6
+
+            start = time.perf_counter()
+            search_index.build_index(path)
+            build = time.perf_counter() - start
+
+            for text in QUERIES:
+                query = search.compile_query(text)
+                indexed = timed(search_index.search, path, query)
+                scanned = timed(search.search_lines, path, query, repeat=2)
+                print(f"{size:>10} {megabytes:>8.1f} {build:>9.2f} {text:>14} "
+                      f"{indexed * 1000:>11.2f} {scanned * 1000:>9.2f}")
+            search_index.close_index(path)
+
+
+if __name__ == "__main__":
+    main()
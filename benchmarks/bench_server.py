@@ -0,0 +1,184 @@
+# benchmarks/bench_server.py
+#
+# Load test for `studyvault serve`: concurrent keep-alive clients send a mix of
+# searches, ranked searches, index listings and stores, and the run reports
+# requests/s and latency percentiles per operation. Unless --url or --socket point
+# at a running server, it starts one and serves a generated library; --cli N also
+# times N one-shot `studyvault search` processes for comparison.
+#
+#   python benchmarks/bench_server.py --clients 16 --requests 2000 --writes 0.1
+#   python benchmarks/bench_server.py --url 127.0.0.1:8765 --library physics
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synth import MARKER, generate_library  # noqa: E402
+from studyvault.file_manager import DATA_DIR  # noqa: E402
+
+LAUNCH = "import sys; from studyvault.commands import main; sys.exit(main(sys.argv[1:]))"
+
+
+def operations(library, writes, rng):
+    """Yield an endless mix of operations; `writes` is the share of stores."""
+    n = 0
+    while True:
+        n += 1
+        roll = rng.random()
+        if roll < writes:
+            yield "store", {"op": "store", "library": library, "title": f"Load {n}",
+                            "content": "notes written by the load test"}
+        elif roll < writes + (1 - writes) * 0.5:
+            yield "search", {"op": "search", "library": library, "keyword": MARKER, "mode": "lines"}
+        elif roll < writes + (1 - writes) * 0.8:
+            yield "ranked", {"op": "search", "library": library, "keyword": "cache thread", "top": 10}
+        else:
+            yield "index", {"op": "index", "library": library}
+
+
+async def _connect(args):
+    if args.socket:
+        return await asyncio.open_unix_connection(args.socket)
+    host, _, port = args.url.rpartition(":")
+    return await asyncio.open_connection(host or "127.0.0.1", int(port))
+
+
+async def request(reader, writer, method, path, body=None):
+    payload = json.dumps(body).encode('utf-8') if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode('latin-1') + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(args, mix, timings, failures, remaining):
+    reader, writer = await _connect(args)
+    try:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name, operation = next(mix)
+            start = time.perf_counter()
+            status, result = await request(reader, writer, "POST", "/op", operation)
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+            if status != 200 or not result.get("ok"):
+                failures.append(result.get("error", status))
+    finally:
+        writer.close()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def load(args):
+    reader, writer = await _connect(args)
+    # The first request settles the library, so it is not timed.
+    await request(reader, writer, "POST", "/op", {"op": "index", "library": args.library})
+    writer.close()
+
+    mix = operations(args.library, args.writes, random.Random(0))
+    timings, failures, remaining = {}, [], [args.requests]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args, mix, timings, failures, remaining) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    every = [value for values in timings.values() for value in values]
+    print(f"{len(every)} requests from {args.clients} clients in {elapsed:.2f} s: "
+          f"{len(every) / elapsed:.0f} requests/s, {len(failures)} failed")
+    print(f"{'operation':>10} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, values in sorted(timings.items()) + [("all", every)]:
+        print(f"{name:>10} {len(values):>7} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f}")
+    if failures:
+        print(f"first failure: {failures[0]}")
+
+
+def time_cli(library, runs):
+    """Mean wall time of one `studyvault search` process, the cost the server avoids."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        subprocess.run([sys.executable, "-c", LAUNCH, "search", library, MARKER, "--lines"],
+                       cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) / runs
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    args.url = f"127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-c", LAUNCH, "serve", "--port", str(port)],
+                              cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise SystemExit("The server did not start.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests/s and latency of `studyvault serve`.")
+    parser.add_argument("--url", help="host:port of a running server")
+    parser.add_argument("--socket", help="Unix socket of a running server")
+    parser.add_argument("--library", help="library to query (default: a generated one)")
+    parser.add_argument("--sections", type=int, default=2000, help="sections in the generated library")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--writes", type=float, default=0.1, help="share of requests that store a section")
+    parser.add_argument("--cli", type=int, default=5, metavar="N",
+                        help="also time N one-shot CLI searches (0 to skip)")
+    args = parser.parse_args()
+
+    # The server only serves libraries by name, so a generated one goes in data_libraries/.
+    generated = None
+    if args.library is None:
+        args.library = f"bench-server-{os.getpid()}"
+        generated = os.path.join(DATA_DIR, args.library + ".md")
+        os.makedirs(DATA_DIR, exist_ok=True)
+        generate_library(generated, args.sections)
+    try:
+        server = None if args.url or args.socket else start_server(args)
+        try:
+            asyncio.run(load(args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        if args.cli:
+            print(f"one-shot CLI search: {time_cli(args.library, args.cli) * 1000:.0f} ms per process")
+    finally:
+        if generated is not None:
+            for name in os.listdir(DATA_DIR):
+                if name.startswith(args.library + ".md"):
+                    os.remove(os.path.join(DATA_DIR, name))
+
+
+if __name__ == "__main__":
+    main()
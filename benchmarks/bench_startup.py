@@ -0,0 +1,68 @@
+# benchmarks/bench_startup.py
+#
+# Startup-time budget for scripted use. Measures the import cost of the CLI with
+# `python -X importtime` and fails (exit status 1) when it exceeds the budget or
+# when a heavy dependency is loaded before it is needed.
+#
+#   python benchmarks/bench_startup.py --budget-ms 60
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the scripted CLI must not import just to start up.
+DEFERRED = ("rich", "reportlab", "markdown2", "gnureadline", "readline")
+ENTRY_MODULES = ("studyvault.cli", "studyvault.commands")
+
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module):
+    """Return {module: cumulative import time in microseconds} for one fresh import."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    cumulative = {}
+    for line in output.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLI import-time budget.")
+    parser.add_argument("--budget-ms", type=float, default=60.0,
+                        help="maximum median import time per entry module")
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    failed = False
+    for module in ENTRY_MODULES:
+        timings = []
+        loaded = set()
+        for _ in range(args.runs):
+            profile = import_profile(module)
+            timings.append(profile[module] / 1000)
+            loaded.update(name.split(".")[0] for name in profile if name.split(".")[0] in DEFERRED)
+
+        median = statistics.median(timings)
+        status = "ok" if median <= args.budget_ms else "OVER BUDGET"
+        print(f"{module:>22}: {median:7.1f} ms median (budget {args.budget_ms:.0f} ms) {status}")
+        if median > args.budget_ms:
+            failed = True
+        if loaded:
+            print(f"{'':>22}  loaded at startup: {', '.join(sorted(loaded))}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
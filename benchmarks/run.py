@@ -0,0 +1,266 @@
+# benchmarks/run.py
+#
+# Times and memory-profiles every file_manager operation on generated libraries
+# of increasing size, writes the results as JSON and compares them with a stored
+# baseline. Each measurement runs in a fresh interpreter with the library's
+# sidecar indexes already built, i.e. "cold process, warm disk".
+#
+#   python -m benchmarks.run --sizes 1000 10000 100000 --json results.json
+#   python -m benchmarks.run --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25
+#   python -m benchmarks.run --sizes 100000 --sharded 1024
+#   python -m benchmarks.run --sizes 100000 --sqlite
+
+import argparse
+import datetime
+import glob
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synth import generate_library, section_title, MARKER, TAIL_MARKER  # noqa: E402
+from studyvault.fileio import library_size  # noqa: E402
+
+# `setup` runs untimed in the child before `statement`. Write operations get a
+# fresh copy of the library (and its sidecars) for every run.
+Operation = namedtuple("Operation", ["statement", "setup", "writes", "max_sections"])
+
+OPERATIONS = {
+    "append_to_file": Operation(
+        "file_manager.append_to_file(path, 'Benchmark', 'appended body')", "", True, None),
+    "update_text_in_file": Operation(
+        f"file_manager.update_text_in_file(path, {TAIL_MARKER!r}, {TAIL_MARKER!r} + '!')", "", True, None),
+    "find_lines_containing": Operation(
+        f"file_manager.find_lines_containing(path, {MARKER!r})", "", False, None),
+    "delete_keyword_from_lines": Operation(
+        f"file_manager.delete_keyword_from_lines(path, {MARKER!r}, lines)",
+        f"found = [n for n, _ in file_manager.find_lines_containing(path, {MARKER!r})]\n"
+        "lines = found[len(found) // 2:][:1]", True, None),
+    "replace_many": Operation(
+        "file_manager.replace_many(path, replacements)",
+        f"replacements = dict(('term%04d' % i, 'x') for i in range(1000))\nreplacements[{MARKER!r}] = 'replaced'",
+        True, None),
+    "append_to_section": Operation(
+        "file_manager.append_to_section(path, title, 'end', None, 'appended line', confirm=False)",
+        "title = {middle_title!r}", True, None),
+    "search_in_file": Operation(
+        f"file_manager.search_in_file(path, {MARKER!r})", "", False, None),
+    "search_regex": Operation(
+        f"file_manager.search_in_file(path, {MARKER.replace('-', '.')!r}, 'regex')", "", False, None),
+    "search_sections": Operation(
+        f"file_manager.search_sections(path, {MARKER!r})", "", False, None),
+    "rank_sections": Operation(
+        "file_manager.rank_sections(path, 'kernel bench', 10)", "", False, None),
+    "list_sections": Operation(
+        "file_manager.list_sections(path)", "", False, None),
+    "export_to_pdf": Operation(
+        "file_manager.export_to_pdf(path, output)",
+        "from studyvault import pdf_export, render\n"
+        "from studyvault.fileio import remove_file\n"
+        "remove_file(render.cache_path(path))\n"
+        "remove_file(pdf_export.cache_path(path))\n"
+        "output = path + '.pdf'", False, 100000),
+}
+
+CHILD = """
+import json, resource, sys, time, tracemalloc
+sys.path.insert(0, {root!r})
+from studyvault import file_manager
+file_manager.console.quiet = True
+path = {path!r}
+{setup}
+if {trace!r}:
+    tracemalloc.start()
+scale = 1 if sys.platform == 'darwin' else 1024
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+    "rss_before": rss_before,
+    "py_peak": tracemalloc.get_traced_memory()[1] if {trace!r} else None,
+}}))
+"""
+
+
+def library_path(workdir, args, sections):
+    storage = f"-sharded{args.sharded}" if args.sharded else "-sqlite" if args.sqlite else ""
+    name = f"lib-{sections}-{args.lines}x{args.line_length}-u{args.unicode}-s{args.seed}{storage}.md"
+    return os.path.join(workdir, name)
+
+
+def prepare_library(path, args, sections):
+    """Generate the library (unless a previous run left it in --workdir) and build its sidecars."""
+    from studyvault import edits, file_manager
+    if not os.path.exists(path):
+        generate_library(path, sections, args.lines, args.line_length, args.unicode, args.seed)
+        if args.sharded:
+            edits.convert(path, "sharded", segment_bytes=args.sharded * 1024)
+        elif args.sqlite:
+            edits.convert(path, "sqlite")
+    file_manager.console.quiet = True
+    file_manager.list_sections(path)
+    file_manager.search_in_file(path, MARKER)
+
+
+def copy_library(src, dst):
+    """Copy a library and its sidecars (same mtime, so the sidecars stay valid)."""
+    for source in [src] + glob.glob(glob.escape(src) + ".*"):
+        if os.path.isdir(source):
+            shutil.copytree(source, dst + source[len(src):])
+        else:
+            shutil.copy2(source, dst + source[len(src):])
+
+
+def run_child(path, operation, sections, trace):
+    code = CHILD.format(
+        root=ROOT, path=path, trace=trace, statement=operation.statement,
+        setup=operation.setup.format(middle_title=section_title(sections // 2)),
+    )
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(path, operation, sections, args, scratch):
+    runs = []
+    for trace in [False] * args.repeat + ([True] if args.trace else []):
+        target = path
+        if operation.writes:
+            target = os.path.join(scratch, "work.md")
+            for stale in glob.glob(glob.escape(target) + "*"):
+                if os.path.isdir(stale):
+                    shutil.rmtree(stale)
+                else:
+                    os.remove(stale)
+            copy_library(path, target)
+        runs.append((trace, run_child(target, operation, sections, trace)))
+
+    timed = [run for trace, run in runs if not trace]
+    seconds = sorted(run["seconds"] for run in timed)
+    result = {
+        "seconds": seconds[0],
+        "median_seconds": seconds[len(seconds) // 2],
+        "peak_rss": max(run["peak_rss"] for run in timed),
+        "rss_delta": max(run["peak_rss"] - run["rss_before"] for run in timed),
+    }
+    traced = [run for trace, run in runs if trace]
+    if traced:
+        result["py_peak"] = traced[0]["py_peak"]
+    return result
+
+
+def scaling(per_size):
+    """Growth exponent between consecutive sizes: 1.0 is linear, 0 is flat."""
+    points = sorted((int(size), data["seconds"]) for size, data in per_size.items())
+    exponents = {}
+    for (n1, t1), (n2, t2) in zip(points, points[1:]):
+        if t1 > 0 and t2 > 0:
+            exponents[f"{n1}->{n2}"] = round(math.log(t2 / t1) / math.log(n2 / n1), 2)
+    return exponents
+
+
+def compare(results, baseline, tolerance, floor):
+    """Return [(op, size, seconds, baseline_seconds)] for runs slower than the baseline allows."""
+    regressions = []
+    for op, per_size in results["results"].items():
+        for size, data in per_size.items():
+            base = baseline.get("results", {}).get(op, {}).get(size)
+            if not base:
+                continue
+            if data["seconds"] > base["seconds"] * (1 + tolerance) and data["seconds"] - base["seconds"] > floor:
+                regressions.append((op, size, data["seconds"], base["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every file_manager operation across library sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="library sizes in sections (up to 1000000)")
+    parser.add_argument("--ops", nargs="+", choices=sorted(OPERATIONS), help="operations to run (default: all)")
+    parser.add_argument("--lines", type=int, default=5, help="lines per section")
+    parser.add_argument("--line-length", type=int, default=80, help="approximate characters per line")
+    parser.add_argument("--unicode", type=float, default=0.1, help="fraction of non-ASCII words (0-1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement (best is kept)")
+    parser.add_argument("--no-trace", dest="trace", action="store_false",
+                        help="skip the extra tracemalloc run for Python heap peaks")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="also run slow operations (PDF export) on the largest libraries")
+    parser.add_argument("--workdir", help="keep generated libraries here and reuse them across runs")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", help="write results to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--floor-ms", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--sharded", type=int, metavar="KB",
+                        help="store the libraries sharded into segments of about KB KiB")
+    parser.add_argument("--sqlite", action="store_true", help="store the libraries in the SQLite backend")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "lines": args.lines, "line_length": args.line_length,
+            "unicode": args.unicode, "seed": args.seed, "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    ops = args.ops or list(OPERATIONS)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = args.workdir or scratch
+        os.makedirs(workdir, exist_ok=True)
+        for sections in sorted(args.sizes):
+            path = library_path(workdir, args, sections)
+            prepare_library(path, args, sections)
+            print(f"{sections} sections ({library_size(path) / 1e6:.1f} MB)")
+            for op in ops:
+                operation = OPERATIONS[op]
+                if operation.max_sections and sections > operation.max_sections and not args.no_limits:
+                    print(f"  {op:>26}: skipped (over {operation.max_sections} sections, use --no-limits)")
+                    continue
+                data = measure(path, operation, sections, args, scratch)
+                results["results"].setdefault(op, {})[str(sections)] = data
+                print(f"  {op:>26}: {data['seconds'] * 1000:10.1f} ms  "
+                      f"{data['rss_delta'] / 1e6:8.1f} MB RSS growth")
+
+    results["scaling"] = {op: scaling(per_size) for op, per_size in results["results"].items()}
+    print("\nscaling exponents (1.0 = linear in library size):")
+    for op, exponents in results["scaling"].items():
+        print(f"  {op:>26}: " + "  ".join(f"{step} {value:+.2f}" for step, value in exponents.items()))
+
+    for target in (args.json, args.save_baseline):
+        if target:
+            with open(target, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms / 1000)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for op, size, seconds, base in regressions:
+                print(f"  {op} @ {size}: {seconds * 1000:.1f} ms vs {base * 1000:.1f} ms ({seconds / base - 1:+.0%})")
+            return 1
+        print(f"\nNo regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# benchmarks/synth.py
+#
+# Synthetic library generator for the benchmark suite. Output is deterministic for
+# a given set of parameters, so runs on different machines see the same input.
+
+import os
+import random
+
+ASCII_WORDS = (
+    "algorithm binary cache compiler database entropy function graph hash index "
+    "kernel lambda matrix network object pointer queue recursion stack thread "
+    "vector widget yield zero"
+).split()
+
+UNICODE_WORDS = (
+    "café naïve résumé straße über Ελλάδα λόγος Москва данные 数据 算法 学习 "
+    "東京 ノート 한국어 مرحبا عربى שלום हिन्दी 🚀 📚 ✓ ∑ ∞"
+).split()
+
+# Markers the benchmark statements look for; see run.py.
+MARKER = "bench-marker"
+TAIL_MARKER = "bench-tail"
+MARKER_EVERY = 1000
+
+
+def section_title(n):
+    """Header text (without '## ') of the n-th generated section."""
+    return f"Section {n}"
+
+
+def _line(rng, line_length, unicode_ratio):
+    words = []
+    length = 0
+    while length < line_length:
+        pool = UNICODE_WORDS if unicode_ratio and rng.random() < unicode_ratio else ASCII_WORDS
+        word = rng.choice(pool)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def generate_library(path, sections, lines_per_section=5, line_length=80, unicode_ratio=0.0, seed=0):
+    """
+    Write a library of `sections` sections of `lines_per_section` lines, each about
+    `line_length` characters, with roughly `unicode_ratio` of the words non-ASCII.
+    Every MARKER_EVERY-th section carries a MARKER line and the last one a TAIL_MARKER.
+    Returns the file size in bytes.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("# Benchmark Library\n")
+        buffer = []
+        for n in range(sections):
+            buffer.append(f"\n\n## {section_title(n)}\n")
+            for _ in range(lines_per_section):
+                buffer.append(_line(rng, line_length, unicode_ratio) + "\n")
+            if n % MARKER_EVERY == 0:
+                buffer.append(f"{MARKER} line\n")
+            if n == sections - 1:
+                buffer.append(f"{TAIL_MARKER} line\n")
+            if len(buffer) > 10000:
+                f.write("".join(buffer))
+                buffer = []
+        f.write("".join(buffer))
+    return os.path.getsize(path)
@@ -0,0 +1,115 @@
+# studyvault/blockcache.py
+#
+# Append-only cache of JSON values keyed by a section's content hash, used for the
+# rendered HTML (<library>.md.htmlcache) and the PDF layout (<library>.md.pdfcache).
+# The first line is a JSON header (format version and options); every other line
+# is "<key>\t<crc32>\t<json value>". New entries are appended, so an export after
+# a one-line edit writes one line whatever the library's size, and values are
+# only decoded when asked for. Once entries for sections that are gone outnumber
+# the live ones, the file is rewritten without them. Writers hold the library's
+# lock (as journal compaction does); a line torn by a crash fails its checksum
+# and is skipped.
+
+import json
+import os
+import zlib
+from studyvault.fileio import sidecar_path, locked, remove_file, temporary_file
+from studyvault.journal import LOCK_SUFFIX
+
+
+class BlockCache:
+    """The entries of one cache file: raw JSON per key, decoded on get()."""
+
+    def __init__(self, library_path, suffix, header):
+        self.path = sidecar_path(library_path, suffix)
+        self.lock_path = sidecar_path(library_path, LOCK_SUFFIX)
+        self.header = json.dumps(header, sort_keys=True).encode('utf-8')
+        self.entries = {}
+        self.records = 0
+        # False when the file is missing or was written with another header.
+        self.current = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                if f.readline().rstrip(b"\n") != self.header:
+                    return
+                self.current = True
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        continue
+                    key, _, rest = line[:-1].partition(b"\t")
+                    checksum, _, value = rest.partition(b"\t")
+                    if not checksum.isdigit() or zlib.crc32(value) != int(checksum):
+                        continue
+                    self.entries[key.decode('ascii')] = value
+                    self.records += 1
+        except (OSError, UnicodeDecodeError):
+            self.entries, self.records, self.current = {}, 0, False
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return json.loads(self.entries[key])
+
+    @staticmethod
+    def _line(key, value):
+        value = value if isinstance(value, bytes) else json.dumps(value, ensure_ascii=False,
+                                                                  separators=(',', ':')).encode('utf-8')
+        return b"%s\t%d\t%s\n" % (key.encode('ascii'), zlib.crc32(value), value), value
+
+    def add(self, items):
+        """Store {key: value} (JSON-ready values), appending them to the file."""
+        if not items:
+            return
+        lines = []
+        for key, value in items.items():
+            line, raw = self._line(key, value)
+            lines.append(line)
+            self.entries[key] = raw
+        try:
+            with locked(self.lock_path):
+                if not self.current:
+                    self._rewrite(self.entries)
+                    return
+                with open(self.path, 'ab') as f:
+                    if f.tell() and not self._ends_with_newline():
+                        # Keep a torn last line from swallowing the first new one.
+                        f.write(b"\n")
+                    f.writelines(lines)
+                self.records += len(lines)
+        except OSError:
+            # Caches must not break an export, e.g. in a read-only directory.
+            pass
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def prune(self, live):
+        """Forget entries whose key is not in live; rewrite the file once they outnumber the rest."""
+        live = set(live)
+        for key in [key for key in self.entries if key not in live]:
+            del self.entries[key]
+        if self.records <= 2 * len(self.entries):
+            return
+        try:
+            with locked(self.lock_path):
+                self._rewrite(self.entries)
+        except OSError:
+            pass
+
+    def _rewrite(self, entries):
+        fd, tmp_path = temporary_file(self.path)
+        try:
+            with open(fd, 'wb') as f:
+                f.write(self.header + b"\n")
+                f.writelines(self._line(key, value)[0] for key, value in entries.items())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            remove_file(tmp_path)
+            raise
+        self.records, self.current = len(entries), True
@@ -0,0 +1,252 @@
+# studyvault/catalog.py
+#
+# Catalog of the libraries in one directory (data_libraries/ by default), kept in
+# <directory>/.catalog.json. Each entry holds the library's stat key (the .md file
+# or directory plus its journal), storage kind, size, modification time, section
+# count and last edited section. A refresh is one os.scandir pass: only entries
+# whose stat key changed are described again, so listing thousands of libraries
+# does not open any of them.
+#
+# Writers record the section each commit touched by appending a line to
+# <directory>/.catalog.edits (only once the directory has a catalog); the next
+# refresh folds those lines in and removes the file.
+
+import fnmatch
+import json
+import os
+import sqlite3
+import stat
+import time
+from collections import namedtuple
+from studyvault.fileio import load_json, write_json, remove_file
+from studyvault.journal import open_library, logical_signature, journal_path
+from studyvault.library import cached_library
+from studyvault.parser import header_title, split_lines
+from studyvault.section_index import load_section_index
+from studyvault import storage
+
+CATALOG_NAME = ".catalog.json"
+EDITS_NAME = ".catalog.edits"
+FORMAT = 1
+SORT_KEYS = ("name", "size", "modified", "sections")
+UNTITLED = "Untitled"
+# Bytes read back from an edit to find its section header; doubled until one is found.
+TITLE_WINDOW = 64 * 1024
+
+# `modified` is a POSIX timestamp; `sections` is None for a library that could not
+# be read, and `edited` is None until an edit through StudyVault has been seen.
+LibraryInfo = namedtuple("LibraryInfo", ["name", "path", "storage", "size", "modified", "sections", "edited"])
+
+# {directory: (stat key of the catalog file, entries)} so repeated listings skip the JSON.
+_catalogs = {}
+
+
+def catalog_path(directory):
+    return os.path.join(directory, CATALOG_NAME)
+
+
+def edits_path(directory):
+    return os.path.join(directory, EDITS_NAME)
+
+
+def _load(directory):
+    path = catalog_path(directory)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    cached = _catalogs.get(directory)
+    if cached is not None and cached[0] == (st.st_size, st.st_mtime_ns):
+        return cached[1]
+    data = load_json(path)
+    entries = data["libraries"] if data and data.get("format") == FORMAT else {}
+    _catalogs[directory] = ((st.st_size, st.st_mtime_ns), entries)
+    return entries
+
+
+def _save(directory, entries):
+    path = catalog_path(directory)
+    if write_json(path, {"format": FORMAT, "libraries": entries}):
+        st = os.stat(path)
+        _catalogs[directory] = ((st.st_size, st.st_mtime_ns), entries)
+
+
+def _read_edits(directory):
+    """Return ({library name: last edited title}, bytes read) from the edit log."""
+    edited = {}
+    try:
+        with open(edits_path(directory), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return edited, 0
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+            edited[record["name"]] = record["title"]
+        except (ValueError, KeyError, TypeError):
+            # A line torn by a crash or a concurrent append; the rest still count.
+            continue
+    return edited, len(data)
+
+
+def _section_map(path):
+    """Return ([offset], [title]) of the library's sections, without caching a Library."""
+    library = cached_library(path)
+    if library is not None:
+        return [section.offset for section in library.sections], [section.title for section in library.sections]
+    rows = load_section_index(path)
+    return [row[2] for row in rows], [row[0] for row in rows]
+
+
+def _describe(path, key, st, journal_st):
+    modified = max(st.st_mtime, journal_st.st_mtime) if journal_st is not None else st.st_mtime
+    entry = {"key": key, "storage": storage.kind(path, st), "size": None, "modified": modified, "sections": None}
+    try:
+        entry["size"] = logical_signature(path)[0]
+        entry["sections"] = len(_section_map(path)[0])
+    except (OSError, ValueError, sqlite3.Error):
+        # Listed with what stat knows; described again once the file changes.
+        pass
+    return entry
+
+
+def refresh(directory):
+    """
+    Bring the catalog of a directory up to date and return {name: entry}. Libraries
+    whose stat key is unchanged are taken from the cache as they are.
+    """
+    cached = _load(directory)
+    edited, edits_size = _read_edits(directory)
+    try:
+        with os.scandir(directory) as it:
+            listing = {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        return {}
+
+    entries = {}
+    changed = bool(edits_size)
+    for name, dir_entry in listing.items():
+        if not name.endswith('.md'):
+            continue
+        try:
+            st = dir_entry.stat()
+            journal_entry = listing.get(os.path.basename(journal_path(name)))
+            journal_st = journal_entry.stat() if journal_entry is not None else None
+        except OSError:
+            continue
+        if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode)):
+            continue
+        key = [st.st_size, st.st_mtime_ns]
+        if journal_st is not None:
+            key += [journal_st.st_size, journal_st.st_mtime_ns]
+
+        old = cached.get(name)
+        if old is not None and old["key"] == key:
+            entry = old
+        else:
+            entry = _describe(os.path.join(directory, name), key, st, journal_st)
+            entry["edited"] = old.get("edited") if old is not None else None
+            changed = True
+        if name in edited:
+            entry = dict(entry, edited=edited[name])
+        entries[name] = entry
+
+    if changed or len(entries) != len(cached):
+        _save(directory, entries)
+    if edits_size:
+        try:
+            # Lines appended while we were scanning stay for the next refresh.
+            if os.path.getsize(edits_path(directory)) == edits_size:
+                remove_file(edits_path(directory))
+        except OSError:
+            pass
+    return entries
+
+
+def list_libraries(directory, sort="name", reverse=False, match=None):
+    """
+    Return LibraryInfo records for the libraries in directory, sorted by `sort` (one
+    of SORT_KEYS). `match` keeps names containing it, case-insensitively, or matching
+    it as a glob pattern when it holds *, ? or [.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key '{sort}'.")
+    libraries = [
+        LibraryInfo(name, os.path.join(directory, name), entry["storage"], entry["size"], entry["modified"],
+                    entry["sections"], entry["edited"])
+        for name, entry in refresh(directory).items()
+    ]
+    if match:
+        pattern = match.lower()
+        if any(char in pattern for char in "*?["):
+            libraries = [info for info in libraries if fnmatch.fnmatchcase(info.name.lower(), pattern)]
+        else:
+            libraries = [info for info in libraries if pattern in info.name.lower()]
+
+    if sort == "name":
+        libraries.sort(key=lambda info: info.name.lower(), reverse=reverse)
+    else:
+        # Unreadable libraries (None) sort first, or last when reversed.
+        libraries.sort(key=lambda info: (getattr(info, sort) is not None, getattr(info, sort) or 0, info.name.lower()),
+                       reverse=reverse)
+    return libraries
+
+
+def _title_at(path, offset):
+    """Title of the section holding the byte at offset (UNTITLED before the first header)."""
+    library = cached_library(path)
+    if library is not None:
+        i = library.section_index_at_offset(offset)
+        return library.sections[i].title if i >= 0 else UNTITLED
+    with open_library(path) as f:
+        f.seek(offset)
+        end = offset + len(f.readline())
+        window = TITLE_WINDOW
+        while True:
+            start = max(end - window, 0)
+            f.seek(start)
+            lines = split_lines(f.read(end - start))
+            # The first line of a window that does not start the file may be cut short.
+            for raw in reversed(lines[1:] if start > 0 else lines):
+                title = header_title(raw)
+                if title is not None:
+                    return title
+            if start == 0:
+                return UNTITLED
+            window *= 2
+
+
+def note_edit(path, splices):
+    """
+    Record the section the last of a commit's splices (sorted, pre-write offsets)
+    landed in, for the catalog of the library's directory. Does nothing until that
+    directory has a catalog.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not splices or not os.path.exists(catalog_path(directory)):
+        return
+    last = splices[-1]
+    offset = last.offset + sum(len(splice.new) - len(splice.old) for splice in splices[:-1])
+    # Point at the last byte written, or at the byte before a deletion.
+    offset = offset + len(last.new) - 1 if last.new else max(offset - 1, 0)
+    try:
+        record = {"name": os.path.basename(path), "title": _title_at(path, offset)}
+        with open(edits_path(directory), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except (OSError, ValueError, sqlite3.Error):
+        # The catalog is only a cache; a failed note must not fail the write.
+        pass
+
+
+def format_size(size):
+    """Human-readable byte count, e.g. '4.6 MB'."""
+    if size is None:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
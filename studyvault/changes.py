@@ -0,0 +1,184 @@
+# studyvault/changes.py
+#
+# Detection of edits made to a library outside StudyVault (by hand, or by a sync
+# tool). Next to its caches, a plain .md library keeps a fingerprint sidecar
+# (<library>.md.blocks): the file's (mtime_ns, size, inode) and a crc32 and newline
+# count of every 64 KB block, once with blocks aligned to the head of the file and
+# once aligned to its tail. When the file's stat no longer matches, one hashing
+# pass over the new content compares blocks from both ends; only the bytes between
+# the unchanged head and tail can have changed. That region is handed to the
+# section map and the search index as a splice, like an edit of our own, so they
+# re-read just the sections and lines it covers. A change spanning most of the
+# file, or a library without a current fingerprint, still means a full rebuild.
+
+import os
+import zlib
+from studyvault.fileio import sidecar_path, file_signature, load_json, write_json, remove_file, mapped
+from studyvault.instrument import count
+from studyvault.journal import journal_path
+from studyvault import storage
+
+FINGERPRINT_SUFFIX = "blocks"
+FINGERPRINT_VERSION = 1
+BLOCK_BYTES = 64 * 1024
+# The unchanged head and tail must cover at least this share of the file, or
+# re-reading the region costs about as much as rebuilding.
+LOCALIZE_RATIO = 0.5
+
+
+class _Replaced:
+    """Stands in for the bytes an outside edit replaced: only their length and newline count are known."""
+
+    __slots__ = ("length", "newlines")
+
+    def __init__(self, length, newlines):
+        self.length = length
+        self.newlines = newlines
+
+    def __len__(self):
+        return self.length
+
+    def count(self, sub):
+        return self.newlines
+
+
+def fingerprint_path(path):
+    """Return the path of the fingerprint stored next to a library."""
+    return sidecar_path(path, FINGERPRINT_SUFFIX)
+
+
+def stat_key(path):
+    """The (mtime_ns, size, inode) a poller compares to notice that a library changed."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def _trackable(path):
+    return storage.kind(path) == storage.MARKDOWN and not os.path.exists(journal_path(path))
+
+
+def _blocks(buffer, start):
+    """[crc32, newlines] per BLOCK_BYTES block of buffer, the first one ending at start."""
+    rows = []
+    position = 0
+    for end in range(start, len(buffer) + BLOCK_BYTES, BLOCK_BYTES):
+        end = min(end, len(buffer))
+        if end <= position and rows:
+            break
+        data = buffer[position:end]
+        rows.append([zlib.crc32(data), data.count(b"\n")])
+        position = end
+    return rows
+
+
+def fingerprint(path):
+    """Hash the library's blocks from both ends; returns the fingerprint dict, or None if it changed meanwhile."""
+    key = stat_key(path)
+    signature = file_signature(path)
+    with mapped(path) as buffer:
+        size = len(buffer)
+        head = _blocks(buffer, BLOCK_BYTES)
+        tail = _blocks(buffer, size % BLOCK_BYTES or BLOCK_BYTES)
+    count(bytes_read=2 * size)
+    if stat_key(path) != key:
+        return None
+    return {
+        "version": FINGERPRINT_VERSION,
+        "stat": key,
+        "signature": signature,
+        "block": BLOCK_BYTES,
+        "size": size,
+        "newlines": sum(row[1] for row in head),
+        "head": head,
+        "tail": tail,
+    }
+
+
+def remember(path):
+    """Record the fingerprint of a library's current content (the one its caches describe)."""
+    if storage.kind(path) != storage.MARKDOWN:
+        remove_file(fingerprint_path(path))
+        return
+    if os.path.exists(journal_path(path)):
+        return  # remembered again once the journal is compacted
+    data = load_json(fingerprint_path(path))
+    if data and data.get("stat") == stat_key(path):
+        return
+    current = fingerprint(path)
+    if current is not None:
+        write_json(fingerprint_path(path), current)
+
+
+def locate(old, new):
+    """
+    Compare two fingerprints. Returns (offset, old_length, old_newlines, new_length)
+    for the region that differs (lengths 0 when the content is the same), or None
+    when the unchanged ends are too small to be worth patching from.
+    """
+    if old.get("version") != FINGERPRINT_VERSION or old.get("block") != new["block"]:
+        return None
+    block = new["block"]
+    common = min(old["size"], new["size"])
+
+    head = 0
+    while head < min(len(old["head"]), len(new["head"])) and old["head"][head] == new["head"][head]:
+        head += 1
+    prefix = min(head * block, common)
+    head_newlines = sum(row[1] for row in old["head"][:head])
+    if head * block > common:
+        # Only the same content can match in full, including the last, partial block.
+        if old["size"] != new["size"]:
+            return None
+        return prefix, 0, 0, 0
+
+    tail = 0
+    while (tail < min(len(old["tail"]), len(new["tail"]))
+           and old["tail"][-1 - tail] == new["tail"][-1 - tail] and (tail + 1) * block <= common - prefix):
+        tail += 1
+    suffix = tail * block
+    tail_newlines = sum(row[1] for row in old["tail"][len(old["tail"]) - tail:])
+
+    if prefix + suffix < new["size"] * LOCALIZE_RATIO:
+        return None
+    old_length = old["size"] - prefix - suffix
+    return prefix, old_length, old["newlines"] - head_newlines - tail_newlines, new["size"] - prefix - suffix
+
+
+def resync(path):
+    """
+    Bring a library's caches up to date after it changed outside StudyVault, by
+    patching only the region that changed. Returns False when the change could not
+    be localized, leaving the caches to rebuild as before.
+    """
+    from studyvault import library, line_offsets, search_index
+    from studyvault.edits import Splice
+
+    if not _trackable(path):
+        return False
+    old = load_json(fingerprint_path(path))
+    if not old or old.get("stat") == stat_key(path):
+        return False
+    new = fingerprint(path)
+    if new is None:
+        return False
+    region = locate(old, new)
+    if region is None:
+        return False
+
+    before, after = old["signature"], new["signature"]
+    offset, old_length, old_newlines, new_length = region
+    if old_length == 0 and new_length == 0:
+        library.restamp(path, before, after)
+        line_offsets.restamp(path, before, after)
+        search_index.restamp(path, before, after)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(new_length)
+        count(bytes_read=len(data))
+        splices = [Splice(offset, _Replaced(old_length, old_newlines), data)]
+        library.resync(path, splices, before)
+        line_offsets.invalidate(path)
+        search_index.apply_splices(path, splices, before)
+    write_json(fingerprint_path(path), new)
+    return True
@@ -2,34 +2,39 @@
 
 import os
 import re
+import sys
+import time
 import platform
 from studyvault.file_manager import (
-    list_markdown_files,
     get_library_path,
     ensure_data_directory,
     append_to_file,
     update_text_in_file,
 )
-from rich import print
-from rich.console import Console
-from rich.panel import Panel
-from rich.prompt import Prompt
-from rich.text import Text
-from rich.rule import Rule
-
-console = Console()
-
-try:
-    if platform.system() == "Linux":
-        import gnureadline as readline
-    else:
-        import readline
-except ImportError:
-    readline = None
+from studyvault.console import console, Rule, highlight, escape
+from studyvault import instrument
+from studyvault.instrument import instrumented
+from studyvault.pager import Pager
 
+# Ranked sections shown by the library-menu Search.
+SEARCH_RESULTS = 10
 
+readline = None
 current_library = None
 
+
+def enable_line_editing():
+    """Load readline for input() history and editing; only the interactive menu needs it."""
+    global readline
+    try:
+        if platform.system() == "Linux":
+            import gnureadline as readline
+        else:
+            import readline
+    except ImportError:
+        readline = None
+
+
 def clear_screen():
     console.clear()
     if platform.system() == "Windows":
@@ -43,6 +48,7 @@ def display_main_menu():
     console.print(Rule("[bold cyan]StudyVault Main Menu"))
     console.print("[bold green]Create[/bold green]  - Create a new data library")
     console.print("[bold blue]List[/bold blue]    - List and load existing libraries")
+    console.print("[bold magenta]Search[/bold magenta]  - Search across all libraries")
     console.print("[bold red]Exit[/bold red]    - Exit the application")
 
 def display_library_menu():
@@ -52,10 +58,15 @@ def display_library_menu():
     console.print("[bold yellow]Update[/bold yellow]  - Modify existing content")
     console.print("[bold red]Delete[/bold red]  - Remove content")
     console.print("[bold cyan]Append[/bold cyan]  - Add content to a specific section")
+    console.print("[bold green]Import[/bold green]  - Import a folder of .md/.txt notes")
     console.print("[bold magenta]Search[/bold magenta]  - Find content")
-    console.print("[bold white]Export[/bold white]  - Export current library to PDF")
+    console.print("[bold white]Export[/bold white]  - Export current library to PDF or HTML (.html filename)")
+    console.print("[bold yellow]Undo[/bold yellow]    - Revert the last edit")
+    console.print("[bold yellow]Redo[/bold yellow]    - Re-apply the last undone edit")
+    console.print("[bold blue]History[/bold blue] - List past edits or export an earlier version")
     console.print("[bold red]Exit[/bold red]    - Exit the application")
 
+@instrumented
 def handle_create():
     global current_library
     name = input("Enter a name for the new library (without .md): ").strip()
@@ -69,32 +80,67 @@ def handle_create():
     with open(path, 'w', encoding='utf-8') as f:
         f.write(f"# {name} Library\n")
     current_library = path
+    from studyvault import warmup
+    warmup.start(current_library)
     console.print(f"[bold green][+][/bold green] Loaded library: [bold]{filename}[/bold]")
 
+def print_library_table(libraries):
+    from rich.table import Table
+    from studyvault.catalog import format_size, format_time
+    table = Table(box=None, header_style="bold cyan")
+    for column in ("#", "Library", "Sections", "Size", "Modified", "Last edited"):
+        table.add_column(column, justify="right" if column in ("#", "Sections", "Size") else "left")
+    for i, info in enumerate(libraries, 1):
+        table.add_row(str(i), info.name, "?" if info.sections is None else str(info.sections),
+                      format_size(info.size), format_time(info.modified), info.edited or "-")
+    console.print(table)
+
+@instrumented
 def handle_list_and_load():
     global current_library
-    files = list_markdown_files()
-    if not files:
-        console.print("[bold red][!][/bold red] No libraries found. Use 'Create' to make one.")
-
-        return
-
-    console.print("\n[bold cyan]📂 Available Libraries:[/bold cyan]")
-    for i, file in enumerate(files):
-        console.print(f" [bold cyan]{i+1}[/bold cyan]] {file}")
+    from studyvault.file_manager import list_libraries
+    from studyvault.catalog import SORT_KEYS
+    sort, match = "name", None
+    while True:
+        files = list_libraries(sort, reverse=sort in ("size", "modified", "sections"), match=match)
+        if not files and not match:
+            console.print("[bold red][!][/bold red] No libraries found. Use 'Create' to make one.")
+            return
 
+        console.print("\n[bold cyan]📂 Available Libraries:[/bold cyan]")
+        if files:
+            print_library_table(files)
+        else:
+            console.print(f"[bold red][!][/bold red] No library names match '{match}'.")
+        console.print(f"[dim]Sort with 'sort {'|'.join(SORT_KEYS)}', filter with 'filter <text>' "
+                      "('filter' alone clears it).[/dim]")
+
+        choice = input("Enter the number of the library to load: ").strip()
+        command, _, argument = choice.partition(" ")
+        if command.lower() == "sort":
+            if argument.strip().lower() in SORT_KEYS:
+                sort = argument.strip().lower()
+            else:
+                console.print(f"[bold red][!][/bold red] Sort by one of: {', '.join(SORT_KEYS)}.")
+            continue
+        if command.lower() == "filter":
+            match = argument.strip() or None
+            continue
+        break
 
-    choice = input("Enter the number of the library to load: ").strip()
     if not choice.isdigit() or not (1 <= int(choice) <= len(files)):
         console.print("[bold red][!][/bold red] Invalid selection.")
 
         return
 
-    selected = files[int(choice) - 1]
+    selected = files[int(choice) - 1].name
     current_library = get_library_path(selected)
+    from studyvault import warmup
+    warmup.start(current_library)
     console.print(f"[bold green][+][/bold green] Loaded library: [bold]{os.path.basename(selected)}[/bold]")
     enter_library_loop()
 
+@instrumented
 def handle_store():
     title = input("Enter a title for this entry: ").strip()
     console.print("[bold cyan]Enter content[/bold cyan] (end with an empty line):")
@@ -108,6 +154,19 @@ def handle_store():
     content = "\n".join(lines)
     append_to_file(current_library, title, content)
 
+@instrumented
+def handle_import():
+    source = input("Enter the folder to import notes from: ").strip()
+    if not os.path.isdir(source):
+        console.print("[bold red][!][/bold red] Folder not found.")
+        return
+
+    from studyvault.importer import import_notes, import_summary
+    with console.status("[bold cyan]Importing notes...[/bold cyan]"):
+        stats = import_notes(current_library, source)
+    console.print(f"[bold green][+][/bold green] {import_summary(stats)}")
+
+@instrumented
 def handle_update():
     console.print("[bold cyan]Enter update command in format:[/bold cyan]")
 
@@ -124,6 +183,7 @@ def handle_update():
     old_text, new_text = match.groups()
     update_text_in_file(current_library, old_text, new_text)
 
+@instrumented
 def handle_delete():
     if not current_library:
         console.print("[bold red][!][/bold red] No library loaded. Use 'Load' or 'Create' first.")
@@ -138,9 +198,10 @@ def handle_delete():
 
         return
 
-    console.print("\n[bold cyan]Lines containing the keyword:[/bold cyan]")
-    for line_num, content in matches:
-        console.print(f"[dim]{line_num}[/dim]: {content}")
+    console.print(f"\n[bold cyan]Lines containing the keyword ({len(matches)}):[/bold cyan]")
+    pager = Pager(total=len(matches))
+    pager.extend(matches, lambda match: f"[dim]{match[0]}[/dim]: {escape(match[1])}")
+    pager.close()
 
     selection = input("\nEnter line number(s) to delete from (comma-separated): ").strip()
     try:
@@ -150,6 +211,7 @@ def handle_delete():
         console.print("[bold red][!][/bold red] Invalid line numbers.")
 
 
+@instrumented
 def handle_search():
     if not current_library:
         console.print("[bold red][!][/bold red] No library loaded. Use 'Load' or 'Create' first.")
@@ -157,23 +219,56 @@ def handle_search():
         return
 
     keyword = input("Enter a keyword or phrase to search for: ").strip()
-    from studyvault.file_manager import search_sections
-    matches = search_sections(current_library, keyword)
+    from studyvault.file_manager import search_ranked
+    total, matches = search_ranked(current_library, keyword, SEARCH_RESULTS)
 
     if not matches:
         console.print("[bold red][!][/bold red] No sections contain this keyword.")
         return
-    console.print(f"\n[bold yellow]🔍 Found {len(matches)} section(s) containing '{keyword}':[/bold yellow]")
+    console.print(f"\n[bold yellow]🔍 Top {len(matches)} of {total} section(s) for '{escape(keyword)}':[/bold yellow]")
     console.print(Rule())
-    for title, lines in matches:
-        console.print(f"[bold blue]{title}[/bold blue]")
-        console.print(Rule())
+    pager = Pager()
+    for i, match in enumerate(matches, 1):
+        score = f", score {match.score:.2f}" if match.score else ""
+        pager.add(f"[cyan]{i}.[/cyan] [bold blue]{escape(match.title)}[/bold blue]  "
+                  f"[dim](line {match.line}{score})[/dim]\n"
+                  f"   {highlight(match.snippet, match.highlights)}")
+    pager.close()
+    console.print(Rule())
+    console.print("[dim]Use Index to open a section.[/dim]")
 
-        for line in lines:
-            console.print(f" {line}")
-    console.print(Rule())
 
+@instrumented
+def handle_search_everywhere():
+    keyword = input("Enter a keyword or phrase to search all libraries for: ").strip()
+    limit = input("Stop after how many matching sections? (Enter for no limit): ").strip()
+    if limit and not limit.isdigit():
+        console.print("[bold red][!][/bold red] Limit must be numeric.")
+        return
 
+    from studyvault.file_manager import DATA_DIR
+    from studyvault.cross_search import search_everywhere
+
+    total = 0
+    pager = Pager()
+    for library, matches in search_everywhere(keyword, DATA_DIR, int(limit) if limit else None):
+        total += len(matches)
+        if pager.full:
+            pager.hidden += sum(1 + len(lines) for _, lines in matches)
+            continue
+        pager.add(f"[bold cyan]━━ 📂 {escape(library)}[/bold cyan] ({len(matches)} section(s))")
+        for title, lines in matches:
+            pager.add(f"[bold blue]{escape(title)}[/bold blue]")
+            pager.extend(lines, lambda line: f" {escape(line)}")
+    pager.close()
+
+    if not total:
+        console.print("[bold red][!][/bold red] No sections contain this keyword.")
+        return
+    console.print(Rule(f"[bold yellow]🔍 {total} section(s) found[/bold yellow]"))
+
+
+@instrumented
 def handle_append_to_section():
     if not current_library:
         console.print("[bold red][!][/bold red] No library loaded. Use 'Load' or 'Create' first.")
@@ -226,32 +321,57 @@ def handle_append_to_section():
             console.print(f"[dim]{line_num}[/dim]: {line}")
 
 def enter_library_loop():
-    while True:
-        display_library_menu()
-        command = input("\n> ").strip().lower()
-
-        if command == "store":
-            handle_store()
-        elif command == "index":
-            handle_index()
-        elif command == "update":
-            handle_update()
-        elif command == "append":
-            handle_append_to_section()
-        elif command == "delete":
-            handle_delete()
-        elif command == "export":
-            handle_export()
-        elif command == "search":
-            handle_search()
-        elif command == "exit":
-            clear_screen()
-            console.print("[bold magenta]👋 Exiting StudyVault...[/bold magenta]")
-
-            break
-        else:
-            console.print("[bold red][!][/bold red] Unknown command. Please choose a valid option.")
+    from studyvault import warmup
+    from studyvault.journal import JournalConflict
+    try:
+        while True:
+            display_library_menu()
+            command = input("\n> ").strip().lower()
+            if command == "exit":
+                clear_screen()
+                console.print("[bold magenta]👋 Exiting StudyVault...[/bold magenta]")
+
+                break
+
+            # The warm-up pauses while a command runs, then catches up on what it changed.
+            with warmup.hold():
+                try:
+                    dispatch_library_command(command)
+                except JournalConflict as e:
+                    console.print(f"[bold red][!][/bold red] {escape(str(e))}")
+                warmup.start(current_library)
+    finally:
+        warmup.stop()
+
+def dispatch_library_command(command):
+    if command == "store":
+        handle_store()
+    elif command == "index":
+        handle_index()
+    elif command == "update":
+        handle_update()
+    elif command == "append":
+        handle_append_to_section()
+    elif command == "import":
+        handle_import()
+    elif command == "delete":
+        handle_delete()
+    elif command == "export":
+        handle_export()
+    elif command == "search":
+        handle_search()
+    elif command == "undo":
+        from studyvault.file_manager import undo_last_edit
+        undo_last_edit(current_library)
+    elif command == "redo":
+        from studyvault.file_manager import redo_last_edit
+        redo_last_edit(current_library)
+    elif command == "history":
+        handle_history()
+    else:
+        console.print("[bold red][!][/bold red] Unknown command. Please choose a valid option.")
 
+@instrumented
 def handle_index():
     if not current_library:
         console.print("[bold red][!][/bold red] No library loaded. Use 'Load' or 'Create' first.")
@@ -264,10 +384,12 @@ def handle_index():
         console.print("[bold yellow][*][/bold yellow] No sections found.")
         return
 
-    console.print("\n[bold blue]📑 Section Index[/bold blue]")
+    console.print(f"\n[bold blue]📑 Section Index[/bold blue] [dim]({len(sections)} sections)[/dim]")
     console.print(Rule())
-    for i, (line_num, title) in enumerate(sections, 1):
-        console.print(f"[cyan]{i}.[/cyan] [bold]{title}[/bold]  [dim](line {line_num})[/dim]")
+    pager = Pager(total=len(sections))
+    pager.extend(range(len(sections)), lambda i: f"[cyan]{i + 1}.[/cyan] [bold]{escape(sections[i][1])}[/bold]  "
+                                               f"[dim](line {sections[i][0]})[/dim]")
+    pager.close()
 
     console.print("\n[dim]Type a section number to view its content or press Enter to return.[/dim]")
     choice = input("> ").strip()
@@ -282,23 +404,24 @@ def handle_index():
     selected_line = sections[int(choice) - 1][0]
     display_section_content_from_line(current_library, selected_line)
 
+@instrumented
 def display_section_content_from_line(path, start_line):
-    with open(path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    from studyvault.file_manager import get_section_content
+    section = get_section_content(path, start_line)
+    if section is None:
+        console.print("[bold red][!][/bold red] Section not found.")
+        return
 
-    section_title = lines[start_line - 1].strip()
-    content_lines = []
-    for line in lines[start_line:]:
-        if line.strip().startswith("## "):
-            break
-        content_lines.append(line.strip())
+    section_title, content_lines = section
 
-    console.print(f"\n[bold blue]{section_title}[/bold blue]")
+    console.print(f"\n[bold blue]{escape(section_title)}[/bold blue]")
     console.print(Rule())
-    for line in content_lines:
-        console.print(f"  {line}")
+    pager = Pager(total=len(content_lines))
+    pager.extend(content_lines, lambda line: f"  {escape(line)}")
+    pager.close()
     console.print(Rule())
 
+@instrumented
 def handle_export():
     if not current_library:
         console.print("[bold red][!][/bold red] No library loaded. Use 'Load' or 'Create' first.")
@@ -315,10 +438,63 @@ def handle_export():
     output_path = os.path.join("exports", output)
     os.makedirs("exports", exist_ok=True)
 
-    from studyvault.file_manager import export_to_pdf
-    export_to_pdf(current_library, output_path)
+    if output.lower().endswith((".html", ".htm")):
+        from studyvault.file_manager import export_to_html
+        export_to_html(current_library, output_path)
+    else:
+        from studyvault.file_manager import export_to_pdf
+        export_to_pdf(current_library, output_path)
+
+@instrumented
+def handle_history():
+    from studyvault import history
+    entries, undo, redo = history.entries(current_library)
+    if not entries:
+        console.print("[bold red][!][/bold red] No edits recorded yet.")
+        return
+
+    def row(entry):
+        marker = ("  [dim](next undo)[/dim]" if undo and entry.number == undo.number else
+                  "  [dim](next redo)[/dim]" if redo and entry.number == redo.number else "")
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.time))
+        return f"[cyan]{entry.number}.[/cyan] {when}  [bold]{entry.action}[/bold] {escape(entry.label)}{marker}"
 
-def main():
+    pager = Pager(total=len(entries))
+    pager.extend(entries, row)
+    pager.close()
+
+    console.print("[bold cyan]Export the library as it was at a time[/bold cyan] (e.g. 2025-07-12 14:30, Enter to skip):")
+    answer = input("> ").strip()
+    if not answer:
+        return
+    try:
+        when = history.parse_time(answer)
+    except ValueError as e:
+        console.print(f"[bold red][!][/bold red] {e}")
+        return
+
+    base_name = os.path.splitext(os.path.basename(current_library))[0]
+    os.makedirs("exports", exist_ok=True)
+    output_path = os.path.join("exports", f"{base_name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(when))}.md")
+    from studyvault.file_manager import export_version
+    export_version(current_library, when, output_path)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv:
+        from studyvault.commands import main as run_command
+        return run_command(argv)
+
+    instrument.enable_from_environment()
+    profile_path = os.environ.get(instrument.PROFILE_ENV)
+    if profile_path:
+        return instrument.run_profiled(profile_path, run_menu)
+    return run_menu()
+
+
+def run_menu():
+    enable_line_editing()
     clear_screen()
     ensure_data_directory()
     while True:
@@ -330,6 +506,9 @@ def main():
             enter_library_loop()
         elif command == "list":
             handle_list_and_load()
+        elif command == "search":
+            handle_search_everywhere()
+            input("\nPress Enter to return to the menu...")
 #        elif command == "export":
 #            handle_export()
         elif command == "exit":
@@ -338,6 +517,6 @@ def main():
             break
 
         else:
-            console.print("[bold red][!][/bold red] Unknown command. Please choose: [green]Create[/green], [blue]List[/blue], or [red]Exit[/red].")
+            console.print("[bold red][!][/bold red] Unknown command. Please choose: [green]Create[/green], [blue]List[/blue], [magenta]Search[/magenta], or [red]Exit[/red].")
 
 
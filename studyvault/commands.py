@@ -0,0 +1,735 @@
+# studyvault/commands.py
+#
+# Non-interactive entry points: one subcommand per library operation, plus a
+# `batch` mode that reads JSON-lines operations from stdin and runs them all in
+# this process, so the cached Library and search index stay warm between them.
+#
+#   studyvault store physics --title "Momentum" --content "p = mv"
+#   studyvault search physics momentum --json
+#   cat ops.jsonl | studyvault batch
+
+import argparse
+import json
+import os
+import sys
+import time
+from studyvault import file_manager, instrument, storage
+from studyvault.catalog import SORT_KEYS, format_size, format_time
+from studyvault.console import console, highlight, escape
+from studyvault.pager import Pager
+from studyvault.search import MODES, compile_query
+
+OPERATIONS = ("create", "store", "update", "delete", "append", "search", "index", "export", "export-all", "import",
+              "compact", "replace", "delete-many", "shard", "unshard",
+              "convert", "list", "history", "undo", "redo", "transaction")
+# Edits a transaction can queue (studyvault.transaction).
+TRANSACTION_EDITS = ("update", "delete", "append")
+MATCH_HELP = ("literal text (default), a regular expression, or lines with all/any of the words; "
+              "always case-insensitive")
+
+
+# Expected type of each operation field; anything else fails that operation alone.
+TEXT_FIELDS = ("op", "library", "title", "content", "old", "new", "keyword", "match", "mode", "section",
+               "position", "direction", "source", "output", "output_dir", "format", "scope", "sort", "at",
+               "to", "storage", "resolve")
+COUNT_FIELDS = ("line", "top", "workers", "segment_kb")
+FLAG_FIELDS = ("dedupe", "reverse")
+LIST_FIELDS = ("libraries", "keywords")
+
+
+class OperationError(Exception):
+    """An operation that could not be run as given (bad field, missing library)."""
+
+
+def resolve_library(name):
+    """Map a library name ('physics' or 'physics.md') or a path to the library's file path."""
+    if os.sep in name or (os.altsep and os.altsep in name):
+        return name
+    if not name.endswith('.md'):
+        name += '.md'
+    return file_manager.get_library_path(name)
+
+
+def _field(operation, key, default=None, required=True):
+    if key in operation and operation[key] is not None:
+        return _checked(key, operation[key])
+    if required:
+        raise OperationError(f"Missing field '{key}'.")
+    return default
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _checked(key, value):
+    """Return value if it has the type field `key` takes, else raise OperationError."""
+    if key in TEXT_FIELDS and not isinstance(value, str):
+        raise OperationError(f"Field '{key}' must be a string.")
+    if key in COUNT_FIELDS and not _is_int(value):
+        raise OperationError(f"Field '{key}' must be an integer.")
+    if key in FLAG_FIELDS and not isinstance(value, bool):
+        raise OperationError(f"Field '{key}' must be true or false.")
+    if key in LIST_FIELDS and not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+        raise OperationError(f"Field '{key}' must be a list of strings.")
+    if key == "lines" and not (isinstance(value, list) and all(_is_int(item) for item in value)):
+        raise OperationError("Field 'lines' must be a list of line numbers.")
+    if key == "edits" and not (isinstance(value, list) and all(isinstance(edit, dict) for edit in value)):
+        raise OperationError("Field 'edits' must be a list of edit objects.")
+    if key == "replacements" and not (
+            isinstance(value, dict) and all(isinstance(new, str) for new in value.values())):
+        raise OperationError("Field 'replacements' must map old text to new text.")
+    return value
+
+
+def _match_mode(operation, keyword):
+    """Return the query mode ('literal', 'regex', 'all' or 'any'), rejecting bad patterns up front."""
+    mode = _field(operation, "match", "literal", required=False)
+    try:
+        compile_query(keyword, mode)
+    except ValueError as e:
+        raise OperationError(str(e))
+    return mode
+
+
+def _existing_library(operation):
+    path = resolve_library(_field(operation, "library"))
+    if not os.path.exists(path):
+        raise OperationError(f"Library not found: {path}")
+    return path
+
+
+@instrument.instrumented
+def run_operation(operation):
+    """
+    Run one operation given as a dict, e.g. {"op": "update", "library": "physics",
+    "old": "colour", "new": "color"}, and return a JSON-ready result dict with an
+    "ok" key. File-manager messages go to its console; nothing here prompts.
+    """
+    try:
+        op = _field(operation, "op")
+        if op not in OPERATIONS:
+            raise OperationError(f"Unknown operation '{op}'.")
+
+        if op == "create":
+            name = _field(operation, "library")
+            path = resolve_library(name)
+            if os.path.exists(path):
+                raise OperationError("A library with this name already exists.")
+            kind = _storage_kind(operation, "storage", storage.MARKDOWN)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"# {os.path.splitext(os.path.basename(path))[0]} Library\n")
+            if kind != storage.MARKDOWN:
+                from studyvault import edits
+                edits.convert(path, kind)
+            return {"ok": True, "path": path}
+
+        if op == "export-all":
+            return _export_all(operation)
+        if op == "list":
+            return _list_libraries(operation)
+
+        path = _existing_library(operation)
+
+        if op == "store":
+            ok = file_manager.append_to_file(path, _field(operation, "title"), _field(operation, "content", ""))
+        elif op == "update":
+            ok = file_manager.update_text_in_file(path, _field(operation, "old"), _field(operation, "new"))
+        elif op == "delete":
+            keyword = _field(operation, "keyword")
+            match = _match_mode(operation, keyword)
+            lines = _field(operation, "lines", required=False)
+            if lines is None:
+                lines = [line_number for line_number, _ in file_manager.find_lines_containing(path, keyword, match)]
+                if not lines:
+                    raise OperationError("No matches found.")
+            ok = file_manager.delete_keyword_from_lines(path, keyword, lines, match)
+        elif op == "append":
+            position = _field(operation, "position", "end", required=False)
+            ok = file_manager.append_to_section(
+                path, _field(operation, "section"), position,
+                _field(operation, "line", required=position == "line"),
+                _field(operation, "content"),
+                direction=_field(operation, "direction", "after", required=False),
+                confirm=False,
+            )
+        elif op == "search":
+            keyword = _field(operation, "keyword")
+            top = _field(operation, "top", required=False)
+            if top is not None:
+                if not isinstance(top, int) or top < 1:
+                    raise OperationError("Field 'top' must be a positive integer.")
+                ranked = file_manager.rank_sections(path, keyword, top)
+                return {"ok": True, "ranked": [match._asdict() for match in ranked]}
+            match = _match_mode(operation, keyword)
+            if _field(operation, "mode", "sections", required=False) == "lines":
+                lines = file_manager.search_in_file(path, keyword, match)
+                return {"ok": True, "lines": [[number, text] for number, text in lines]}
+            sections = file_manager.search_sections(path, keyword, match)
+            return {"ok": True, "sections": [{"title": title, "lines": lines} for title, lines in sections]}
+        elif op == "import":
+            from studyvault.importer import import_notes
+            source = _field(operation, "source")
+            if not os.path.isdir(source):
+                raise OperationError(f"Not a directory: {source}")
+            stats = import_notes(path, source, workers=_field(operation, "workers", required=False),
+                                 dedupe=_field(operation, "dedupe", True, required=False))
+            return dict(stats, ok=True)
+        elif op in ("replace", "delete-many"):
+            return _rewrite(path, op, operation)
+        elif op == "transaction":
+            return _transaction(path, operation)
+        elif op in ("undo", "redo"):
+            ok = (file_manager.undo_last_edit if op == "undo" else file_manager.redo_last_edit)(path)
+        elif op == "history":
+            return _history(path, operation)
+        elif op == "compact":
+            return _compact(path, operation)
+        elif op in ("shard", "unshard", "convert"):
+            return _convert_storage(path, op, operation)
+        elif op == "index":
+            sections = file_manager.list_sections(path)
+            return {"ok": True, "sections": [[line_number, title] for line_number, title in sections]}
+        else:
+            base_name = os.path.splitext(os.path.basename(path))[0]
+            export_format = _field(operation, "format", "pdf", required=False)
+            extensions = {"pdf": "pdf", "html": "html", "markdown": "md"}
+            if export_format not in extensions:
+                raise OperationError("Field 'format' must be 'pdf', 'html' or 'markdown'.")
+            extension = extensions[export_format]
+            output = _field(operation, "output", os.path.join("exports", f"{base_name}.{extension}"), required=False)
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            if export_format == "pdf":
+                ok = file_manager.export_to_pdf(path, output)
+            elif export_format == "html":
+                ok = file_manager.export_to_html(path, output)
+            else:
+                ok = file_manager.export_to_markdown(path, output)
+            return {"ok": bool(ok), "output": output}
+
+        return {"ok": bool(ok)}
+    except (OperationError, OSError, UnicodeDecodeError) as e:
+        return {"ok": False, "error": str(e)}
+    except Exception as e:
+        # A bug or an input nothing above anticipated fails this operation, not the batch.
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def _storage_kind(operation, key, default=None):
+    kind = _field(operation, key, default, required=default is None)
+    if kind not in storage.KINDS:
+        raise OperationError(f"Field '{key}' must be one of: {', '.join(storage.KINDS)}.")
+    return kind
+
+
+def _convert_storage(path, op, operation):
+    """Move a library to another storage backend; shard and unshard are shorthands."""
+    from studyvault import edits, shards
+    target = {"shard": storage.SHARDED, "unshard": storage.MARKDOWN}.get(op) or _storage_kind(operation, "to")
+    options = {}
+    if target == storage.SHARDED:
+        segment_kb = _field(operation, "segment_kb", shards.SEGMENT_BYTES // 1024, required=False)
+        if not isinstance(segment_kb, int) or segment_kb <= 0:
+            raise OperationError("Field 'segment_kb' must be a positive integer.")
+        options["segment_bytes"] = segment_kb * 1024
+    if not edits.convert(path, target, **options):
+        raise OperationError(f"Library is already stored as {target}: {path}")
+    result = {"ok": True, "storage": target}
+    if target == storage.SHARDED:
+        result["segments"] = len(shards.segments(path))
+    return result
+
+
+def _history(path, operation):
+    """List a library's edit history, or with "at" write the library as it was then."""
+    from studyvault import history
+    at = _field(operation, "at", required=False)
+    if at is None:
+        entries, undo, redo = history.entries(path)
+        return {"ok": True, "entries": [dict(entry._asdict()) for entry in entries],
+                "undo": undo and undo.number, "redo": redo and redo.number}
+
+    try:
+        when = history.parse_time(at)
+    except ValueError as e:
+        raise OperationError(str(e))
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(when))
+    output = _field(operation, "output", os.path.join("exports", f"{base_name}-{stamp}.md"), required=False)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    return {"ok": file_manager.export_version(path, when, output), "output": output}
+
+
+def _transaction(path, operation):
+    """
+    Apply a list of update, delete and append edits to one library in one pass and
+    one commit. Line numbers refer to the library before the transaction, so the
+    edits do not shift each other. Returns which edits took effect.
+    """
+    from studyvault.transaction import Transaction
+    tx = Transaction(path)
+    for number, edit in enumerate(_field(operation, "edits"), 1):
+        try:
+            op = _field(edit, "op")
+            if op not in TRANSACTION_EDITS:
+                raise OperationError(f"A transaction takes {', '.join(TRANSACTION_EDITS)} edits, not '{op}'.")
+            if op == "update":
+                tx.update(_field(edit, "old"), _field(edit, "new"))
+            elif op == "delete":
+                keyword = _field(edit, "keyword")
+                match = _match_mode(edit, keyword)
+                lines = _field(edit, "lines", required=False)
+                if lines is None:
+                    lines = [line_number for line_number, _ in file_manager.find_lines_containing(path, keyword, match)]
+                tx.delete(keyword, lines, match)
+            else:
+                position = _field(edit, "position", "end", required=False)
+                if position not in ("start", "end", "line"):
+                    raise OperationError("Field 'position' must be 'start', 'end' or 'line'.")
+                tx.append(_field(edit, "section"), position, _field(edit, "content"),
+                          reference=_field(edit, "line", required=position == "line"),
+                          direction=_field(edit, "direction", "after", required=False))
+        except (OperationError, ValueError) as e:
+            raise OperationError(f"Edit {number}: {e}")
+    applied = tx.commit()
+    return {"ok": all(applied), "applied": applied}
+
+
+def _compact(path, operation):
+    """
+    Fold pending journal edits into the library; "resolve" settles a library that
+    changed outside StudyVault while edits were pending (journal.JournalConflict).
+    """
+    from studyvault import edits, journal
+    resolve = _field(operation, "resolve", required=False)
+    if resolve is None:
+        return {"ok": True, "compacted": edits.compact(path)}
+    if resolve == "discard":
+        if not os.path.exists(journal.journal_path(path)):
+            return {"ok": True, "compacted": False}
+        journal.discard(path)
+        return {"ok": True, "compacted": False, "discarded": journal.journal_path(path) + ".stale"}
+    if resolve != "reapply":
+        raise OperationError("Field 'resolve' must be 'reapply' or 'discard'.")
+    applied = edits.reapply(path)
+    if applied is None:
+        raise OperationError("The pending edits no longer fit the file: the text they changed was edited too. "
+                             "Nothing was changed; use --discard to keep the file as it is.")
+    return {"ok": True, "compacted": bool(applied), "reapplied": applied}
+
+
+def _rewrite(path, op, operation):
+    """Run a many-string replace or delete in one pass and return its counts."""
+    from studyvault import multipattern
+    scope = _field(operation, "scope", "all", required=False)
+    section = _field(operation, "section", required=False)
+    lines = _field(operation, "lines", required=False)
+    try:
+        if op == "replace":
+            replacements = _field(operation, "replacements")
+            stats = multipattern.replace_many(path, replacements, scope, section, lines)
+        else:
+            keywords = _field(operation, "keywords")
+            stats = multipattern.delete_many(path, keywords, scope, section, lines)
+    except ValueError as e:
+        raise OperationError(str(e))
+    if not stats["replacements"]:
+        raise OperationError("None of the given strings were found.")
+    return dict(stats, ok=True)
+
+
+def _read_replacements(path):
+    """Read replacements from a JSON object file, or from 'old<TAB>new' lines."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.json'):
+                replacements = json.load(f)
+                if not isinstance(replacements, dict):
+                    raise OperationError(f"{path} must hold a JSON object mapping old text to new text.")
+                return replacements
+            replacements = {}
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line:
+                    continue
+                old, tab, new = line.partition("\t")
+                if not tab:
+                    raise OperationError(f"Expected 'old<TAB>new' in {path}: {line}")
+                replacements[old] = new
+            return replacements
+    except (OSError, ValueError) as e:
+        raise OperationError(f"Cannot read {path}: {e}")
+
+
+def _read_keywords(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [line.rstrip("\r\n") for line in f if line.strip()]
+    except (OSError, ValueError) as e:
+        raise OperationError(f"Cannot read {path}: {e}")
+
+
+def _line_numbers(text):
+    try:
+        return [int(number.strip()) for number in text.split(',')]
+    except ValueError:
+        raise OperationError("Invalid line numbers.")
+
+
+def _list_libraries(operation):
+    """List the libraries in data_libraries with their catalog stats."""
+    try:
+        libraries = file_manager.list_libraries(_field(operation, "sort", "name", required=False),
+                                                bool(_field(operation, "reverse", False, required=False)),
+                                                _field(operation, "match", required=False))
+    except ValueError as e:
+        raise OperationError(str(e))
+    return {"ok": True, "libraries": [dict(info._asdict()) for info in libraries]}
+
+
+def _export_all(operation):
+    """Export the given libraries (default: every library) to PDF on a process pool."""
+    from studyvault.pdf_export import export_many
+
+    names = _field(operation, "libraries", required=False) or file_manager.list_markdown_files()
+    output_dir = _field(operation, "output_dir", "exports", required=False)
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for name in names:
+        path = resolve_library(name)
+        if not os.path.exists(path):
+            raise OperationError(f"Library not found: {path}")
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        jobs.append((path, os.path.join(output_dir, f"{base_name}.pdf")))
+
+    outputs = dict(jobs)
+    exported, failed = [], {}
+    for path, error in export_many(jobs, _field(operation, "workers", required=False)):
+        if error is None:
+            exported.append(outputs[path])
+        else:
+            failed[path] = error
+    return {"ok": not failed, "exported": exported, "failed": failed}
+
+
+def run_batch(stream, out):
+    """
+    Run one JSON operation per input line, writing one JSON result per line. An
+    "id" field is echoed back. Returns the number of operations that failed.
+    """
+    failures = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            operation = json.loads(line)
+            if not isinstance(operation, dict):
+                raise ValueError("each line must be a JSON object")
+        except ValueError as e:
+            result, operation = {"ok": False, "error": f"Invalid JSON: {e}"}, {}
+        else:
+            result = run_operation(operation)
+        if "id" in operation:
+            result["id"] = operation["id"]
+        if not result["ok"]:
+            failures += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+    # Leave the .md files complete for other programs as soon as the batch is done.
+    from studyvault.edits import compact_all
+    compact_all()
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="studyvault",
+        description="Run StudyVault operations without the interactive menu. "
+                    "Run with no arguments for the interactive CLI.",
+    )
+    parser.add_argument("--trace", metavar="FILE",
+                        help="append a JSON line per instrumented call to FILE ('-' for stderr)")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile and dump pstats to FILE")
+    sub = parser.add_subparsers(dest="op", metavar="command")
+    sub.required = True
+
+    def add(name, help_text):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("library", help="library name in data_libraries/, or a path to a .md file")
+        return command
+
+    command = add("create", "create a new library")
+    command.add_argument("--storage", choices=storage.KINDS, default="markdown",
+                         help="how the library is kept on disk (default: markdown)")
+
+    command = add("store", "add a new section")
+    command.add_argument("--title", required=True)
+    command.add_argument("--content", help="section body (read from stdin when omitted)")
+
+    command = add("update", "replace the first occurrence of some text")
+    command.add_argument("old")
+    command.add_argument("new")
+
+    command = add("delete", "delete a keyword from lines")
+    command.add_argument("keyword")
+    command.add_argument("--lines", help="comma-separated line numbers (default: every line containing the keyword)")
+    command.add_argument("--match", choices=MODES, default="literal", help=MATCH_HELP)
+
+    command = add("append", "insert content into a section")
+    command.add_argument("section", help="section title without '## '")
+    command.add_argument("--position", choices=["start", "end", "line"], default="end")
+    command.add_argument("--line", type=int, help="line inside the section, for --position line")
+    command.add_argument("--direction", choices=["before", "after"], default="after")
+    command.add_argument("--content", help="text to insert (read from stdin when omitted)")
+
+    command = add("search", "search one library")
+    command.add_argument("keyword")
+    command.add_argument("--lines", action="store_true", help="list matching lines instead of sections")
+    command.add_argument("--match", choices=MODES, default="literal", help=MATCH_HELP)
+    command.add_argument("--top", type=int, metavar="K",
+                         help="rank sections by relevance (BM25) and show the best K with snippets")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    command = add("index", "list the sections of a library")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    command = add("import", "import a directory tree of .md/.txt notes, one section per note")
+    command.add_argument("source", help="directory to import from")
+    command.add_argument("--workers", type=int, help="reader threads (default: Python's thread pool default)")
+    command.add_argument("--keep-duplicates", action="store_true",
+                         help="import notes even if the same content is already stored")
+
+    command = add("replace", "replace many strings in one pass (case-sensitive)")
+    command.add_argument("pairs", nargs="*", metavar="TEXT", help="old and new text, alternating")
+    command.add_argument("--map", metavar="FILE",
+                         help="replacements file: a .json object, or one 'old<TAB>new' per line")
+    _add_scope_arguments(command)
+
+    command = add("delete-many", "delete many keywords in one pass (case-insensitive, like delete)")
+    command.add_argument("keywords", nargs="*")
+    command.add_argument("--from", dest="keywords_file", metavar="FILE", help="file with one keyword per line")
+    _add_scope_arguments(command)
+
+    command = add("history", "list a library's recorded edits, or export it as it was at some time")
+    command.add_argument("--at", metavar="TIME", help="local time like '2025-07-12 14:30': export the library as it was then")
+    command.add_argument("--output", help="output path for --at (default: exports/<library>-<time>.md)")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    add("undo", "revert the most recent edit that is not undone yet")
+    add("redo", "re-apply the most recently undone edit")
+
+    command = add("compact", "fold pending journal edits into the library file (before editing it by hand)")
+    resolve = command.add_mutually_exclusive_group()
+    resolve.add_argument("--reapply", dest="resolve", action="store_const", const="reapply",
+                         help="the file was edited elsewhere meanwhile: apply the pending edits to it as it is now")
+    resolve.add_argument("--discard", dest="resolve", action="store_const", const="discard",
+                         help="the file was edited elsewhere meanwhile: keep it as it is and set the edits aside")
+
+    command = add("shard", "store a large library as a directory of segment files, so edits rewrite only one segment")
+    command.add_argument("--segment-kb", type=int, default=1024, help="target segment size in KiB (default: 1024)")
+
+    add("unshard", "store a sharded library as one .md file again")
+
+    command = add("convert", "move a library to another storage backend, keeping its content")
+    command.add_argument("--to", required=True, choices=storage.KINDS)
+    command.add_argument("--segment-kb", type=int, default=1024, help="segment size in KiB for --to sharded")
+
+    command = add("export", "export a library to PDF, to an HTML page, or to one Markdown file")
+    command.add_argument("--output", help="output path (default: exports/<library>.pdf, .html or .md)")
+    formats = command.add_mutually_exclusive_group()
+    formats.add_argument("--html", action="store_true", help="write the rendered notes as one HTML page")
+    formats.add_argument("--markdown", action="store_true",
+                         help="write the library as a single .md file (e.g. from a sharded library)")
+
+    command = sub.add_parser("export-all", help="export several libraries to PDF in parallel")
+    command.add_argument("libraries", nargs="*", help="library names or paths (default: every library)")
+    command.add_argument("--output-dir", default="exports")
+    command.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+
+    command = sub.add_parser("list", help="list the libraries in data_libraries with their size and section count")
+    command.add_argument("--sort", choices=SORT_KEYS, default="name")
+    command.add_argument("--reverse", action="store_true", help="largest, newest or longest first")
+    command.add_argument("--filter", dest="match", help="only names containing this text, or matching a glob pattern")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    sub.add_parser("batch", help="read JSON-lines operations from stdin and print one JSON result per line")
+
+    command = sub.add_parser("serve", help="serve JSON operations over HTTP from one warm process")
+    command.add_argument("--host", default="127.0.0.1")
+    command.add_argument("--port", type=int, default=8765, help="TCP port (default: 8765; 0 picks a free one)")
+    command.add_argument("--socket", metavar="PATH", help="listen on a Unix socket instead of a TCP port")
+    command.add_argument("--workers", type=int, help="threads running operations (default: Python's pool default)")
+    return parser
+
+
+def _add_scope_arguments(command):
+    command.add_argument("--scope", choices=["all", "first"], default="all",
+                         help="rewrite every occurrence (default) or only the first of each string")
+    command.add_argument("--section", help="only inside this section (title without '## ')")
+    command.add_argument("--lines", help="only on these comma-separated line numbers")
+
+
+def _operation_from_args(args):
+    if args.op == "list":
+        return {"op": args.op, "sort": args.sort, "reverse": args.reverse, "match": args.match}
+    if args.op == "export-all":
+        return {"op": args.op, "libraries": args.libraries, "output_dir": args.output_dir, "workers": args.workers}
+
+    operation = {"op": args.op, "library": args.library}
+    if args.op == "store":
+        operation.update(title=args.title, content=args.content if args.content is not None else sys.stdin.read().rstrip("\n"))
+    elif args.op == "update":
+        operation.update(old=args.old, new=args.new)
+    elif args.op == "delete":
+        operation.update(keyword=args.keyword, match=args.match)
+        if args.lines:
+            operation["lines"] = _line_numbers(args.lines)
+    elif args.op == "append":
+        operation.update(section=args.section, position=args.position, line=args.line, direction=args.direction,
+                         content=args.content if args.content is not None else sys.stdin.read().rstrip("\n"))
+    elif args.op == "search":
+        operation.update(keyword=args.keyword, mode="lines" if args.lines else "sections", match=args.match,
+                         top=args.top)
+    elif args.op in ("replace", "delete-many"):
+        operation.update(scope=args.scope, section=args.section,
+                         lines=_line_numbers(args.lines) if args.lines else None)
+        if args.op == "replace":
+            if len(args.pairs) % 2:
+                raise OperationError("Give replacements as OLD NEW pairs.")
+            replacements = _read_replacements(args.map) if args.map else {}
+            replacements.update(zip(args.pairs[::2], args.pairs[1::2]))
+            operation["replacements"] = replacements
+        else:
+            operation["keywords"] = (_read_keywords(args.keywords_file) if args.keywords_file else []) + args.keywords
+    elif args.op == "import":
+        operation.update(source=args.source, workers=args.workers, dedupe=not args.keep_duplicates)
+    elif args.op == "export":
+        operation.update(output=args.output, format="markdown" if args.markdown else "html" if args.html else "pdf")
+    elif args.op == "shard":
+        operation["segment_kb"] = args.segment_kb
+    elif args.op == "convert":
+        operation.update(to=args.to, segment_kb=args.segment_kb)
+    elif args.op == "create":
+        operation["storage"] = args.storage
+    elif args.op == "history":
+        operation.update(at=args.at, output=args.output)
+    elif args.op == "compact":
+        operation["resolve"] = args.resolve
+    return operation
+
+
+def _print_result(args, result):
+    if getattr(args, "json", False):
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    for path, error in result.get("failed", {}).items():
+        console.print(f"[bold red][!][/bold red] PDF export failed for {path}: {error}")
+    if not result["ok"]:
+        if "error" in result:
+            console.print(f"[bold red][!][/bold red] {result['error']}")
+        return
+
+    if args.op == "search" and not result.get("lines", result.get("sections", result.get("ranked"))):
+        console.print("[bold red][!][/bold red] No matches found.")
+    elif args.op == "search" and "ranked" in result:
+        for i, match in enumerate(result["ranked"], 1):
+            console.print(f"[cyan]{i}.[/cyan] [bold blue]{match['title']}[/bold blue]  "
+                          f"[dim](line {match['line']}, score {match['score']:.2f})[/dim]")
+            console.print(f"   {highlight(match['snippet'], match['highlights'])}")
+    elif args.op == "search" and "lines" in result:
+        pager = Pager(interactive=False, cap=None)
+        pager.extend(result["lines"], lambda hit: f"[dim]{hit[0]}[/dim]: {escape(hit[1])}")
+        pager.close()
+    elif args.op == "search":
+        pager = Pager(interactive=False, cap=None)
+        rule = "[dim]" + "─" * console.width + "[/dim]"
+        for section in result["sections"]:
+            pager.add(f"[bold blue]{escape(section['title'])}[/bold blue]")
+            pager.extend(section["lines"], lambda line: f" {escape(line)}")
+            pager.add(rule)
+        pager.close()
+    elif args.op == "index":
+        pager = Pager(interactive=False, cap=None)
+        pager.extend(enumerate(result["sections"], 1), lambda entry: f"[cyan]{entry[0]}.[/cyan] "
+                     f"[bold]{escape(entry[1][1])}[/bold]  [dim](line {entry[1][0]})[/dim]")
+        pager.close()
+    elif args.op == "import":
+        from studyvault.importer import import_summary
+        console.print(f"[bold green][+][/bold green] {import_summary(result)}")
+    elif args.op == "export-all":
+        for output in result["exported"]:
+            console.print(f"[bold green][+][/bold green] Exported to PDF: [bold]{output}[/bold]")
+    elif args.op in ("replace", "delete-many"):
+        from studyvault.multipattern import rewrite_summary
+        verb = "Replaced" if args.op == "replace" else "Deleted"
+        console.print(f"[bold green][+][/bold green] {rewrite_summary(result, verb)}")
+    elif args.op == "history" and "entries" in result:
+        if not result["entries"]:
+            console.print("[bold red][!][/bold red] No edits recorded yet.")
+        for entry in result["entries"]:
+            marker = ("  [dim](next undo)[/dim]" if entry["number"] == result["undo"] else
+                      "  [dim](next redo)[/dim]" if entry["number"] == result["redo"] else "")
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"]))
+            console.print(f"[cyan]{entry['number']}.[/cyan] {when}  "
+                          f"[bold]{entry['action']}[/bold] {escape(entry['label'])}  "
+                          f"[dim]{format_size(entry['bytes'])}[/dim]{marker}")
+    elif args.op == "compact" and "discarded" in result:
+        console.print(f"[bold green][+][/bold green] Kept [bold]{args.library}[/bold] as it is; "
+                      f"the pending edits were moved to {result['discarded']}")
+    elif args.op == "compact" and "reapplied" in result:
+        console.print(f"[bold green][+][/bold green] Reapplied {result['reapplied']} edit(s) to "
+                      f"[bold]{args.library}[/bold]")
+    elif args.op == "compact":
+        message = "Journal folded into" if result["compacted"] else "No pending edits in"
+        console.print(f"[bold green][+][/bold green] {message} [bold]{args.library}[/bold]")
+    elif args.op == "shard":
+        console.print(f"[bold green][+][/bold green] Sharded [bold]{args.library}[/bold] "
+                      f"into {result['segments']} segment(s)")
+    elif args.op == "unshard":
+        console.print(f"[bold green][+][/bold green] Stored [bold]{args.library}[/bold] as one file")
+    elif args.op == "convert":
+        console.print(f"[bold green][+][/bold green] Stored [bold]{args.library}[/bold] as {result['storage']}")
+    elif args.op == "list":
+        if not result["libraries"]:
+            console.print("[bold red][!][/bold red] No libraries found.")
+        for info in result["libraries"]:
+            sections = "?" if info["sections"] is None else info["sections"]
+            console.print(f"{info['name']}  [dim]{sections} sections, {format_size(info['size'])}, "
+                          f"modified {format_time(info['modified'])}, last edited: {info['edited'] or '-'}[/dim]")
+    elif args.op == "create":
+        console.print(f"[bold green][+][/bold green] Created library: [bold]{result['path']}[/bold]")
+
+
+def main(argv):
+    """Run one subcommand (or a batch) and return the process exit status."""
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        instrument.enable(args.trace)
+    else:
+        instrument.enable_from_environment()
+    profile_path = args.profile or os.environ.get(instrument.PROFILE_ENV)
+    if profile_path:
+        return instrument.run_profiled(profile_path, _run, args)
+    return _run(args)
+
+
+def _run(args):
+    if args.op == "serve":
+        from studyvault.server import serve
+        return serve(args.host, args.port, args.socket, args.workers)
+    if args.op == "batch":
+        # Keep stdout for JSON results; human-readable messages go to stderr.
+        file_manager.console.file = sys.stderr
+        return 1 if run_batch(sys.stdin, sys.stdout) else 0
+
+    if getattr(args, "json", False):
+        file_manager.console.file = sys.stderr
+    try:
+        result = run_operation(_operation_from_args(args))
+    except OperationError as e:
+        result = {"ok": False, "error": str(e)}
+    _print_result(args, result)
+    return 0 if result["ok"] else 1
@@ -0,0 +1,60 @@
+# studyvault/console.py
+#
+# rich is the heaviest import on the CLI's path, so the shared console is created
+# on first use. Scripted runs that never print a message never load it.
+
+
+class _LazyConsole:
+    """Stand-in for a rich Console that builds the real one the first time it is used."""
+
+    def __init__(self):
+        object.__setattr__(self, "_console", None)
+        object.__setattr__(self, "_settings", {})
+
+    def _get(self):
+        if self._console is None:
+            from rich.console import Console
+            console = Console()
+            for name, value in self._settings.items():
+                setattr(console, name, value)
+            object.__setattr__(self, "_console", console)
+        return self._console
+
+    def __getattr__(self, name):
+        if self._console is None and name in self._settings:
+            return self._settings[name]
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        # Settings such as `quiet` or `file` are kept until the console exists.
+        if self._console is None:
+            self._settings[name] = value
+        else:
+            setattr(self._console, name, value)
+
+
+console = _LazyConsole()
+
+
+def Rule(*args, **kwargs):
+    """Build a rich Rule; rich.rule is only imported when a rule is drawn."""
+    from rich.rule import Rule as RichRule
+    return RichRule(*args, **kwargs)
+
+
+def escape(text):
+    """Escape text so rich prints it literally (square brackets are not read as markup)."""
+    from rich.markup import escape as rich_escape
+    return rich_escape(text)
+
+
+def highlight(text, spans, style="bold yellow"):
+    """Return rich markup for text with the (start, end) spans styled; the rest is escaped."""
+    pieces = []
+    position = 0
+    for start, end in spans:
+        pieces.append(escape(text[position:start]))
+        pieces.append(f"[{style}]{escape(text[start:end])}[/{style}]")
+        position = end
+    pieces.append(escape(text[position:]))
+    return "".join(pieces)
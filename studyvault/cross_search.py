@@ -0,0 +1,78 @@
+# studyvault/cross_search.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from studyvault.fileio import library_size
+from studyvault.catalog import list_libraries
+from studyvault.console import console, escape
+from studyvault.journal import JournalConflict
+from studyvault.search import compile_query, search_sections
+
+# Libraries larger than this are split into byte ranges so one huge file
+# still spreads over several workers.
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def _scan_range(path, start, end, keyword, mode="literal"):
+    """
+    Scan the sections whose header starts inside [start, end). Workers only read:
+    pending journal edits are scanned through the piece table, never folded in here.
+    """
+    return search_sections(path, compile_query(keyword, mode), start, end)
+
+
+def _plan_chunks(path):
+    """Split a library into byte ranges of roughly CHUNK_BYTES."""
+    size = library_size(path)
+    starts = range(0, size, CHUNK_BYTES) or [0]
+    return [(start, min(start + CHUNK_BYTES, size)) for start in starts]
+
+
+def search_everywhere(keyword, data_dir, max_hits=None, workers=None, mode="literal"):
+    """
+    Search every library in data_dir (as listed by its catalog) on a process pool.
+    Yields (library_name, [(section_title, [lines])]) as soon as each library is done,
+    and stops early once max_hits matching sections have been yielded.
+    """
+    compile_query(keyword, mode)  # report a bad regex before starting any workers
+    # Largest libraries first so the long jobs do not end up on the tail.
+    names = [info.name for info in list_libraries(data_dir, sort="size", reverse=True)]
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    futures = {}
+    pending = {}
+    finished = {}
+    try:
+        for name in names:
+            path = os.path.join(data_dir, name)
+            try:
+                chunks = _plan_chunks(path)
+            except JournalConflict as e:
+                console.print(f"[bold red][!][/bold red] Skipped {escape(name)}: {escape(str(e))}")
+                continue
+            pending[name] = len(chunks)
+            finished[name] = [None] * len(chunks)
+            for i, (start, end) in enumerate(chunks):
+                futures[pool.submit(_scan_range, path, start, end, keyword, mode)] = (name, i)
+
+        hits = 0
+        for future in as_completed(futures):
+            name, i = futures[future]
+            finished[name][i] = future.result()
+            pending[name] -= 1
+            if pending[name]:
+                continue
+
+            sections = [section for chunk in finished.pop(name) for section in chunk]
+            if not sections:
+                continue
+            if max_hits is not None:
+                sections = sections[:max_hits - hits]
+            hits += len(sections)
+            yield name, sections
+            if max_hits is not None and hits >= max_hits:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
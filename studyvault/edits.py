@@ -0,0 +1,138 @@
+# studyvault/edits.py
+
+import atexit
+import os
+from collections import namedtuple
+from studyvault.fileio import file_signature, remove_file
+from studyvault.instrument import count
+from studyvault import catalog, changes, history, journal, library, line_offsets, search_index, section_index, storage
+
+# A byte-level edit: replace the bytes `old` found at `offset` with the bytes `new`.
+# Offsets always refer to the file as it was before any splice of the same batch.
+Splice = namedtuple("Splice", ["offset", "old", "new"])
+
+_exit_hook = False
+
+
+def apply_splices(path, splices):
+    """
+    Write the splices (sorted by offset, non-overlapping) into the library. A new
+    library is written directly; edits to an existing one are appended to its
+    journal, which costs O(edit size) however large the library is. Other backends
+    rewrite only the segments or section rows the splices touch.
+    """
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.writelines(splice.new for splice in splices)
+            f.flush()
+            os.fsync(f.fileno())
+            count(bytes_written=f.tell())
+        return
+    backend = storage.backend(path)
+    if backend is not None:
+        backend.apply_splices(path, splices)
+        return
+    journal.append(path, splices)
+
+
+def compact(path):
+    """
+    Fold a library's journal into its .md file. The content does not change, so the
+    cached Library, both indexes and the line table are re-stamped instead of
+    rebuilt. Returns True if there were pending edits.
+    """
+    signatures = journal.compact(path)
+    if signatures is not None:
+        library.restamp(path, *signatures)
+        line_offsets.restamp(path, *signatures)
+        search_index.restamp(path, *signatures)
+        history.restamp(path, *signatures)
+    library.flush(path)
+    if signatures is not None:
+        changes.remember(path)
+    return signatures is not None
+
+
+def convert(path, target, **options):
+    """
+    Move a library to another storage backend (storage.KINDS) without changing its
+    content; options go to the target's from_markdown(). The cached Library stays
+    valid, and so does the search index unless the target is SQLite, which indexes
+    itself. Returns False if the library already uses that backend.
+    """
+    current = storage.kind(path)
+    if current == target:
+        return False
+    compact(path)
+    before = file_signature(path)
+    if current != storage.MARKDOWN:
+        storage.module(current).to_markdown(path)
+    if target != storage.MARKDOWN:
+        storage.module(target).from_markdown(path, **options)
+    after = file_signature(path)
+    library.restamp(path, before, after)
+    line_offsets.restamp(path, before, after)
+    if target == storage.SQLITE:
+        search_index.close_index(path)
+        remove_file(search_index.index_path(path))
+        remove_file(section_index.index_path(path))
+    else:
+        search_index.restamp(path, before, after)
+    history.restamp(path, before, after)
+    library.flush(path)
+    changes.remember(path)
+    return True
+
+
+def reapply(path):
+    """
+    Resolve a journal.JournalConflict: apply the pending edits to the library as it
+    is now, each as an undoable edit, and fold them in. The old journal is kept as
+    <library>.md.journal.stale. Returns the number of edits applied, or None, with
+    nothing changed, if one of them no longer fits (journal.fits).
+    """
+    batches = journal.recorded_batches(path)
+    if batches is None:
+        return 0
+    if not journal.fits(path, batches):
+        return None
+    journal.discard(path)
+    for splices in batches:
+        commit(path, [Splice(*splice) for splice in splices], label="reapplied edit")
+    compact(path)
+    return len(batches)
+
+
+def compact_all():
+    """Compact every journal this process wrote to and save deferred sidecars."""
+    for path in journal.pending_paths():
+        try:
+            compact(path)
+        except OSError:
+            # The journal stays valid and is replayed next time.
+            pass
+    library.flush_all()
+
+
+def commit(path, splices, label="edit"):
+    """
+    Apply splices to the library and bring its indexes up to date. Edits to an
+    existing library are logged in its history under `label` (None: not logged,
+    for undo and redo, which log themselves).
+    """
+    global _exit_hook
+    splices = sorted(splices, key=lambda s: s.offset)
+    before = file_signature(path) if os.path.exists(path) else None
+    apply_splices(path, splices)
+    if before is not None and label is not None:
+        history.record(path, splices, before, label)
+    library.apply_splices(path, splices, before)
+    line_offsets.invalidate(path)
+    search_index.apply_splices(path, splices, before)
+    if journal.needs_compaction(path):
+        compact(path)
+    catalog.note_edit(path, splices)
+    if not _exit_hook:
+        # Leave the .md file complete for other tools when the process ends.
+        atexit.register(compact_all)
+        _exit_hook = True
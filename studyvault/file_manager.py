@@ -1,15 +1,21 @@
 # studyvault/file_manager.py
 
 import os
-import markdown2
-from rich.console import Console
-from rich.rule import Rule
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from markdown2 import markdown
-import textwrap
-
-console = Console()
+from studyvault.console import console, escape
+from studyvault.instrument import instrumented
+from studyvault.section_index import read_section
+from studyvault.library import get_library
+from studyvault.parser import (
+    iter_lines,
+    split_lines,
+    find_bytes,
+)
+from studyvault.edits import Splice, commit
+from studyvault.fileio import library_size
+from studyvault.journal import open_library
+from studyvault.search import compile_query
+from studyvault import line_offsets, search, search_index
+
 # Constants
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_libraries')
 
@@ -21,101 +27,178 @@ def ensure_data_directory():
     else:
         console.print("[bold green][+][/bold green] Data library is ready.")
 
+@instrumented
 def list_markdown_files():
-    """List all .md files in the data_libraries directory."""
-    ensure_data_directory()
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith('.md')]
-    return files
+    """List the names of the libraries in the data_libraries directory, sorted by name."""
+    return [info.name for info in list_libraries()]
+
+@instrumented
+def list_libraries(sort="name", reverse=False, match=None):
+    """
+    Return a LibraryInfo (name, path, storage, size, modified, sections, edited) for
+    each library in data_libraries, from the cached catalog. Sort by name, size,
+    modified or sections; `match` filters names by substring or glob pattern.
+    """
+    from studyvault import catalog
+    return catalog.list_libraries(DATA_DIR, sort, reverse, match)
 
 def get_library_path(filename):
     """Returns the full path of a .md file in the data_libraries directory."""
     return os.path.join(DATA_DIR, filename)
 
+@instrumented
 def append_to_file(path, title, content):
     """Append a new section to the Markdown file."""
-    with open(path, 'a', encoding='utf-8') as f:
-        f.write(f"\n\n## {title}\n{content}\n")
+    offset = library_size(path) if os.path.exists(path) else 0
+    commit(path, [Splice(offset, b"", f"\n\n## {title}\n{content}\n".encode('utf-8'))], label=f"store '{title}'")
     console.print(f"[bold green][+][/bold green] Content appended to: [cyan]{os.path.basename(path)}[/cyan]")
+    return True
 
 
+@instrumented
 def update_text_in_file(path, old_text, new_text):
     """Replace the first occurrence of old_text with new_text in the file."""
     if not os.path.exists(path):
         console.print("[bold red][!][/bold red] File not found.")
-        return
-
-    with open(path, 'r', encoding='utf-8') as f:
-        content = f.read()
+        return False
 
-    if old_text not in content:
+    old_bytes = old_text.encode('utf-8')
+    position = find_bytes(path, old_bytes)
+    if position == -1:
         console.print("[bold red][!][/bold red] The specified text to update was not found.")
 
-        return
+        return False
 
-    updated_content = content.replace(old_text, new_text, 1)
-
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(updated_content)
+    commit(path, [Splice(position, old_bytes, new_text.encode('utf-8'))], label=f"update '{old_text}'")
 
     console.print("[bold green][+][/bold green] Content successfully updated.")
+    return True
 
 
-def find_lines_containing(path, keyword):
-    """Return a list of (line_number, line_content) where keyword is found."""
-    results = []
-    with open(path, 'r', encoding='utf-8') as f:
-        for idx, line in enumerate(f, 1):
-            if keyword in line:
-                results.append((idx, line.strip()))
-    return results
-
-def delete_keyword_from_lines(path, keyword, target_lines):
-    """Delete keyword only from the specified line numbers."""
+@instrumented
+def replace_many(path, replacements, scope="all", section=None, lines=None):
+    """
+    Replace many strings in a single pass and a single write. replacements maps old
+    text to new text (case-sensitive, like update_text_in_file()); scope is 'all' or
+    'first' (each string's first occurrence), optionally limited to one section
+    (title without '## ') or to the given line numbers.
+    """
     if not os.path.exists(path):
         console.print("[bold red][!][/bold red] File not found.")
-        return
+        return False
 
-    with open(path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    from studyvault import multipattern
+    try:
+        stats = multipattern.replace_many(path, replacements, scope, section, lines)
+    except ValueError as e:
+        console.print(f"[bold red][!][/bold red] {e}")
+        return False
+    return _report_rewrite(stats, "Replaced")
 
-    modified = False
-    for idx in target_lines:
-        if 1 <= idx <= len(lines):
-            if keyword in lines[idx - 1]:
-                lines[idx - 1] = lines[idx - 1].replace(keyword, "")
-                modified = True
 
-    if modified:
-        with open(path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-        console.print("[bold green][+][/bold green] Keyword deleted from selected lines.")
+@instrumented
+def delete_many(path, keywords, scope="all", section=None, lines=None):
+    """
+    Delete many keywords (case-insensitive, like Search) in a single pass and a single
+    write, with the same scope, section and lines options as replace_many().
+    """
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] File not found.")
+        return False
 
-    else:
-        console.print("[bold red][!][/bold red] Keyword was not found in the selected lines.")
+    from studyvault import multipattern
+    try:
+        stats = multipattern.delete_many(path, keywords, scope, section, lines)
+    except ValueError as e:
+        console.print(f"[bold red][!][/bold red] {e}")
+        return False
+    return _report_rewrite(stats, "Deleted")
 
 
-def append_to_section(path, section_title, position_type, reference, new_data):
-    with open(path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+def _report_rewrite(stats, verb):
+    from studyvault.multipattern import rewrite_summary
+    if not stats["replacements"]:
+        console.print("[bold red][!][/bold red] None of the given strings were found.")
+        return False
+    console.print(f"[bold green][+][/bold green] {rewrite_summary(stats, verb)}.")
+    return True
 
-    section_header = f"## {section_title}".strip()
-    section_start = None
-    section_end = len(lines)
 
-    for i, line in enumerate(lines):
-        if line.strip() == section_header:
-            section_start = i
-            break
+@instrumented
+def find_lines_containing(path, keyword, mode="literal"):
+    """
+    Return a list of (line_number, line_content) where keyword is found. Matches the
+    same lines as search_in_file(), so what Search shows is what Delete removes.
+    """
+    return search.search_lines(path, compile_query(keyword, mode))
 
-    if section_start is None:
-        console.print("[bold red][!][/bold red] Section not found.")
+def _read_target_lines(path, line_numbers):
+    """
+    Yield (line_number, offset, raw_bytes) for the given lines, in order: read
+    directly through the line table when the background warm-up has built it,
+    else by scanning the library up to the last of them.
+    """
+    table = line_offsets.current(path)
+    if table is not None:
+        yield from line_offsets.read_lines(path, table, line_numbers)
         return
-
-    for j in range(section_start + 1, len(lines)):
-        if lines[j].strip().startswith("## "):
-            section_end = j
+    wanted = set(line_numbers)
+    last_wanted = max(wanted, default=0)
+    for idx, offset, line in iter_lines(path):
+        if idx > last_wanted:
             break
+        if idx in wanted:
+            yield idx, offset, line
 
+@instrumented
+def delete_keyword_from_lines(path, keyword, target_lines, mode="literal"):
+    """Delete keyword (case-insensitive, like Search) only from the specified line numbers."""
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] File not found.")
+        return False
+
+    query = compile_query(keyword, mode)
+    splices = []
+    for _, offset, line in _read_target_lines(path, target_lines):
+        if query.matches(line):
+            replaced = query.remove(line)
+            if replaced != line:
+                splices.append(Splice(offset, line, replaced))
+
+    if splices:
+        commit(path, splices, label=f"delete '{keyword}' from {len(splices)} line(s)")
+        console.print("[bold green][+][/bold green] Keyword deleted from selected lines.")
+        return True
+
+    console.print("[bold red][!][/bold red] Keyword was not found in the selected lines.")
+    return False
+
+
+@instrumented
+def append_to_section(path, section_title, position_type, reference, new_data,
+                      direction=None, confirm=True):
+    """
+    Insert new_data at the start or end of a section, or before/after one of its lines.
+    Prompts for the direction and a confirmation unless `direction` is given and
+    `confirm` is False, which is how scripted callers use it.
+    """
+    section_header = f"## {section_title}".strip()
+    section = get_library(path).find_by_title(section_header)
+
+    if section is None:
+        console.print("[bold red][!][/bold red] Section not found.")
+        return False
+
+    # Only the target section (plus one line of context) is read from disk.
+    section_offset = section.offset
+    with open_library(path) as f:
+        f.seek(section_offset)
+        raw_lines = split_lines(f.read(section.length))
+        following = f.readline()
+    lines = [line.decode('utf-8') for line in raw_lines + ([following] if following else [])]
+
+    section_start = 0
+    section_end = len(raw_lines)
     section_lines = lines[section_start + 1:section_end]
     insert_at = None
 
@@ -127,14 +210,15 @@ def append_to_section(path, section_title, position_type, reference, new_data):
         if not isinstance(reference, int):
             console.print("[bold red][!][/bold red] Invalid line reference.")
 
-            return
+            return False
 
         if reference < 1 or reference > len(section_lines):
             console.print("[bold red][!][/bold red] Invalid line number inside section.")
 
-            return
+            return False
 
-        direction = input("Insert 'before' or 'after' that line? ").strip().lower()
+        if direction is None:
+            direction = input("Insert 'before' or 'after' that line? ").strip().lower()
         if direction == "before":
             insert_at = section_start + reference
         elif direction == "after":
@@ -142,50 +226,85 @@ def append_to_section(path, section_title, position_type, reference, new_data):
         else:
             console.print("[bold red][!][/bold red] Invalid direction. Use 'before' or 'after'.")
 
-            return
+            return False
     else:
         console.print("[bold red][!][/bold red] Invalid position type.")
 
-        return
-
-    # Simulate the change
-    simulated = lines.copy()
-    simulated.insert(insert_at, new_data + "\n")
-
-    console.print("\n[bold yellow]🔍 Preview of Section After Change:[/bold yellow]")
-    for idx in range(section_start, section_end + 2):  # show a few lines after for context
-        if idx < len(simulated):
-            line_display = simulated[idx].rstrip()
-            prefix = ">> " if idx == insert_at else "   "
-            print(f"{prefix}{line_display}")
-    console.print("-" * 40, style="dim")
-
-    confirm = input("Apply this change? (yes/no): ").strip().lower()
-    if confirm in ["y", "yes"]:
-        lines.insert(insert_at, new_data + "\n")
-        with open(path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        return False
+
+    if confirm:
+        # Simulate the change
+        simulated = lines.copy()
+        simulated.insert(insert_at, new_data + "\n")
+
+        console.print("\n[bold yellow]🔍 Preview of Section After Change:[/bold yellow]")
+        for idx in range(section_start, section_end + 2):  # show a few lines after for context
+            if idx < len(simulated):
+                line_display = simulated[idx].rstrip()
+                prefix = ">> " if idx == insert_at else "   "
+                print(f"{prefix}{line_display}")
+        console.print("-" * 40, style="dim")
+
+    answer = input("Apply this change? (yes/no): ").strip().lower() if confirm else "yes"
+    if answer in ["y", "yes"]:
+        offset = section_offset + sum(len(line) for line in raw_lines[:insert_at])
+        inserted = (new_data + "\n").encode('utf-8')
+        if insert_at == len(raw_lines) and not raw_lines[-1].endswith(b"\n"):
+            inserted = b"\n" + inserted
+        commit(path, [Splice(offset, b"", inserted)], label=f"append to '{section_title}'")
         console.print("[bold green][+][/bold green] Content appended successfully.")
+        return True
 
-    else:
-        console.print("[bold yellow][*][/bold yellow] Operation cancelled.")
+    console.print("[bold yellow][*][/bold yellow] Operation cancelled.")
+    return False
 
 
 
-def search_in_file(path, keyword):
-    """Search for keyword in the file and return matching lines with line numbers."""
+@instrumented
+def search_in_file(path, keyword, mode="literal"):
+    """
+    Search for keyword in the file and return matching lines with line numbers.
+    mode is 'literal' (case-insensitive), 'regex', 'all' or 'any' (of the words).
+    """
     if not os.path.exists(path):
         console.print("[bold red][!][/bold red] File not found.")
         return []
 
-    matches = []
-    with open(path, 'r', encoding='utf-8') as f:
-        for idx, line in enumerate(f, 1):
-            if keyword.lower() in line.lower():
-                matches.append((idx, line.strip()))
-    return matches
+    query = compile_query(keyword, mode)
+    matches = search_index.search(path, query)
+    if matches is not None:
+        return matches
+    return search.search_lines(path, query)
+
+
+def _sections_for_lines(path, line_numbers):
+    """Group matching line numbers into (section_title, [lines]) tuples in file order."""
+    library = get_library(path)
+    results = []
+    seen = set()
+
+    for line_number in line_numbers:
+        i = library.section_index_at_line(line_number)
+        if i in seen or (i >= 0 and library.sections[i].line == line_number):
+            continue  # headers are not part of a section's searchable content
+        seen.add(i)
 
-def search_sections(path, keyword):
+        if i < 0:
+            title = "Untitled"
+            body = read_section(path, 0, library.preamble_length()).split("\n")
+        else:
+            section = library.sections[i]
+            title = section.title
+            body = read_section(path, section.offset, section.length).split("\n")[1:]
+        if body and body[-1] == "":
+            body.pop()
+
+        # The line was already verified against the query, so the section is a hit.
+        results.append((title, [line.strip() for line in body]))
+    return results
+
+@instrumented
+def search_sections(path, keyword, mode="literal"):
     """
     Returns a list of sections (title + content lines) that contain the keyword.
     Each section is a tuple: (section_title, [lines])
@@ -194,80 +313,159 @@ def search_sections(path, keyword):
         console.print("[bold red][!][/bold red] File not found.")
         return []
 
-    results = []
-    with open(path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    current_section_title = "Untitled"
-    current_section_lines = []
-    match_found = False
-
-    for line in lines:
-        stripped = line.strip()
-        if stripped.startswith("## "):
-            if match_found:
-                results.append((current_section_title, current_section_lines))
-            # Start new section
-            current_section_title = stripped
-            current_section_lines = []
-            match_found = False
-        else:
-            current_section_lines.append(stripped)
-            if keyword.lower() in stripped.lower():
-                match_found = True
+    query = compile_query(keyword, mode)
+    matches = search_index.search(path, query)
+    if matches is not None:
+        return _sections_for_lines(path, [line_number for line_number, _ in matches])
 
-    # Add final section if matched
-    if match_found:
-        results.append((current_section_title, current_section_lines))
+    return search.search_sections(path, query)
 
-    return results
+@instrumented
+def rank_sections(path, keyword, limit=10):
+    """
+    Return the `limit` sections that best match the words of keyword (BM25), best
+    first, as ranking.RankedSection tuples with a highlighted-snippet span list.
+    """
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] File not found.")
+        return []
+
+    from studyvault import ranking
+    return ranking.rank_sections(path, keyword, limit)
 
+@instrumented
+def search_ranked(path, keyword, limit=10):
+    """
+    Return (matching_section_count, [ranking.RankedSection]) for the menu's Search:
+    the sections search_sections() finds by substring, those BM25 scores for the
+    keyword's words first, at most `limit` of them, each with a snippet.
+    """
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] File not found.")
+        return 0, []
+
+    from studyvault import ranking
+    return ranking.rank_matches(path, keyword, search_in_file(path, keyword), limit)
+
+@instrumented
 def list_sections(path):
     """
     Returns a list of (line_number, section_title) for lines starting with '## '.
+    Served from the cached Library, which is re-read only when the file changes.
+    """
+    return [(section.line, section.title) for section in get_library(path).sections]
+
+
+@instrumented
+def get_section_content(path, line_number):
+    """
+    Returns (section_title, [lines]) for the section whose header is on line_number,
+    reading only that section's bytes. Returns None if no section starts there.
     """
-    sections = []
-    with open(path, 'r', encoding='utf-8') as f:
-        for idx, line in enumerate(f, 1):
-            if line.strip().startswith("## "):
-                sections.append((idx, line.strip()))
-    return sections
+    section = get_library(path).find_by_line(line_number)
+    if section is None:
+        return None
 
+    raw_lines = read_section(path, section.offset, section.length).split("\n")
+    if raw_lines[-1] == "":
+        raw_lines.pop()
+    return section.title, [line.strip() for line in raw_lines[1:]]
 
+
+@instrumented
 def export_to_pdf(markdown_path, output_pdf_path):
     if not os.path.exists(markdown_path):
         console.print("[bold red][!][/bold red] Markdown file not found.")
-        return
-
-    with open(markdown_path, 'r', encoding='utf-8') as f:
-        raw_md = f.read()
+        return False
 
-    lines = raw_md.splitlines()
-    wrapped_lines = []
+    try:
+        # reportlab and markdown2 are only loaded on export; unchanged sections reuse their cached layout.
+        from studyvault import pdf_export
+        pdf_export.export(markdown_path, output_pdf_path)
+        console.print(f"[bold green][+][/bold green] Exported to PDF: [bold]{output_pdf_path}[/bold]")
+        return True
+    except Exception as e:
+        console.print(f"[bold red][!][/bold red] PDF export failed: {e}")
+        return False
 
-    for line in lines:
-        # Skip empty lines
-        if not line.strip():
-            wrapped_lines.append("")
-            continue
 
-        # Wrap long lines
-        wrapped = textwrap.wrap(line, width=100)
-        wrapped_lines.extend(wrapped)
+@instrumented
+def export_to_html(path, output_path):
+    """Write the library as one HTML page; unchanged sections reuse their cached HTML."""
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] Library not found.")
+        return False
 
     try:
-        c = canvas.Canvas(output_pdf_path, pagesize=letter)
-        width, height = letter
-        y = height - 40  # Start near top
-
-        for line in wrapped_lines:
-            if y < 40:
-                c.showPage()
-                y = height - 40
-            c.drawString(40, y, line)
-            y -= 15  # Line spacing
-
-        c.save()
-        console.print(f"[bold green][+][/bold green] Exported to PDF: [bold]{output_pdf_path}[/bold]")
+        from studyvault import render
+        render.export_html(path, output_path)
+        console.print(f"[bold green][+][/bold green] Exported to HTML: [bold]{output_path}[/bold]")
+        return True
     except Exception as e:
-        console.print(f"[bold red][!][/bold red] PDF export failed: {e}")
+        console.print(f"[bold red][!][/bold red] HTML export failed: {e}")
+        return False
+
+
+@instrumented
+def export_to_markdown(path, output_path):
+    """Write the library as one .md file (sharded or with pending edits, as it currently reads)."""
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] Library not found.")
+        return False
+
+    try:
+        import shutil
+        with open_library(path) as src, open(output_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        console.print(f"[bold green][+][/bold green] Exported to Markdown: [bold]{output_path}[/bold]")
+        return True
+    except OSError as e:
+        console.print(f"[bold red][!][/bold red] Markdown export failed: {e}")
+        return False
+
+
+@instrumented
+def undo_last_edit(path):
+    """Revert the library's most recent edit that is not undone yet, from its history."""
+    return _history_step(path, "undo")
+
+
+@instrumented
+def redo_last_edit(path):
+    """Re-apply the most recently undone edit."""
+    return _history_step(path, "redo")
+
+
+def _history_step(path, action):
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] Library not found.")
+        return False
+
+    from studyvault import history
+    try:
+        entry = getattr(history, action)(path)
+    except ValueError as e:
+        console.print(f"[bold red][!][/bold red] {e}")
+        return False
+    verb = "Undid" if action == "undo" else "Redid"
+    console.print(f"[bold green][+][/bold green] {verb}: {escape(entry.label)}")
+    return True
+
+
+@instrumented
+def export_version(path, when, output_path):
+    """Write the library as it was at time `when` (seconds since the epoch), rebuilt from its history."""
+    if not os.path.exists(path):
+        console.print("[bold red][!][/bold red] Library not found.")
+        return False
+
+    from studyvault import history
+    try:
+        content = history.content_at(path, when)
+        with open(output_path, 'wb') as f:
+            f.write(content)
+    except (ValueError, OSError) as e:
+        console.print(f"[bold red][!][/bold red] Could not rebuild that version: {e}")
+        return False
+    console.print(f"[bold green][+][/bold green] Exported the earlier version to: [bold]{output_path}[/bold]")
+    return True
@@ -0,0 +1,116 @@
+# studyvault/fileio.py
+
+import json
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def sidecar_path(path, suffix):
+    """Return the path of a helper file stored next to a library (e.g. notes.md.sections)."""
+    return f"{path}.{suffix}"
+
+
+def file_signature(path):
+    """
+    Return the signature of a library's content, used to tell whether cached data is
+    still valid: [size, mtime_ns], or [size, mtime_ns, journal_size] while edits are
+    pending in its journal (size is then the size with those edits applied).
+    """
+    # journal imports this module, so it is imported on first use.
+    from studyvault.journal import logical_signature
+    return logical_signature(path)
+
+
+def library_size(path):
+    """Return a library's size in bytes, including edits still pending in its journal."""
+    return file_signature(path)[0]
+
+
+def load_json(path):
+    """Load a JSON sidecar file, returning None if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def temporary_file(path):
+    """
+    Create a uniquely named temporary file next to path, for writing a replacement
+    that is then renamed over it. Returns (fd, tmp_path).
+    """
+    return tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                            dir=os.path.dirname(os.path.abspath(path)))
+
+
+def write_json(path, data):
+    """Write a JSON sidecar file through a temporary file so readers never see half of it."""
+    tmp_path = None
+    try:
+        # json.dumps runs the C encoder; json.dump into a file encodes chunk by chunk in Python.
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        fd, tmp_path = temporary_file(path)
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Sidecars are only caches; a read-only data directory must not break the library.
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def remove_file(path):
+    """Delete a file if it exists."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def mapped(path):
+    """Map a file read-only for the duration of a with block (an empty file gives b"")."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            buffer = b""
+        else:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+@contextmanager
+def locked(path):
+    """
+    Hold an exclusive lock on the file at path (created if missing) for the duration
+    of a with block, so processes sharing a library take turns.
+    """
+    with open(path, 'a+b') as f:
+        if os.name == "nt":
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after 10 seconds; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
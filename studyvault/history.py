@@ -0,0 +1,435 @@
+# studyvault/history.py
+#
+# Edit history with undo and redo. Every commit appends the splices it applied,
+# old and new bytes alike, to <library>.md.history, so the history grows with the
+# size of the edits rather than the size of the library. Undo applies a recorded
+# batch backwards (each splice's new bytes replaced by its old ones) and redo
+# applies it again; both are recorded too, so the file is a complete, ordered log
+# of how the library changed.
+#
+# The log is anchored to the library's current content by the signature stored
+# with the last record (compaction and conversion re-stamp it). Any earlier state
+# is rebuilt by undoing records backwards from the current content, or by
+# replaying them forward from a checkpoint: a compressed copy of the whole library
+# taken once the edits recorded since the previous one add up to the library's
+# size, so checkpoints cost at most about as much as the edits themselves. When
+# the library was changed outside StudyVault, the next edit starts the log afresh
+# after a break record: undo stops there, and states before it can only be rebuilt
+# from a checkpoint taken before it.
+#
+# Records are appended without fsync; a record torn by a crash is dropped on the
+# next load, losing only the history of that last edit.
+
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+from studyvault.fileio import sidecar_path, file_signature
+from studyvault.instrument import count
+from studyvault.journal import COUNT, SPLICE, open_library, replay
+
+HISTORY_SUFFIX = "history"
+MAGIC = b"SVH1"
+# payload length, crc32 of the payload.
+RECORD = struct.Struct("<II")
+# Start of a payload: kind, time, the edit an undo or redo refers to (-1 if none),
+# the signature after the record (length, then up to three values) and the label length.
+ENTRY = struct.Struct("<BdiB3qH")
+
+EDIT, UNDO, REDO, STAMP, BREAK, CHECKPOINT = range(1, 7)
+ACTIONS = {EDIT: "edit", UNDO: "undo", REDO: "redo", BREAK: "outside edit"}
+
+# Checkpoint once the splices recorded since the last one reach this share of the
+# library (and at least CHECKPOINT_MIN_BYTES).
+CHECKPOINT_RATIO = 1.0
+CHECKPOINT_MIN_BYTES = 1024 * 1024
+READ_BUFFER = 1024 * 1024
+LABEL_CHARS = 80
+
+# One line of `studyvault history`: number counts the listed entries from 1, bytes
+# is the size of the recorded edit.
+HistoryEntry = namedtuple("HistoryEntry", ["number", "time", "action", "label", "bytes"])
+
+# Replayed logs, keyed by library path and checked against the log's size.
+_states = {}
+
+
+def history_path(path):
+    """Return the path of the edit history stored next to a library."""
+    return sidecar_path(path, HISTORY_SUFFIX)
+
+
+class _Record:
+    """Where one record sits in the log; payloads are read only when needed."""
+
+    __slots__ = ("kind", "time", "ref", "signature", "label", "offset", "length", "checksum")
+
+    def __init__(self, kind, time, ref, signature, label, offset, length, checksum):
+        self.kind = kind
+        self.time = time
+        self.ref = ref
+        self.signature = signature
+        self.label = label
+        self.offset = offset
+        self.length = length
+        self.checksum = checksum
+
+
+class _History:
+    """The replayed log of one library: its records, the undo and redo stacks, and the signature it ends at."""
+
+    __slots__ = ("records", "undo", "redo", "signature", "size", "since_checkpoint")
+
+    def __init__(self):
+        self.records = []
+        self.undo = []
+        self.redo = []
+        self.signature = None
+        self.size = len(MAGIC)
+        self.since_checkpoint = 0
+
+    def add(self, record):
+        index = len(self.records)
+        self.records.append(record)
+        self.signature = record.signature
+        self.size = record.offset + record.length
+        if record.kind == EDIT:
+            self.undo.append(index)
+            self.redo = []
+            self.since_checkpoint += record.length
+        elif record.kind == UNDO:
+            self.redo.append(self.undo.pop())
+        elif record.kind == REDO:
+            self.undo.append(self.redo.pop())
+        elif record.kind == BREAK:
+            self.undo, self.redo = [], []
+        elif record.kind == CHECKPOINT:
+            self.since_checkpoint = 0
+
+
+def _pack_signature(signature):
+    values = list(signature) + [0] * (3 - len(signature))
+    return [len(signature)] + values
+
+
+def _scan(f, state, end):
+    """Add the records between state.size and end to state; stops at a torn record."""
+    f.seek(state.size)
+    while state.size + RECORD.size + ENTRY.size <= end:
+        length, checksum = RECORD.unpack(f.read(RECORD.size))
+        offset = state.size + RECORD.size
+        if length < ENTRY.size or offset + length > end:
+            return
+        kind, when, ref, signature_length, a, b, c, label_length = ENTRY.unpack(f.read(ENTRY.size))
+        label = f.read(label_length).decode('utf-8', 'replace')
+        if offset + length == end:
+            # Only the last record can be torn; check it in full.
+            f.seek(offset)
+            if zlib.crc32(f.read(length)) != checksum:
+                return
+        state.add(_Record(kind, when, ref, [a, b, c][:signature_length], label, offset, length, checksum))
+        f.seek(offset + length)
+
+
+def _load(path):
+    """Return the replayed history of a library (empty if it has none), reading only records appended since last time."""
+    try:
+        size = os.path.getsize(history_path(path))
+    except FileNotFoundError:
+        _states.pop(path, None)
+        return _History()
+    state = _states.get(path)
+    if state is not None and state.size == size:
+        return state
+    with open(history_path(path), 'rb') as f:
+        if state is None or state.size > size:
+            if f.read(len(MAGIC)) != MAGIC:
+                # Not ours, or torn before its first record: start over.
+                state = _History()
+                with open(history_path(path), 'wb') as out:
+                    out.write(MAGIC)
+                _states[path] = state
+                return state
+            state = _History()
+        start = state.size
+        _scan(f, state, size)
+        count(bytes_read=state.size - start)
+    if state.size < size:
+        # Drop a record torn by a crash so later records follow the last intact one.
+        with open(history_path(path), 'r+b') as f:
+            f.truncate(state.size)
+    _states[path] = state
+    return state
+
+
+def _append(path, state, kind, signature, ref=-1, label="", body=b"", now=None):
+    """Append one record whose payload ends with body (bytes or an iterable of bytes chunks)."""
+    label = label[:LABEL_CHARS].encode('utf-8')
+    now = time.time() if now is None else now
+    head = ENTRY.pack(kind, now, ref, *_pack_signature(signature), len(label)) + label
+    chunks = [body] if isinstance(body, bytes) else body
+    new_file = not os.path.exists(history_path(path))
+    with open(history_path(path), 'wb' if new_file else 'r+b') as f:
+        if new_file:
+            f.write(MAGIC)
+            state.size = len(MAGIC)
+        f.seek(state.size)
+        f.truncate()
+        # The header is written once the payload's length and checksum are known.
+        f.write(RECORD.pack(0, 0))
+        f.write(head)
+        length, checksum = len(head), zlib.crc32(head)
+        for chunk in chunks:
+            f.write(chunk)
+            length += len(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+        f.seek(state.size)
+        f.write(RECORD.pack(length, checksum))
+    count(bytes_written=RECORD.size + length)
+    state.add(_Record(kind, now, ref, list(signature), label.decode('utf-8'),
+                      state.size + RECORD.size, length, checksum))
+    _states[path] = state
+
+
+def _encode(splices):
+    payload = [COUNT.pack(len(splices))]
+    for offset, old, new in splices:
+        payload.append(SPLICE.pack(offset, len(old), len(new)))
+        payload.append(old)
+        payload.append(new)
+    return b"".join(payload)
+
+
+def _payload(path, record):
+    """Read a record's body (what follows its label), checking it against the record's checksum."""
+    with open(history_path(path), 'rb') as f:
+        f.seek(record.offset)
+        data = f.read(record.length)
+    count(bytes_read=len(data))
+    if zlib.crc32(data) != record.checksum:
+        raise ValueError("The edit history is damaged.")
+    return data[ENTRY.size + ENTRY.unpack_from(data)[-1]:]
+
+
+def _splices(path, record):
+    """The (offset, old, new) splices an EDIT record applied."""
+    data = _payload(path, record)
+    (number,) = COUNT.unpack_from(data, 0)
+    position = COUNT.size
+    splices = []
+    for _ in range(number):
+        offset, old_length, new_length = SPLICE.unpack_from(data, position)
+        position += SPLICE.size
+        old = data[position:position + old_length]
+        position += old_length
+        new = data[position:position + new_length]
+        position += new_length
+        splices.append((offset, old, new))
+    return splices
+
+
+def invert(splices):
+    """The splices that undo a batch: offsets move to the edited content, old and new swap."""
+    shift = 0
+    inverse = []
+    for offset, old, new in sorted(splices, key=lambda splice: splice[0]):
+        inverse.append((offset + shift, new, old))
+        shift += len(new) - len(old)
+    return inverse
+
+
+def _applied(path, state, index):
+    """The splices record `index` applied to the library (none for records that only mark a point)."""
+    record = state.records[index]
+    if record.kind == EDIT:
+        return _splices(path, record)
+    if record.kind == REDO:
+        return _splices(path, state.records[record.ref])
+    if record.kind == UNDO:
+        return invert(_splices(path, state.records[record.ref]))
+    return []
+
+
+def _checkpoint(path, state):
+    """Append a compressed copy of the library's current content."""
+    def chunks():
+        compressor = zlib.compressobj()
+        with open_library(path) as f:
+            while True:
+                data = f.read(READ_BUFFER)
+                if not data:
+                    break
+                count(bytes_read=len(data))
+                yield compressor.compress(data)
+        yield compressor.flush()
+
+    _append(path, state, CHECKPOINT, file_signature(path), body=chunks())
+
+
+def _maybe_checkpoint(path, state):
+    if state.since_checkpoint >= max(CHECKPOINT_MIN_BYTES, state.signature[0] * CHECKPOINT_RATIO):
+        _checkpoint(path, state)
+
+
+def record(path, splices, before, label):
+    """Log a batch of splices just applied to a library whose signature was `before`."""
+    state = _load(path)
+    if state.signature is not None and state.signature != before:
+        # Dated by the library's modification time: the outside edit happened then, not now.
+        modified = min(max(before[1] / 1e9, state.records[-1].time), time.time())
+        _append(path, state, BREAK, before, now=modified)
+    _append(path, state, EDIT, file_signature(path), label=label,
+            body=_encode([(splice.offset, splice.old, splice.new) for splice in splices]))
+    _maybe_checkpoint(path, state)
+
+
+def restamp(path, before, after):
+    """Note that a library's signature changed from before to after without its content changing."""
+    if not os.path.exists(history_path(path)):
+        return
+    state = _load(path)
+    if state.signature == before and before != after:
+        _append(path, state, STAMP, after)
+
+
+def _current(path, state):
+    """True if the log ends at the library's current content."""
+    return state.signature is not None and state.signature == file_signature(path)
+
+
+def _check(path, splices):
+    """Make sure the library still holds the bytes the splices are about to replace."""
+    with open_library(path) as f:
+        for offset, old, _ in splices:
+            f.seek(offset)
+            if f.read(len(old)) != old:
+                raise ValueError("The library no longer matches its edit history.")
+
+
+def _step(path, kind):
+    state = _load(path)
+    stack = state.undo if kind == UNDO else state.redo
+    if not stack:
+        raise ValueError(f"Nothing to {ACTIONS[kind]}.")
+    if not _current(path, state):
+        raise ValueError("The library was changed outside StudyVault since its last recorded edit.")
+    ref = stack[-1]
+    splices = _splices(path, state.records[ref])
+    if kind == UNDO:
+        splices = invert(splices)
+    _check(path, splices)
+
+    from studyvault.edits import Splice, commit
+    commit(path, [Splice(*splice) for splice in splices], label=None)
+    _append(path, state, kind, file_signature(path), ref=ref, label=state.records[ref].label)
+    _maybe_checkpoint(path, state)
+    index = max(i for i, record in enumerate(state.records) if record.kind == kind)
+    return _entry(state, index, _numbers(state)[index])
+
+
+def undo(path):
+    """Revert the most recent edit that is not undone yet. Returns its HistoryEntry."""
+    return _step(path, UNDO)
+
+
+def redo(path):
+    """Re-apply the most recently undone edit. Returns its HistoryEntry."""
+    return _step(path, REDO)
+
+
+def _numbers(state):
+    """Map the index of every listed record to its entry number."""
+    listed = [i for i, record in enumerate(state.records) if record.kind in ACTIONS]
+    return {index: number for number, index in enumerate(listed, 1)}
+
+
+def _entry(state, index, number):
+    record = state.records[index]
+    size = record.length if record.kind == EDIT else 0
+    if record.kind in (UNDO, REDO):
+        size = state.records[record.ref].length
+    return HistoryEntry(number, record.time, ACTIONS[record.kind], record.label, size)
+
+
+def entries(path):
+    """
+    Return (entries, undo, redo): a HistoryEntry per edit, undo, redo and outside
+    edit, oldest first, and the entries the next undo and redo would act on (or None).
+    """
+    state = _load(path)
+    numbers = _numbers(state)
+    listed = [_entry(state, index, number) for index, number in numbers.items()]
+    current = _current(path, state)
+    undo_entry = _entry(state, state.undo[-1], numbers[state.undo[-1]]) if state.undo and current else None
+    redo_entry = _entry(state, state.redo[-1], numbers[state.redo[-1]]) if state.redo and current else None
+    return listed, undo_entry, redo_entry
+
+
+def _segment(state, position):
+    """The (first, last) record positions sharing content history with `position` (no break between)."""
+    first = -1
+    for i in range(position, -1, -1):
+        if state.records[i].kind == BREAK:
+            first = i
+            break
+    last = len(state.records) - 1
+    for i in range(position + 1, len(state.records)):
+        if state.records[i].kind == BREAK:
+            last = i - 1
+            break
+    return first, last
+
+
+def parse_time(value):
+    """Seconds since the epoch from a number or a local ISO time ('2025-07-12 14:30')."""
+    from datetime import datetime
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}'; use e.g. 2025-07-12 14:30.")
+
+
+def _read_all(path):
+    with open_library(path) as f:
+        data = f.read()
+    count(bytes_read=len(data))
+    return data
+
+
+def content_at(path, when):
+    """
+    Return the library's content as it was at time `when` (seconds since the
+    epoch), rebuilt from the nearest checkpoint or the current content.
+    """
+    state = _load(path)
+    current = _current(path, state)
+    if not current and when >= file_signature(path)[1] / 1e9:
+        # Changed outside StudyVault after the last record, but not since `when`.
+        return _read_all(path)
+    if not state.records:
+        raise ValueError("The library has no edit history.")
+    # The content after the last record made at or before `when` (-1: before the first one).
+    position = -1
+    while position + 1 < len(state.records) and state.records[position + 1].time <= when:
+        position += 1
+    first, last = _segment(state, position)
+
+    anchors = [i for i in range(max(first, 0), last + 1) if state.records[i].kind == CHECKPOINT]
+    if last == len(state.records) - 1 and current:
+        anchors.append(last)
+    if not anchors:
+        raise ValueError("The library was changed outside StudyVault around then, and no checkpoint covers it.")
+    anchor = min(anchors, key=lambda i: abs(i - position))
+
+    if state.records[anchor].kind == CHECKPOINT:
+        base = zlib.decompress(_payload(path, state.records[anchor]))
+    else:
+        base = _read_all(path)
+    if anchor <= position:
+        batches = (_applied(path, state, i) for i in range(anchor + 1, position + 1))
+    else:
+        batches = (invert(_applied(path, state, i)) for i in range(anchor, position, -1))
+    return replay(base, batches)
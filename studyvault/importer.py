@@ -0,0 +1,155 @@
+# studyvault/importer.py
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from studyvault.edits import Splice, commit
+from studyvault.fileio import library_size
+from studyvault.parser import iter_sections
+
+NOTE_EXTENSIONS = (".md", ".markdown", ".txt")
+# Appends are collected in memory and written through one commit per buffer-full.
+WRITE_BUFFER = 8 * 1024 * 1024
+# Files read per batch handed to the thread pool; bounds how many notes are in memory.
+READ_BATCH = 512
+
+
+def iter_note_files(root, extensions=NOTE_EXTENSIONS):
+    """Yield the paths of note files under root, depth-first and in name order."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(extensions):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+
+def normalize_body(text):
+    """
+    Normalize note text the way it is stored: '\\n' line endings, no trailing
+    whitespace, and '## ' headers demoted to '### ' so a note stays one section.
+    """
+    lines = []
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        line = line.rstrip()
+        if line.lstrip().startswith("## "):
+            line = "#" + line.lstrip()
+        lines.append(line)
+    return "\n".join(lines).strip("\n")
+
+
+def content_hash(body):
+    """Hash a normalized section body; used to spot notes that are already stored."""
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+def read_note(path, root):
+    """
+    Read one note file and return (title, body, size). The title is the note's
+    leading '# ' heading if it has one, otherwise its path relative to root.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8-sig', errors='replace')
+    body = normalize_body(text)
+
+    first, _, rest = body.partition("\n")
+    if first.startswith("# "):
+        title, body = first[2:].strip(), rest.strip("\n")
+    else:
+        title = os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, " / ")
+    return title, body, len(raw)
+
+
+def existing_hashes(path):
+    """Return the content hashes of every section already in the library."""
+    hashes = set()
+    if not os.path.exists(path):
+        return hashes
+    for title, _, _, lines in iter_sections(path):
+        if title is not None:
+            hashes.add(content_hash(normalize_body("".join(lines))))
+    return hashes
+
+
+def import_notes(path, source, workers=None, dedupe=True):
+    """
+    Import every note file under source into the library at path, one '## title'
+    section per note. Files are read on a thread pool and appended in large
+    buffered writes. Returns a dict of counts and throughput.
+    """
+    started = time.perf_counter()
+    seen = existing_hashes(path) if dedupe else set()
+    stats = {"notes": 0, "duplicates": 0, "errors": 0, "bytes": 0}
+
+    buffer = []
+    buffered = 0
+    offset = library_size(path) if os.path.exists(path) else 0
+
+    def flush():
+        nonlocal buffer, buffered, offset
+        if buffer:
+            data = b"".join(buffer)
+            commit(path, [Splice(offset, b"", data)], label=f"import from {os.path.basename(os.path.normpath(source))}")
+            offset += len(data)
+            buffer, buffered = [], 0
+
+    def read(note_path):
+        try:
+            return read_note(note_path, source)
+        except OSError:
+            return None
+
+    files = iter_note_files(source)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = [note_path for _, note_path in zip(range(READ_BATCH), files)]
+            if not batch:
+                break
+            for note in pool.map(read, batch):
+                if note is None:
+                    stats["errors"] += 1
+                    continue
+                title, body, size = note
+                stats["bytes"] += size
+                if dedupe:
+                    digest = content_hash(body)
+                    if digest in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(digest)
+
+                # Same layout append_to_file() writes.
+                data = f"\n\n## {title}\n{body}\n".encode('utf-8')
+                buffer.append(data)
+                buffered += len(data)
+                stats["notes"] += 1
+                if buffered >= WRITE_BUFFER:
+                    flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["notes_per_second"] = stats["notes"] / elapsed if elapsed else 0.0
+    stats["mb_per_second"] = stats["bytes"] / 1e6 / elapsed if elapsed else 0.0
+    return stats
+
+
+def import_summary(stats):
+    """One-line, human-readable summary of an import_notes() result."""
+    unreadable = f", {stats['errors']} unreadable" if stats["errors"] else ""
+    return (f"Imported {stats['notes']} note(s), skipped {stats['duplicates']} duplicate(s){unreadable} "
+            f"in {stats['seconds']:.2f}s ({stats['notes_per_second']:.0f} notes/s, "
+            f"{stats['mb_per_second']:.1f} MB/s)")
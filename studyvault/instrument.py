@@ -0,0 +1,163 @@
+# studyvault/instrument.py
+#
+# Opt-in instrumentation for file_manager entry points and CLI handlers. When
+# tracing is off (the default) an instrumented call costs one flag check. When on,
+# every call writes one JSON line with its wall time, the bytes and lines the I/O
+# helpers report through count(), and its peak traced memory.
+#
+#   STUDYVAULT_TRACE=trace.jsonl studyvault            # interactive session
+#   studyvault --trace trace.jsonl search physics momentum
+#   studyvault --profile search.pstats search physics momentum
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+TRACE_ENV = "STUDYVAULT_TRACE"
+PROFILE_ENV = "STUDYVAULT_PROFILE"
+COUNTERS = ("bytes_read", "bytes_written", "lines_scanned")
+
+_enabled = False
+_trace_file = None
+_memory = False
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Frame:
+    __slots__ = ("name", "started", "child_seconds", "peak", "memory_start") + COUNTERS
+
+    def __init__(self, name):
+        self.name = name
+        self.child_seconds = 0.0
+        self.peak = 0
+        self.memory_start = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.lines_scanned = 0
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def enable(trace_path, memory=True):
+    """Start writing one JSON line per instrumented call to trace_path ('-' for stderr)."""
+    global _enabled, _trace_file, _memory
+    _trace_file = sys.stderr if trace_path == "-" else open(trace_path, 'a', encoding='utf-8')
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = True
+
+
+def disable():
+    global _enabled, _trace_file
+    _enabled = False
+    if _trace_file is not None and _trace_file is not sys.stderr:
+        _trace_file.close()
+    _trace_file = None
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def enable_from_environment():
+    """Turn tracing on when STUDYVAULT_TRACE names a trace file."""
+    if os.environ.get(TRACE_ENV):
+        enable(os.environ[TRACE_ENV])
+
+
+def count(bytes_read=0, bytes_written=0, lines_scanned=0):
+    """Credit I/O to every instrumented call in progress on this thread."""
+    if not _enabled:
+        return
+    for frame in _stack():
+        frame.bytes_read += bytes_read
+        frame.bytes_written += bytes_written
+        frame.lines_scanned += lines_scanned
+
+
+def _current_peak():
+    return tracemalloc.get_traced_memory()[1] if _memory else 0
+
+
+def _begin(name):
+    stack = _stack()
+    frame = _Frame(name)
+    if _memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        frame.memory_start = current
+    stack.append(frame)
+    frame.started = time.perf_counter()
+    return frame
+
+
+def _end(frame, error):
+    seconds = time.perf_counter() - frame.started
+    stack = _stack()
+    stack.pop()
+    peak = max(frame.peak, _current_peak())
+    if stack:
+        stack[-1].child_seconds += seconds
+        stack[-1].peak = max(stack[-1].peak, peak)
+
+    record = {
+        "ts": round(time.time(), 6),
+        "call": frame.name,
+        "depth": len(stack),
+        "seconds": round(seconds, 6),
+        # Time not spent in nested instrumented calls, e.g. rendering in a CLI handler.
+        "self_seconds": round(seconds - frame.child_seconds, 6),
+    }
+    for name in COUNTERS:
+        record[name] = getattr(frame, name)
+    if _memory:
+        record["peak_memory"] = max(peak - frame.memory_start, 0)
+    if error is not None:
+        record["error"] = type(error).__name__
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.write(json.dumps(record) + "\n")
+            _trace_file.flush()
+
+
+def instrumented(fn):
+    """Decorator recording each call of fn while tracing is enabled."""
+    module = fn.__module__.rsplit(".", 1)[-1]
+    name = f"{module}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+        frame = _begin(name)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            _end(frame, e)
+            raise
+        _end(frame, None)
+        return result
+
+    return wrapper
+
+
+def run_profiled(path, fn, *args, **kwargs):
+    """Run fn under cProfile and dump pstats to path (read with `python -m pstats path`)."""
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
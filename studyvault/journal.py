@@ -0,0 +1,486 @@
+# studyvault/journal.py
+#
+# Write-ahead edit journal. Edits to an existing library are not written into the
+# .md file: each commit appends one checksummed record of splices to
+# <library>.md.journal and fsyncs it, which costs O(edit size). Readers see the
+# library through open_library(), which overlays the journal's splices on the
+# base file as a piece table. compact() folds the journal into the .md file via
+# a temporary file, fsync and rename, so the library is never left half-written;
+# it holds <library>.md.lock meanwhile, so two processes never fold one journal.
+#
+# A record torn by a crash fails its checksum and is dropped (with everything
+# after it) on the next load. Before compaction renames the new file in, it
+# appends a marker record naming that file, so a journal left behind by a crash
+# after the rename is recognised as folded in and removed. A journal whose base
+# was changed any other way (the file was edited outside StudyVault while edits
+# were pending) is never dropped silently: load() raises JournalConflict, and
+# the user either reapplies the edits to the changed file (reapply()) or sets
+# them aside as <library>.md.journal.stale (discard()).
+#
+# Libraries kept by another backend (studyvault.storage) have no journal:
+# open_library() and logical_signature() hand them to their backend module.
+
+import io
+import os
+import shutil
+import struct
+import zlib
+from bisect import bisect_right
+from studyvault.fileio import sidecar_path, locked, remove_file, temporary_file
+from studyvault.instrument import count
+from studyvault import storage
+
+JOURNAL_SUFFIX = "journal"
+LOCK_SUFFIX = "lock"
+MAGIC = b"SVJ1"
+# magic, then the size and mtime_ns of the base file the records apply to.
+HEADER = struct.Struct("<4sQQ")
+# payload length, crc32 of the payload.
+RECORD = struct.Struct("<II")
+# Inside a payload: splice count, then per splice offset, len(old), len(new), old, new.
+COUNT = struct.Struct("<I")
+SPLICE = struct.Struct("<QII")
+# A payload whose count is COMPACTED marks the journal as folded into the file
+# with this (size, mtime_ns).
+COMPACTED = 0xFFFFFFFF
+TARGET = struct.Struct("<QQ")
+
+# Compact once the journal holds this many bytes and at least this share of the
+# library, so rewrites stay rare on big libraries and appends amortise to O(1).
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+COMPACT_RATIO = 0.25
+READ_BUFFER = 256 * 1024
+
+# Replayed journals, keyed by library path and checked against the journal's size.
+_states = {}
+
+
+class JournalConflict(OSError):
+    """A library's file changed outside StudyVault while journal edits were pending."""
+
+    def __init__(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        super().__init__(
+            f"{path} was changed outside StudyVault while edits made here were not yet written into it; "
+            f"they are kept in {journal_path(path)}. Run `studyvault compact {name} --reapply` to apply them "
+            f"to the file as it is now, or `studyvault compact {name} --discard` to keep the file as it is.")
+        self.path = path
+
+    def __reduce__(self):
+        return JournalConflict, (self.path,)
+
+
+def journal_path(path):
+    """Return the path of the edit journal stored next to a library."""
+    return sidecar_path(path, JOURNAL_SUFFIX)
+
+
+def _base_id(st):
+    return (st.st_size, st.st_mtime_ns)
+
+
+class _Journal:
+    """The replayed state of one journal: a piece table over the base file."""
+
+    __slots__ = ("path", "base", "journal_size", "pieces", "starts", "size")
+
+    def __init__(self, path, base, journal_size):
+        self.path = path
+        self.base = base
+        self.journal_size = journal_size
+        # (data, start, length): data None means the base file, else a bytes object.
+        self.pieces = [(None, 0, base[0])] if base[0] else []
+        self.size = base[0]
+        self.starts = None
+
+    def _starts(self):
+        if self.starts is None:
+            starts = []
+            position = 0
+            for _, _, length in self.pieces:
+                starts.append(position)
+                position += length
+            self.starts = starts
+        return self.starts
+
+    def apply(self, splices):
+        """Apply one batch of splices whose offsets refer to the state before the batch."""
+        # One merge pass over the pieces, however many splices the batch holds. The
+        # list is rebuilt, so readers opened earlier keep the pieces they started with.
+        pieces = []
+        remaining = iter(self.pieces)
+        piece = next(remaining, None)
+        position = 0
+        for offset, old, new in sorted(splices, key=lambda splice: splice[0]):
+            # Keep what lies before the splice, then drop the bytes it replaces.
+            while piece is not None and position + piece[2] <= offset:
+                pieces.append(piece)
+                position += piece[2]
+                piece = next(remaining, None)
+            if piece is not None and position < offset:
+                data, start, length = piece
+                cut = offset - position
+                pieces.append((data, start, cut))
+                piece, position = (data, start + cut, length - cut), offset
+            if new:
+                pieces.append((new, 0, len(new)))
+            end = offset + len(old)
+            while piece is not None and position + piece[2] <= end:
+                position += piece[2]
+                piece = next(remaining, None)
+            if piece is not None and position < end:
+                data, start, length = piece
+                cut = end - position
+                piece, position = (data, start + cut, length - cut), end
+            self.size += len(new) - len(old)
+        if piece is not None:
+            pieces.append(piece)
+        pieces.extend(remaining)
+        self.pieces = pieces
+        self.starts = None
+
+    def snapshot(self):
+        """A read-only copy that later appends do not change."""
+        copy = _Journal.__new__(_Journal)
+        copy.path, copy.base, copy.journal_size = self.path, self.base, self.journal_size
+        copy.pieces, copy.size, copy.starts = self.pieces, self.size, self._starts()
+        return copy
+
+    def read(self, base_file, offset, length):
+        """Return up to length logical bytes starting at offset."""
+        starts = self._starts()
+        i = max(bisect_right(starts, offset) - 1, 0)
+        out = []
+        while length > 0 and i < len(self.pieces):
+            data, start, piece_length = self.pieces[i]
+            skip = offset - starts[i]
+            take = min(piece_length - skip, length)
+            if take > 0:
+                if data is None:
+                    base_file.seek(start + skip)
+                    out.append(base_file.read(take))
+                else:
+                    out.append(data[start + skip:start + skip + take])
+                offset += take
+                length -= take
+            i += 1
+        return b"".join(out)
+
+
+class _PieceReader(io.RawIOBase):
+    """Raw, seekable reader over a journal's logical content (wrapped in a BufferedReader)."""
+
+    def __init__(self, state):
+        super().__init__()
+        self._state = state.snapshot()
+        self._base = open(state.path, 'rb')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._state.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        data = self._state.read(self._base, self._position, len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._base.close()
+        super().close()
+
+
+def replay(base, batches):
+    """
+    Return the bytes `base` with each batch of (offset, old, new) splices applied in
+    turn. The batches are merged into one piece table, so no intermediate copy of
+    the content is made.
+    """
+    state = _Journal(None, (len(base), 0), 0)
+    for splices in batches:
+        state.apply(splices)
+    return state.read(io.BytesIO(base), 0, state.size)
+
+
+def _read_records(f):
+    """
+    Yield (end_offset, [(offset, old, new)], None) per intact record, or
+    (end_offset, None, (size, mtime_ns)) for a compaction marker; stops at the
+    first torn record.
+    """
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        length, checksum = RECORD.unpack(head)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        (number,) = COUNT.unpack_from(payload, 0)
+        if number == COMPACTED:
+            yield f.tell(), None, TARGET.unpack_from(payload, COUNT.size)
+            continue
+        position = COUNT.size
+        splices = []
+        for _ in range(number):
+            offset, old_length, new_length = SPLICE.unpack_from(payload, position)
+            position += SPLICE.size
+            old = payload[position:position + old_length]
+            position += old_length
+            new = payload[position:position + new_length]
+            position += new_length
+            splices.append((offset, old, new))
+        yield f.tell(), splices, None
+
+
+def _set_aside(path):
+    os.replace(journal_path(path), journal_path(path) + ".stale")
+
+
+def load(path, st=None):
+    """
+    Return the replayed journal of a library, or None when it has no pending edits.
+    Replays only when the journal changed since the last call.
+    """
+    try:
+        journal_st = os.stat(journal_path(path))
+    except FileNotFoundError:
+        _states.pop(path, None)
+        return None
+    st = st if st is not None else os.stat(path)
+    state = _states.get(path)
+    if state is not None and state.journal_size == journal_st.st_size and state.base == _base_id(st):
+        return state
+
+    _states.pop(path, None)
+    with open(journal_path(path), 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            # Torn while it was being created, before its first record was committed.
+            f.close()
+            _set_aside(path)
+            return None
+        state = _Journal(path, HEADER.unpack(header)[1:], HEADER.size)
+        compacted_into = None
+        recorded = False
+        for end, splices, target in _read_records(f):
+            if target is not None:
+                compacted_into = target
+            else:
+                state.apply(splices)
+                recorded = True
+            state.journal_size = end
+        count(bytes_read=state.journal_size)
+
+    if state.base != _base_id(st):
+        if recorded and compacted_into != _base_id(st):
+            raise JournalConflict(path)
+        # Folded in by a compaction that stopped before removing the journal, or
+        # nothing was recorded: the file already holds everything.
+        remove_file(journal_path(path))
+        return None
+    if state.journal_size < journal_st.st_size:
+        # Drop a record torn by a crash so later appends follow the last intact one.
+        with open(journal_path(path), 'r+b') as f:
+            f.truncate(state.journal_size)
+    if state.journal_size == HEADER.size:
+        remove_file(journal_path(path))
+        _states.pop(path, None)
+        return None
+    _states[path] = state
+    return state
+
+
+def logical_signature(path):
+    """
+    Return the library's content signature: [size, mtime_ns] of the .md file, or
+    [logical size, mtime_ns, journal size] while journal edits are pending.
+    """
+    st = os.stat(path)
+    backend = storage.backend(path, st)
+    if backend is not None:
+        return backend.signature(path)
+    state = load(path, st)
+    if state is None:
+        return [st.st_size, st.st_mtime_ns]
+    return [state.size, st.st_mtime_ns, state.journal_size]
+
+
+def open_library(path):
+    """Open a library for binary reading, with pending journal edits applied."""
+    backend = storage.backend(path)
+    if backend is not None:
+        return backend.open_reader(path)
+    state = load(path)
+    if state is None:
+        return open(path, 'rb')
+    return io.BufferedReader(_PieceReader(state), READ_BUFFER)
+
+
+def _fsync_directory(path):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def append(path, splices):
+    """Durably record one batch of splices (offsets relative to the current content)."""
+    state = load(path)
+    payload = [COUNT.pack(len(splices))]
+    for splice in splices:
+        payload.append(SPLICE.pack(splice.offset, len(splice.old), len(splice.new)))
+        payload.append(splice.old)
+        payload.append(splice.new)
+    payload = b"".join(payload)
+
+    if state is None:
+        record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+        st = os.stat(path)
+        state = _Journal(path, _base_id(st), HEADER.size)
+        with open(journal_path(path), 'wb') as f:
+            f.write(HEADER.pack(MAGIC, *state.base) + record)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_directory(path)
+        count(bytes_written=HEADER.size + len(record))
+        state.journal_size += len(record)
+    else:
+        state.journal_size += _write_record(path, payload)
+
+    state.apply([(splice.offset, splice.old, splice.new) for splice in splices])
+    _states[path] = state
+
+
+def _write_record(path, payload):
+    """Durably append one record to an existing journal; returns its length."""
+    record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+    with open(journal_path(path), 'ab') as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    count(bytes_written=len(record))
+    return len(record)
+
+
+def needs_compaction(path):
+    """True once the pending journal is large enough to be worth folding in."""
+    state = _states.get(path)
+    if state is None:
+        return False
+    return state.journal_size >= max(COMPACT_MIN_BYTES, state.size * COMPACT_RATIO)
+
+
+def compact(path):
+    """
+    Fold pending journal edits into the .md file: write the full content to a
+    temporary file, fsync it, rename it over the library, then drop the journal.
+    Returns (signature_before, signature_after), or None if nothing was pending.
+    """
+    if load(path) is None:
+        return None
+    with locked(sidecar_path(path, LOCK_SUFFIX)):
+        # Another process may have folded the journal in while we waited.
+        state = load(path)
+        if state is None:
+            return None
+        before = logical_signature(path)
+        fd, tmp_path = temporary_file(path)
+        try:
+            target = _write_compacted(path, state, fd, tmp_path)
+            # If we stop after the rename, the marker tells load() that the journal
+            # is already in the file, so it is removed rather than replayed twice.
+            _write_record(path, COUNT.pack(COMPACTED) + TARGET.pack(*target))
+            os.replace(tmp_path, path)
+        except BaseException:
+            remove_file(tmp_path)
+            raise
+        _fsync_directory(path)
+        remove_file(journal_path(path))
+        _states.pop(path, None)
+        return before, logical_signature(path)
+
+
+def _write_compacted(path, state, fd, tmp_path):
+    """Write the journaled content of path to the open temporary file; return its (size, mtime_ns)."""
+    with open(path, 'rb') as src, open(fd, 'wb') as dst:
+        for data, start, length in state.pieces:
+            if data is None:
+                src.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = src.read(min(remaining, READ_BUFFER * 16))
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+            else:
+                dst.write(data[start:start + length])
+        dst.flush()
+        if _base_id(os.fstat(dst.fileno())) == state.base:
+            # The journal must never match the compacted file, or it would be replayed twice.
+            os.utime(tmp_path, ns=(state.base[1] + 1, state.base[1] + 1))
+        os.fsync(dst.fileno())
+        count(bytes_read=src.tell(), bytes_written=dst.tell())
+    shutil.copymode(path, tmp_path)
+    return _base_id(os.stat(tmp_path))
+
+
+def recorded_batches(path):
+    """
+    Return the batches of (offset, old, new) splices in a library's journal,
+    whatever file they were made against, or None if it has no journal.
+    """
+    try:
+        with open(journal_path(path), 'rb') as f:
+            if f.read(HEADER.size)[:4] != MAGIC:
+                return []
+            return [splices for _, splices, target in _read_records(f) if target is None]
+    except FileNotFoundError:
+        return None
+
+
+def fits(path, batches):
+    """
+    True if the batches can be applied in turn to the file as it is now: the text
+    each splice replaces is still at its offset, and each insertion starts a line.
+    """
+    state = _Journal(path, _base_id(os.stat(path)), HEADER.size)
+    with open(path, 'rb') as base:
+        for splices in batches:
+            for offset, old, new in splices:
+                if offset + len(old) > state.size or state.read(base, offset, len(old)) != old:
+                    return False
+                if not old and 0 < offset < state.size and state.read(base, offset - 1, 1) != b"\n":
+                    return False
+            state.apply(splices)
+    return True
+
+
+def discard(path):
+    """Set a library's journal aside as <library>.md.journal.stale; the file stays as it is."""
+    _set_aside(path)
+    _states.pop(path, None)
+
+
+def pending_paths():
+    """Return the libraries with replayed, not yet compacted journals in this process."""
+    return list(_states)
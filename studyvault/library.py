@@ -0,0 +1,259 @@
+# studyvault/library.py
+
+from bisect import bisect_right
+from studyvault.fileio import file_signature, load_json
+from studyvault.journal import open_library
+from studyvault.parser import header_title, split_lines
+from studyvault.section_index import (
+    INDEX_VERSION,
+    index_path,
+    load_section_index,
+    save_section_index,
+    invalidate_section_index,
+)
+
+# Parsed libraries kept for the life of the process, keyed by path and checked against
+# the file's (size, mtime) on every lookup.
+_cache = {}
+# Libraries whose sidecar section index lags behind the cached Library. Saving is
+# deferred to compaction or exit, so a write does not rewrite the whole sidecar.
+_dirty = set()
+
+
+class Section:
+    """One '## ' section: its stripped header, header line number and byte range."""
+
+    __slots__ = ("title", "line", "offset", "length")
+
+    def __init__(self, title, line, offset, length):
+        self.title = title
+        self.line = line
+        self.offset = offset
+        self.length = length
+
+    def to_row(self):
+        return [self.title, self.line, self.offset, self.length]
+
+
+class Library:
+    """In-memory section map of one library file, patched in place after each write."""
+
+    __slots__ = ("path", "signature", "size", "sections", "_offsets", "_lines", "_titles")
+
+    def __init__(self, path, signature, sections):
+        self.path = path
+        self.signature = signature
+        self.size = signature[0]
+        self.sections = sections
+        self._reset_lookups()
+
+    @classmethod
+    def load(cls, path):
+        """Build a Library from the sidecar section index, rebuilding that when stale."""
+        signature = file_signature(path)
+        rows = load_section_index(path)
+        return cls(path, signature, [Section(*row) for row in rows])
+
+    def _reset_lookups(self):
+        self._offsets = None
+        self._lines = None
+        self._titles = None
+
+    def _offset_list(self):
+        if self._offsets is None:
+            self._offsets = [section.offset for section in self.sections]
+        return self._offsets
+
+    def _line_list(self):
+        if self._lines is None:
+            self._lines = [section.line for section in self.sections]
+        return self._lines
+
+    def section_index_at_line(self, line_number):
+        """Return the index of the section containing line_number, or -1 for the preamble."""
+        return bisect_right(self._line_list(), line_number) - 1
+
+    def section_index_at_offset(self, offset):
+        """Return the index of the section containing the byte offset, or -1 for the preamble."""
+        return bisect_right(self._offset_list(), offset) - 1
+
+    def find_by_line(self, line_number):
+        """Return the Section whose header is on line_number, or None."""
+        i = self.section_index_at_line(line_number)
+        if i >= 0 and self.sections[i].line == line_number:
+            return self.sections[i]
+        return None
+
+    def find_by_title(self, title):
+        """Return the first Section with this stripped header (e.g. '## Notes'), or None."""
+        if self._titles is None:
+            self._titles = {}
+            for section in self.sections:
+                self._titles.setdefault(section.title, section)
+        return self._titles.get(title)
+
+    def preamble_length(self):
+        """Return the byte length of the text before the first section."""
+        return self.sections[0].offset if self.sections else self.size
+
+    def _parse_region(self, data, offset, line_number):
+        """Return the Sections whose headers appear in data, which starts at offset/line_number."""
+        sections = []
+        for raw in split_lines(data):
+            title = header_title(raw)
+            if title is not None:
+                sections.append(Section(title, line_number, offset, 0))
+            offset += len(raw)
+            line_number += 1
+        return sections
+
+    def _regions(self, splices):
+        """
+        Map splices onto the runs of sections they touch, merging splices that share a
+        section. Returns [first, last, start, end, byte_delta, line_delta] per region,
+        where first/last are section indexes (-1 is the preamble) and start/end bytes.
+        """
+        regions = []
+        for splice in splices:
+            first = self.section_index_at_offset(splice.offset)
+            last = self.section_index_at_offset(splice.offset + len(splice.old))
+            start = self.sections[first].offset if first >= 0 else 0
+            end = self.sections[last + 1].offset if last + 1 < len(self.sections) else self.size
+            delta = len(splice.new) - len(splice.old)
+            line_delta = splice.new.count(b"\n") - splice.old.count(b"\n")
+
+            if regions and first <= regions[-1][1]:
+                previous = regions[-1]
+                previous[1] = max(previous[1], last)
+                previous[3] = max(previous[3], end)
+                previous[4] += delta
+                previous[5] += line_delta
+            else:
+                regions.append([first, last, start, end, delta, line_delta])
+        return regions
+
+    def apply_splices(self, splices, signature):
+        """
+        Patch the section map after splices (sorted, in pre-write offsets) were written.
+        Only the sections a splice touches are re-read; the rest are shifted in one pass.
+        """
+        patched = []
+        shift = 0
+        line_shift = 0
+        cursor = 0
+        with open_library(self.path) as f:
+            for first, last, start, end, delta, line_delta in self._regions(splices):
+                for section in self.sections[cursor:max(first, 0)]:
+                    section.offset += shift
+                    section.line += line_shift
+                    patched.append(section)
+
+                start_line = (self.sections[first].line if first >= 0 else 1) + line_shift
+                f.seek(start + shift)
+                patched.extend(self._parse_region(f.read(end - start + delta), start + shift, start_line))
+                shift += delta
+                line_shift += line_delta
+                cursor = last + 1
+
+        for section in self.sections[cursor:]:
+            section.offset += shift
+            section.line += line_shift
+            patched.append(section)
+
+        self.sections = patched
+        self.signature = signature
+        self.size = signature[0]
+        for i, section in enumerate(patched):
+            next_offset = patched[i + 1].offset if i + 1 < len(patched) else self.size
+            section.length = next_offset - section.offset
+        self._reset_lookups()
+
+
+def get_library(path):
+    """Return the cached Library for path, re-reading it only if the file changed."""
+    library = _cache.get(path)
+    if library is not None and library.signature == file_signature(path):
+        return library
+    library = Library.load(path)
+    _cache[path] = library
+    return library
+
+
+def cached_library(path):
+    """Return the cached Library for path if it is current, without loading one."""
+    library = _cache.get(path)
+    if library is not None and library.signature == file_signature(path):
+        return library
+    return None
+
+
+def apply_splices(path, splices, before):
+    """
+    Keep the cached Library and its sidecar in step with a write. `before` is the
+    file's signature prior to the write; a cache built from anything else is dropped.
+    """
+    library = _cache.get(path)
+    if library is None or before is None or library.signature != before:
+        _cache.pop(path, None)
+        _dirty.discard(path)
+        invalidate_section_index(path)
+        return
+
+    library.apply_splices(splices, file_signature(path))
+    _dirty.add(path)
+
+
+def resync(path, splices, before):
+    """
+    Patch the section map after the library changed outside StudyVault. `splices`
+    describe the change against the content whose signature was `before`; the
+    cached Library is patched if it is at that signature, else the sidecar's rows
+    are. Returns False if neither was, leaving the map to be rebuilt.
+    """
+    library = _cache.get(path)
+    if library is None or library.signature != before:
+        _cache.pop(path, None)
+        data = load_json(index_path(path))
+        if not data or data.get("version") != INDEX_VERSION or data.get("signature") != before:
+            return False
+        library = Library(path, before, [Section(*row) for row in data["sections"]])
+    library.apply_splices(splices, file_signature(path))
+    _dirty.discard(path)
+    save_section_index(path, library.signature, [section.to_row() for section in library.sections])
+    return True
+
+
+def flush(path):
+    """Save the cached Library's sections to the sidecar if they are newer than it."""
+    library = _cache.get(path)
+    if path not in _dirty or library is None:
+        return
+    _dirty.discard(path)
+    if library.signature == file_signature(path):
+        save_section_index(path, library.signature, [section.to_row() for section in library.sections])
+
+
+def flush_all():
+    for path in list(_dirty):
+        try:
+            flush(path)
+        except OSError:
+            pass
+
+
+def restamp(path, before, after):
+    """The file's signature changed from `before` to `after` without its content changing."""
+    library = _cache.get(path)
+    if library is not None and library.signature == before:
+        library.signature = after
+        _dirty.add(path)
+        return
+    data = load_json(index_path(path))
+    if data and data.get("signature") == before:
+        save_section_index(path, after, data["sections"])
+
+
+def forget_library(path):
+    """Drop the cached Library for path."""
+    _cache.pop(path, None)
+    _dirty.discard(path)
@@ -0,0 +1,85 @@
+# studyvault/line_offsets.py
+#
+# Newline offset table: the byte offset at which every line of a library starts,
+# so a command that already knows its line numbers can seek straight to them
+# instead of counting newlines from the top of the file. Tables are built by the
+# background warm-up (studyvault.warmup) and kept per library, checked against
+# the library's signature; a write drops the table rather than patching it.
+
+from array import array
+from studyvault.fileio import file_signature
+from studyvault.instrument import count
+from studyvault.journal import open_library
+
+READ_BUFFER = 1024 * 1024
+
+# (signature, table) keyed by library path. table[0] is 0 and table[i] is the
+# offset just after the i-th newline, so line n starts at table[n - 1].
+_tables = {}
+
+
+def build(path):
+    """Scan the library once and cache its line table."""
+    signature = file_signature(path)
+    table = array('q', [0])
+    offset = 0
+    with open_library(path) as f:
+        while True:
+            chunk = f.read(READ_BUFFER)
+            if not chunk:
+                break
+            position = chunk.find(b"\n")
+            while position != -1:
+                table.append(offset + position + 1)
+                position = chunk.find(b"\n", position + 1)
+            offset += len(chunk)
+    count(bytes_read=offset)
+    _tables[path] = (signature, table)
+    return table
+
+
+def current(path):
+    """Return the cached line table if it matches the library, without building one."""
+    cached = _tables.get(path)
+    if cached is not None and cached[0] == file_signature(path):
+        return cached[1]
+    return None
+
+
+def get(path):
+    """Return the line table for path, building it if it is missing or stale."""
+    table = current(path)
+    return table if table is not None else build(path)
+
+
+def read_lines(path, table, line_numbers):
+    """
+    Yield (line_number, offset, raw_bytes) for the given line numbers, in order,
+    reading only those lines; numbers past the end of the library are skipped.
+    """
+    with open_library(path) as f:
+        for line_number in sorted(set(line_numbers)):
+            if line_number < 1 or line_number > len(table):
+                continue
+            offset = table[line_number - 1]
+            f.seek(offset)
+            if line_number < len(table):
+                raw = f.read(table[line_number] - offset)
+            else:
+                raw = f.readline()
+                if not raw:
+                    continue
+            count(bytes_read=len(raw), lines_scanned=1)
+            yield line_number, offset, raw
+
+
+def restamp(path, before, after):
+    """The library's signature changed from `before` to `after` without its content changing."""
+    cached = _tables.get(path)
+    if cached is not None and cached[0] == before:
+        _tables[path] = (after, cached[1])
+
+
+def invalidate(path):
+    """Drop the cached table of a library (after a write)."""
+    _tables.pop(path, None)
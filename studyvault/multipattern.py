@@ -0,0 +1,236 @@
+# studyvault/multipattern.py
+#
+# Replace or delete many literal strings in one pass over a library. The strings
+# are compiled into a single regex shaped like their trie (a multi-pattern
+# automaton run by the C regex engine): shared prefixes are matched once and each
+# branch point only tries the characters that can follow, so the cost follows the
+# size of the text and the length of the longest string, not how many there are.
+# Hits are leftmost-longest and never overlap, replacement text is never rescanned,
+# and every changed line becomes one splice of a single commit.
+
+import re
+from studyvault.edits import Splice, commit
+from studyvault.instrument import count
+from studyvault.journal import open_library
+from studyvault.library import get_library
+from studyvault.search import char_pattern
+
+SCOPES = ("first", "all")
+# Bytes read per step; blocks always end on a line boundary.
+SCAN_CHUNK = 8 * 1024 * 1024
+# Trie key marking that a pattern ends at a node (fragments are never empty).
+_END = b""
+
+
+def _node_source(node):
+    branches = []
+    for fragment, child in node.items():
+        if fragment == _END:
+            continue
+        parts = [fragment]
+        # Fold chains of single-child nodes into one literal run.
+        while len(child) == 1 and _END not in child:
+            (fragment, child), = child.items()
+            parts.append(fragment)
+        branches.append(b"".join(parts) + _node_source(child))
+    if not branches:
+        return b""
+    if len(branches) == 1 and _END not in node:
+        return branches[0]
+    group = b"(?:" + b"|".join(branches) + b")"
+    # Greedy, so a longer pattern running through this node wins over the one ending here.
+    return group + b"?" if _END in node else group
+
+
+def trie_source(sequences):
+    """Regex source for the trie of the given sequences of per-character regex fragments."""
+    root = {}
+    for fragments in sequences:
+        node = root
+        for fragment in fragments:
+            node = node.setdefault(fragment, {})
+        node[_END] = None
+    return _node_source(root)
+
+
+class PatternSet:
+    """
+    Many literal strings compiled into one trie-shaped regex. Matching is exact, or
+    with ignore_case case-insensitive over bytes.lower() copies, like Search.
+    """
+
+    def __init__(self, patterns, ignore_case=False):
+        self.ignore_case = ignore_case
+        self.patterns = []
+        self._index = {}
+        for text in patterns:
+            if not isinstance(text, str) or not text:
+                raise ValueError("Patterns must be non-empty strings.")
+            if "\n" in text or "\r" in text:
+                raise ValueError("Patterns cannot span lines.")
+            key = self._key(text)
+            if key not in self._index:
+                self._index[key] = len(self.patterns)
+                self.patterns.append(text)
+        if not self.patterns:
+            raise ValueError("No patterns given.")
+        self.regex = self.compile(range(len(self.patterns)))
+
+    def _key(self, text):
+        return text.casefold() if self.ignore_case else text
+
+    def compile(self, indexes):
+        """Compile the regex for a subset of the patterns, given by index."""
+        if self.ignore_case:
+            sequences = ([char_pattern(char) for char in self.patterns[i]] for i in indexes)
+        else:
+            sequences = ([re.escape(char.encode('utf-8')) for char in self.patterns[i]] for i in indexes)
+        return re.compile(trie_source(sequences))
+
+    def prepare(self, data):
+        return data.lower() if self.ignore_case else data
+
+    def index_of(self, raw):
+        """Return the index of the pattern a matched bytes string stands for, or None."""
+        return self._index.get(self._key(raw.decode('utf-8')))
+
+
+def _region(path, section):
+    """Return (start, end, first_line) of the bytes to rewrite; end None means end of file."""
+    if section is None:
+        return 0, None, 1
+    found = get_library(path).find_by_title(f"## {section}".strip())
+    if found is None:
+        raise ValueError(f"Section not found: {section}")
+    return found.offset, found.offset + found.length, found.line
+
+
+def _blocks(path, start, end):
+    """Yield (offset, data) for the bytes in [start, end), in blocks ending on line boundaries."""
+    offset = start
+    try:
+        with open_library(path) as f:
+            f.seek(start)
+            while end is None or offset < end:
+                data = f.read(SCAN_CHUNK if end is None else min(SCAN_CHUNK, end - offset))
+                if not data:
+                    return
+                if not data.endswith(b"\n"):
+                    data += f.readline()
+                yield offset, data
+                offset += len(data)
+    finally:
+        count(bytes_read=offset - start)
+
+
+def rewrite(path, patterns, replacements=None, scope="all", section=None, lines=None):
+    """
+    Rewrite the hits of a PatternSet in one pass and one commit. replacements[i] is
+    the bytes pattern i becomes; None deletes every hit. scope 'first' rewrites only
+    the first hit of each pattern, 'all' every hit. section (a title without '## ')
+    and lines (1-based line numbers) limit where hits count. Returns a dict with the
+    number of replacements, changed lines and the patterns that were never found.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown scope '{scope}'.")
+    start, end, line_number = _region(path, section)
+    wanted = set(lines) if lines is not None else None
+    last_wanted = max(wanted, default=0) if wanted is not None else None
+
+    hits = [0] * len(patterns.patterns)
+    remaining = compiled_for = len(patterns.patterns)
+    regex = patterns.regex
+    splices = []
+    replaced = 0
+    done = False
+
+    for offset, data in _blocks(path, start, end):
+        text = patterns.prepare(data)
+        size = len(data)
+        position = counted = 0
+        line_start = line_end = -1
+        pieces = []
+        cursor = 0
+
+        while not done:
+            match = regex.search(text, position)
+            if match is None:
+                break
+            hit_start, hit_end = match.span()
+            if hit_start >= line_end + 1 or line_start < 0:
+                if pieces:
+                    pieces.append(data[cursor:line_end])
+                    splices.append(Splice(offset + line_start, data[line_start:line_end], b"".join(pieces)))
+                    pieces = []
+                found_start = data.rfind(b"\n", 0, hit_start) + 1
+                line_number += data.count(b"\n", counted, found_start)
+                counted = found_start
+                found_end = data.find(b"\n", hit_start)
+                found_end = size if found_end == -1 else found_end
+                if last_wanted is not None and line_number > last_wanted:
+                    done = True
+                    break
+                if wanted is not None and line_number not in wanted:
+                    position = found_end + 1
+                    continue
+                line_start, line_end, cursor = found_start, found_end, found_start
+
+            i = patterns.index_of(data[hit_start:hit_end])
+            if (i is None and replacements is not None) or (scope == "first" and i is not None and hits[i]):
+                # Already used up; a shorter or later pattern may still start past here.
+                position = hit_start + 1
+                continue
+            pieces.append(data[cursor:hit_start])
+            pieces.append(b"" if replacements is None else replacements[i])
+            cursor = position = hit_end
+            replaced += 1
+            if i is not None:
+                hits[i] += 1
+                if scope == "first" and hits[i] == 1:
+                    remaining -= 1
+                    if remaining == 0:
+                        done = True
+                    elif remaining * 2 <= compiled_for:
+                        # Drop used patterns so their later hits are not even looked at.
+                        regex = patterns.compile(j for j, n in enumerate(hits) if not n)
+                        compiled_for = remaining
+
+        if pieces:
+            pieces.append(data[cursor:line_end])
+            splices.append(Splice(offset + line_start, data[line_start:line_end], b"".join(pieces)))
+        line_number += data.count(b"\n", counted)
+        if done:
+            break
+
+    if splices:
+        verb = "delete" if replacements is None else "replace"
+        commit(path, splices, label=f"{verb} {len(patterns.patterns)} string(s)")
+    return {
+        "replacements": replaced,
+        "lines": len(splices),
+        "unmatched": [text for text, n in zip(patterns.patterns, hits) if not n],
+    }
+
+
+def replace_many(path, replacements, scope="all", section=None, lines=None):
+    """
+    Replace many strings in one pass. replacements maps old text to new text (or is
+    a list of pairs); matching is case-sensitive, like update_text_in_file().
+    """
+    replacements = dict(replacements)
+    if any(not isinstance(new, str) for new in replacements.values()):
+        raise ValueError("Replacement text must be a string.")
+    patterns = PatternSet(replacements)
+    new = [replacements[text].encode('utf-8') for text in patterns.patterns]
+    return rewrite(path, patterns, new, scope, section, lines)
+
+
+def delete_many(path, keywords, scope="all", section=None, lines=None):
+    """Delete many keywords in one pass, case-insensitively like Delete."""
+    return rewrite(path, PatternSet(keywords, ignore_case=True), None, scope, section, lines)
+
+
+def rewrite_summary(stats, verb="Replaced"):
+    """One-line, human-readable summary of a rewrite() result."""
+    missing = f", {len(stats['unmatched'])} pattern(s) not found" if stats["unmatched"] else ""
+    return f"{verb} {stats['replacements']} occurrence(s) on {stats['lines']} line(s){missing}"
@@ -0,0 +1,81 @@
+# studyvault/pager.py
+#
+# Paged output for long result lists. Rows are formatted only when their page is
+# shown, and a page is joined into one markup string and printed with a single
+# console.print (without rich's repr highlighting or re-wrapping, which cost more
+# than the text itself). Interactive views stop after each page with a "show
+# more" prompt and stop for good at a cap; scripted output prints every row in
+# large batches without stopping.
+
+from studyvault.console import console
+
+# Rows per interactive page, and per print when nothing prompts.
+PAGE_ROWS = 50
+BATCH_ROWS = 1000
+# Rows an interactive view shows at most.
+RESULT_CAP = 5000
+
+
+class Pager:
+    """
+    Collects rows of markup and prints them a page at a time. With interactive=True
+    it asks before each further page ('a' shows the rest without asking, 'q' stops);
+    `cap` bounds how many rows are ever shown. Call close() at the end.
+    """
+
+    def __init__(self, interactive=True, cap=RESULT_CAP, page_rows=PAGE_ROWS, total=None):
+        self.interactive = interactive
+        self.cap = cap
+        self.page_rows = page_rows if interactive else BATCH_ROWS
+        self.total = total
+        self.shown = 0
+        self.hidden = 0
+        self.stopped = False
+        self._page = []
+
+    @property
+    def full(self):
+        """True once no further row will be shown (stopped, or at the cap)."""
+        return self.stopped or (self.cap is not None and self.shown + len(self._page) >= self.cap)
+
+    def add(self, markup):
+        """Queue one row of markup; it is printed when its page fills up."""
+        if self.full:
+            self.hidden += 1
+            return
+        self._page.append(markup)
+        if len(self._page) >= self.page_rows:
+            self._flush()
+            self._ask()
+
+    def extend(self, rows, format_row):
+        """Queue format_row(row) for each row; rows past the cap are counted, not formatted."""
+        for i, row in enumerate(rows):
+            if self.full:
+                self.hidden += len(rows) - i if hasattr(rows, "__len__") else 1 + sum(1 for _ in rows)
+                return
+            self.add(format_row(row))
+
+    def close(self):
+        """Print the last partial page and say how many rows were left out."""
+        self._flush()
+        if self.hidden:
+            reason = "stopped" if self.stopped else f"showing the first {self.shown}"
+            console.print(f"[dim]... {self.hidden} more not shown ({reason}).[/dim]")
+
+    def _flush(self):
+        if self._page:
+            console.print("\n".join(self._page), highlight=False, soft_wrap=True)
+            self.shown += len(self._page)
+            self._page = []
+
+    def _ask(self):
+        if not self.interactive or self.full:
+            return
+        of = f" of {self.total}" if self.total is not None else ""
+        answer = input(f"-- {self.shown}{of} shown: Enter for more, 'a' for all, 'q' to stop -- ").strip().lower()
+        if answer == "q":
+            self.stopped = True
+        elif answer == "a":
+            self.interactive = False
+            self.page_rows = BATCH_ROWS
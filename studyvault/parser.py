@@ -0,0 +1,103 @@
+# studyvault/parser.py
+
+from studyvault.instrument import count
+from studyvault.journal import open_library
+
+READ_CHUNK = 1024 * 1024
+
+
+def header_title(raw_line):
+    """Return the stripped header text if a raw (bytes) line starts a '## ' section, else None."""
+    if b"## " not in raw_line:
+        return None
+    stripped = raw_line.decode('utf-8').strip()
+    if stripped.startswith("## "):
+        return stripped
+    return None
+
+
+def iter_lines(path, start=0):
+    """
+    Yield (line_number, byte_offset, raw_bytes) for each line, reading lazily.
+    When start > 0 reading begins at the first line starting at or after start,
+    and line numbers are None because the lines before it were never counted.
+    """
+    scanned = 0
+    with open_library(path) as f:
+        position = start
+        line_number = 1
+        if start > 0:
+            line_number = None
+            f.seek(start - 1)
+            if f.read(1) != b"\n":
+                position += len(f.readline())
+
+        try:
+            for scanned, raw in enumerate(f, 1):
+                yield line_number, position, raw
+                position += len(raw)
+                if line_number is not None:
+                    line_number += 1
+        finally:
+            count(bytes_read=position - start, lines_scanned=scanned)
+
+
+def iter_sections(path, start=0, with_lines=True):
+    """
+    Yield (title, start_line, byte_offset, lines) for each section of a library, one
+    section in memory at a time. `lines` are the decoded lines after the header, with
+    their line endings (always empty when with_lines is False). Text before the first
+    '## ' header is yielded with title None. When start > 0, parsing begins at the
+    first header at or after that byte offset.
+    """
+    title = None
+    section_line = 1
+    section_offset = 0
+    lines = []
+    in_section = start == 0
+
+    for line_number, offset, raw in iter_lines(path, start):
+        header = header_title(raw)
+        if header is not None:
+            if in_section and (title is not None or lines):
+                yield title, section_line, section_offset, lines
+            title, section_line, section_offset, lines = header, line_number, offset, []
+            in_section = True
+        elif in_section and with_lines:
+            lines.append(raw.decode('utf-8'))
+
+    if in_section and (title is not None or lines):
+        yield title, section_line, section_offset, lines
+
+
+def split_lines(data):
+    """Split bytes into lines on '\\n' only, keeping the line endings."""
+    parts = data.split(b"\n")
+    lines = [part + b"\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def find_bytes(path, needle, start=0):
+    """Return the byte offset of the first occurrence of needle, reading in bounded chunks."""
+    if not needle:
+        return start
+    overlap = len(needle) - 1
+    with open_library(path) as f:
+        f.seek(start)
+        base = start
+        carry = b""
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                count(bytes_read=f.tell() - start)
+                return -1
+            data = carry + chunk
+            found = data.find(needle)
+            if found != -1:
+                count(bytes_read=f.tell() - start)
+                return base + found
+            keep = data[-overlap:] if overlap else b""
+            base += len(data) - len(keep)
+            carry = keep
@@ -0,0 +1,387 @@
+# studyvault/pdf_export.py
+#
+# PDF export laid out from each section's rendered HTML (studyvault.render):
+# headings, paragraphs, lists, quotes, code blocks, tables and rules, with bold,
+# italic, code and links kept inline. A section's layout does not depend on where
+# it lands on a page, so its lines are cached in <library>.md.pdfcache (an
+# append-only studyvault.blockcache) under the same hash as its HTML, and an
+# export only lays out, renders and writes the sections that changed; placing
+# cached lines on pages is cheap.
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.rl_accel import escapePDF
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from studyvault.blockcache import BlockCache
+from studyvault.fileio import sidecar_path
+from studyvault.render import iter_blocks, render_blocks
+
+CACHE_SUFFIX = "pdfcache"
+CACHE_VERSION = 4
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 40
+BODY_SIZE = 11
+HEADING_SIZES = {"h1": 20, "h2": 16, "h3": 13.5, "h4": 12, "h5": 11, "h6": 11}
+CODE_SIZE = 9.5
+LINE_SPACING = 1.3
+INDENT = 18
+# Space before headings and after every block, in points.
+HEADING_SPACE = 8
+BLOCK_SPACE = 4
+# Fill colours by the name stored in the cache.
+COLORS = {"link": (0, 0, 0.8), "quote": (0.4, 0.4, 0.4)}
+STYLE_SUFFIXES = {(False, False): "", (True, False): "-Bold", (False, True): "-Oblique", (True, True): "-BoldOblique"}
+# Page streams are compressed; wrapping them in ASCII85 as well only makes the
+# file bigger and, without reportlab's C accelerator, takes most of the save.
+rl_config.useA85 = 0
+
+# Characters a PDF string needs escaped, for the plain-ASCII fast path.
+_ESCAPES = str.maketrans({"\\": "\\\\", "(": "\\(", ")": "\\)"})
+# Width of a word at size 1000, by (font, word); words repeat a lot across a library.
+_widths = {}
+
+
+def cache_path(path):
+    return sidecar_path(path, CACHE_SUFFIX)
+
+
+def _font(bold, italic, mono):
+    return ("Courier" if mono else "Helvetica") + STYLE_SUFFIXES[(bold, italic)]
+
+
+def _width(text, font, size):
+    width = _widths.get((font, text))
+    if width is None:
+        width = _widths[(font, text)] = stringWidth(text, font, 1000)
+    return width * size / 1000
+
+
+class _Blocks(HTMLParser):
+    """
+    Turn one section's HTML into blocks: ("text", tag, runs, bullet, depth) where
+    runs are (text, bold, italic, mono, color) and text None is a line break,
+    ("pre", text, depth) and ("hr",). Table rows become text blocks.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.runs = []
+        self.tag = "p"
+        self.bullet = None
+        self.lists = []
+        self.quotes = 0
+        self.bold = self.italic = self.mono = self.links = 0
+        self.pre = None
+        self.cells = None
+
+    def _depth(self):
+        return len(self.lists) + self.quotes
+
+    def flush(self):
+        if any(text and text.strip() for text, *_ in self.runs):
+            self.blocks.append(("text", self.tag, self.runs, self.bullet, self._depth()))
+            self.tag, self.bullet = "p", None
+        self.runs = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.pre is not None:
+            return
+        if tag in ("strong", "b", "th"):
+            self.bold += 1
+        elif tag in ("em", "i"):
+            self.italic += 1
+        elif tag == "code":
+            self.mono += 1
+        elif tag == "a":
+            self.links += 1
+        elif tag == "br":
+            self.runs.append((None, False, False, False, None))
+        elif tag == "img":
+            self.handle_data(dict(attrs).get("alt") or "")
+        elif tag in HEADING_SIZES or tag == "p":
+            self.flush()
+            self.tag = tag
+        elif tag in ("ul", "ol"):
+            self.flush()
+            self.lists.append([tag == "ol", 0])
+        elif tag == "li":
+            self.flush()
+            if self.lists:
+                self.lists[-1][1] += 1
+                ordered, number = self.lists[-1]
+                self.bullet = f"{number}." if ordered else "•"
+        elif tag == "blockquote":
+            self.flush()
+            self.quotes += 1
+        elif tag == "pre":
+            self.flush()
+            self.pre = []
+        elif tag == "hr":
+            self.flush()
+            self.blocks.append(("hr",))
+        elif tag == "tr":
+            self.flush()
+            self.cells = 0
+        if tag in ("td", "th") and self.cells is not None:
+            if self.cells:
+                self.runs.append((" | ", False, False, False, None))
+            self.cells += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.pre is not None:
+            if tag == "pre":
+                self.blocks.append(("pre", "".join(self.pre).rstrip("\n"), self._depth()))
+                self.pre = None
+            return
+        if tag in ("strong", "b", "th"):
+            self.bold = max(self.bold - 1, 0)
+        elif tag in ("em", "i"):
+            self.italic = max(self.italic - 1, 0)
+        elif tag == "code":
+            self.mono = max(self.mono - 1, 0)
+        elif tag == "a":
+            self.links = max(self.links - 1, 0)
+        elif tag in ("ul", "ol"):
+            self.flush()
+            if self.lists:
+                self.lists.pop()
+        elif tag == "blockquote":
+            self.flush()
+            self.quotes = max(self.quotes - 1, 0)
+        elif tag == "tr":
+            self.flush()
+            self.cells = None
+        elif tag in HEADING_SIZES or tag in ("p", "li"):
+            self.flush()
+
+    def handle_data(self, data):
+        if self.pre is not None:
+            self.pre.append(data)
+            return
+        color = "link" if self.links else "quote" if self.quotes else None
+        self.runs.append((data, bool(self.bold), bool(self.italic), bool(self.mono), color))
+
+    def close(self):
+        super().close()
+        self.flush()
+        return self.blocks
+
+
+def _fragment(x, font, size, color, text):
+    """A cached piece of a line: the PDF string operand is None when the base font cannot encode the text."""
+    if text.isascii() and text.isprintable():
+        operand = f"({text.translate(_ESCAPES)})"
+    else:
+        try:
+            operand = f"({escapePDF(text.encode('cp1252'))})"
+        except UnicodeEncodeError:
+            operand = None
+    return [round(x, 2), font, size, color, text, operand]
+
+
+def _wrap(runs, size, heading, x0, width):
+    """Break runs into lines of fragments [x, font, size, color, text] no wider than width."""
+    # Widths are compared at size 1000, as _width caches them.
+    limit = width * 1000 / size
+    lines = []
+    line = []
+    x = 0
+    space = False
+    for text, bold, italic, mono, color in runs:
+        if text is None:
+            lines.append(line)
+            line, x, space = [], 0, False
+            continue
+        font = _font(bold or heading, italic, mono)
+        space_width = _width(" ", font, 1000)
+        if text[:1].isspace():
+            space = True
+        for word in text.split():
+            word_width = _width(word, font, 1000)
+            gap = space_width if space and line else 0
+            if line and x + gap + word_width > limit:
+                lines.append(line)
+                line, x, gap = [], 0, 0
+            while word_width > limit and len(word) > 1:
+                # A word longer than the line is cut where it no longer fits.
+                cut = 1
+                while cut < len(word) and _width(word[:cut + 1], font, 1000) <= limit:
+                    cut += 1
+                if line:
+                    lines.append(line)
+                line = [[x0, font, size, color, [word[:cut]]]]
+                lines.append(line)
+                line, x, gap, word = [], 0, 0, word[cut:]
+                word_width = _width(word, font, 1000)
+            last = line[-1] if line else None
+            if last is not None and last[1] == font and last[3] == color:
+                if gap:
+                    last[4].append(" ")
+                last[4].append(word)
+            else:
+                line.append([x0 + (x + gap) * size / 1000, font, size, color, [word]])
+            x += gap + word_width
+            space = True
+        space = text[-1:].isspace() or (space and not text.strip())
+    if line or not lines:
+        lines.append(line)
+    for line in lines:
+        for fragment in line:
+            fragment[4] = "".join(fragment[4])
+    return lines
+
+
+def layout_section(section_html):
+    """
+    Lay out one section's HTML as lines [advance, fragments]: advance is how far
+    the line's baseline sits below the previous one, fragments are
+    [x, font, size, color, text, operand] (None for a horizontal rule).
+    """
+    parser = _Blocks()
+    parser.feed(section_html)
+    result = []
+    for block in parser.close():
+        if block[0] == "hr":
+            result.append([BLOCK_SPACE * 2, None])
+            continue
+        if block[0] == "pre":
+            _, text, depth = block
+            x0 = MARGIN + INDENT * (depth + 1)
+            columns = max(int((PAGE_WIDTH - MARGIN - x0) // _width("m", "Courier", CODE_SIZE)), 1)
+            for source_line in text.split("\n"):
+                for start in range(0, max(len(source_line), 1), columns):
+                    piece = source_line[start:start + columns]
+                    fragments = [_fragment(x0, "Courier", CODE_SIZE, None, piece)] if piece else []
+                    result.append([CODE_SIZE * LINE_SPACING, fragments])
+            result.append([BLOCK_SPACE, []])
+            continue
+
+        _, tag, runs, bullet, depth = block
+        size = HEADING_SIZES.get(tag, BODY_SIZE)
+        x0 = MARGIN + INDENT * depth
+        lines = _wrap(runs, size, tag in HEADING_SIZES, x0, PAGE_WIDTH - MARGIN - x0)
+        for i, line in enumerate(lines):
+            fragments = [_fragment(*fragment) for fragment in line]
+            if i == 0 and bullet:
+                fragments.insert(0, _fragment(x0 - 12, "Helvetica", size, None, bullet))
+            advance = size * LINE_SPACING + (HEADING_SPACE if i == 0 and tag in HEADING_SIZES else 0)
+            result.append([advance, fragments])
+        result.append([BLOCK_SPACE, []])
+    return result
+
+
+class _Page:
+    """Writes cached lines to the canvas, batching encodable fragments into one text block."""
+
+    def __init__(self, c):
+        self.c = c
+        self.refs = {}
+        self.ops = []
+        self.font = self.color = None
+
+    def _ref(self, font):
+        ref = self.refs.get(font)
+        if ref is None:
+            text = self.c.beginText()
+            text.setFont(font, BODY_SIZE)
+            ref = self.refs[font] = re.search(r"/(\S+) [\d.]+ Tf", text.getCode()).group(1)
+        return ref
+
+    def flush(self):
+        if self.ops:
+            self.c.addLiteral("BT\n" + "\n".join(self.ops) + "\nET")
+            self.ops = []
+        self.font = self.color = None
+
+    def draw(self, y, fragments):
+        if fragments is None:
+            self.flush()
+            self.c.addLiteral(f"0.6 G 0.5 w {MARGIN} {y + 3:.2f} m {PAGE_WIDTH - MARGIN} {y + 3:.2f} l S")
+            return
+        for x, font, size, color, text, operand in fragments:
+            if operand is None:
+                # Characters outside the base font go through reportlab, which substitutes fonts.
+                self.flush()
+                text_object = self.c.beginText(x, y)
+                text_object.setFont(font, size)
+                text_object.setFillColorRGB(*COLORS.get(color, (0, 0, 0)))
+                text_object.textOut(text)
+                self.c.drawText(text_object)
+                continue
+            if (font, size) != self.font:
+                self.ops.append(f"/{self._ref(font)} {size} Tf")
+                self.font = (font, size)
+            if color != self.color:
+                self.ops.append("%g %g %g rg" % COLORS.get(color, (0, 0, 0)))
+                self.color = color
+            self.ops.append(f"1 0 0 1 {x} {y:.2f} Tm {operand} Tj")
+
+
+def export(path, output_pdf_path, workers=None):
+    """
+    Write the library to a PDF. Sections whose layout is not cached are rendered
+    to HTML (through the render cache, on `workers` processes when there are many)
+    and laid out; the rest are placed from the cache. Returns (sections laid out,
+    sections reused).
+    """
+    cache = BlockCache(path, CACHE_SUFFIX, {"version": CACHE_VERSION})
+    keys = []
+    missing = {}
+    for key, data in iter_blocks(path):
+        keys.append(key)
+        if key not in cache and key not in missing:
+            missing[key] = data
+    layouts = {}
+    if missing:
+        rendered, _ = render_blocks(path, missing, keys, workers)
+        layouts = {key: layout_section(section_html) for key, section_html in rendered.items()}
+        cache.add(layouts)
+
+    c = canvas.Canvas(output_pdf_path, pagesize=letter)
+    page = _Page(c)
+    top = PAGE_HEIGHT - MARGIN
+    y = top
+    for key in keys:
+        lines = layouts.get(key)
+        if lines is None:
+            lines = layouts[key] = cache.get(key)
+        for advance, fragments in lines:
+            y -= advance
+            if y < MARGIN:
+                page.flush()
+                c.showPage()
+                y = top - advance
+            if fragments or fragments is None:
+                page.draw(y, fragments)
+    page.flush()
+    c.save()
+
+    cache.prune(keys)
+    return len(missing), len(layouts) - len(missing)
+
+
+def _export_job(job):
+    path, output_pdf_path = job
+    try:
+        # Libraries are already spread over processes; each renders in its own.
+        export(path, output_pdf_path, workers=1)
+        return path, None
+    except Exception as e:
+        return path, str(e)
+
+
+def export_many(jobs, workers=None):
+    """
+    Export several (library_path, output_pdf_path) pairs on a process pool. Yields
+    (library_path, error) as each finishes; error is None on success.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_export_job, jobs)
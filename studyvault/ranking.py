@@ -0,0 +1,231 @@
+# studyvault/ranking.py
+#
+# Ranked section search. Sections are scored with BM25 from the search index's
+# postings (term frequency per line, grouped into sections by the cached Library),
+# so the cost follows the postings of the query terms, not the size of the text.
+# Only the top-k sections are read back from disk, to cut their snippets. SQLite
+# libraries are ranked by their own FTS5 index instead. rank_matches() orders the
+# sections Search finds by substring the same way, for the menu's Search, by
+# ranking only those sections.
+
+import heapq
+import math
+import re
+from collections import namedtuple
+from studyvault.library import get_library
+from studyvault.parser import iter_sections
+from studyvault.section_index import read_section
+from studyvault import search_index, storage
+
+# Standard BM25 parameters: term-frequency saturation and length normalisation.
+K1 = 1.2
+B = 0.75
+SNIPPET_CHARS = 160
+
+# `line` is the header's line number (1 for text before the first header) and
+# `highlights` the (start, end) character spans of query terms inside `snippet`.
+RankedSection = namedtuple("RankedSection", ["score", "title", "line", "snippet", "highlights"])
+
+
+def query_terms(text):
+    """Return the distinct index tokens of a query, in query order."""
+    return list(dict.fromkeys(search_index.TOKEN_RE.findall(text.lower())))
+
+
+def bm25(tf, length, average_length, idf):
+    return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+
+
+def idf(document_count, document_frequency):
+    return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def _top(scores, k):
+    """The k best (index, score) pairs; ties go to the earlier section."""
+    return heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _score(terms, frequencies, lengths, document_count, total_tokens):
+    """Turn {term: {section: tf}} and {section: length} into {section: score}."""
+    average_length = total_tokens / document_count if document_count and total_tokens else 1.0
+    scores = {}
+    for term in terms:
+        per_section = frequencies.get(term)
+        if not per_section:
+            continue
+        weight = idf(document_count, len(per_section))
+        for i, tf in per_section.items():
+            scores[i] = scores.get(i, 0.0) + bm25(tf, lengths[i], average_length, weight)
+    return scores
+
+
+def snippet(lines, terms):
+    """
+    Pick the line with the most distinct query terms and cut a window of about
+    SNIPPET_CHARS around its first hit. Returns (snippet, [(start, end)]).
+    """
+    wanted = set(terms)
+    best, best_hits = "", 0
+    for line in lines:
+        line = line.strip()
+        hits = {token.lower() for token in search_index.TOKEN_RE.findall(line)} & wanted
+        if len(hits) > best_hits:
+            best, best_hits = line, len(hits)
+    if not best:
+        best = next((line.strip() for line in lines if line.strip()), "")
+
+    spans = [match.span() for match in search_index.TOKEN_RE.finditer(best) if match.group().lower() in wanted]
+    return _window(best, spans)
+
+
+def _window(best, spans):
+    """Cut about SNIPPET_CHARS of best around its first span; returns (snippet, spans in it)."""
+    start = 0
+    if len(best) > SNIPPET_CHARS and spans:
+        start = max(0, min(spans[0][0] - SNIPPET_CHARS // 4, len(best) - SNIPPET_CHARS))
+    text = best[start:start + SNIPPET_CHARS]
+    spans = [(a - start, b - start) for a, b in spans if a >= start and b <= start + SNIPPET_CHARS]
+    if start > 0:
+        text = "…" + text
+        spans = [(a + 1, b + 1) for a, b in spans]
+    if start + SNIPPET_CHARS < len(best):
+        text += "…"
+    return text, spans
+
+
+def _rank_indexed(path, conn, terms, k, within=None):
+    library = get_library(path)
+    sections = library.sections
+    has_preamble = library.preamble_length() > 0
+    document_count = len(sections) + (1 if has_preamble else 0)
+
+    frequencies = {}
+    for term in terms:
+        per_section = {}
+        for line_number, tf in search_index.term_postings(conn, term):
+            i = library.section_index_at_line(line_number)
+            per_section[i] = per_section.get(i, 0) + tf
+        if per_section:
+            frequencies[term] = per_section
+
+    candidates = set()
+    for per_section in frequencies.values():
+        candidates.update(per_section)
+    ranges = []
+    for i in candidates:
+        first = sections[i].line if i >= 0 else 1
+        last = sections[i + 1].line - 1 if i + 1 < len(sections) else 2 ** 62
+        ranges.append((i, first, last))
+    lengths = search_index.tokens_in_ranges(conn, ranges)
+
+    scores = _score(terms, frequencies, lengths, document_count, search_index.total_tokens(conn))
+    if within is not None:
+        scores = {i: score for i, score in scores.items() if (sections[i].line if i >= 0 else 1) in within}
+    results = []
+    for i, score in _top(scores, k):
+        if i < 0:
+            title, line, body = "Untitled", 1, read_section(path, 0, library.preamble_length())
+        else:
+            section = sections[i]
+            title, line = section.title, section.line
+            parts = read_section(path, section.offset, section.length).split("\n", 1)
+            body = parts[1] if len(parts) > 1 else ""
+        text, spans = snippet(body.split("\n"), terms)
+        results.append(RankedSection(round(score, 4), title, line, text, spans))
+    return results
+
+
+def _rank_fts(path, terms, k, within=None):
+    """SQLite libraries rank with their own FTS5 index, whose BM25 counts the header too."""
+    from studyvault import sqlite_store
+    results = []
+    for score, title, line, body in sqlite_store.rank(path, terms, k, within):
+        if title is not None:
+            parts = body.split("\n", 1)
+            body = parts[1] if len(parts) > 1 else ""
+        text, spans = snippet(body.split("\n"), terms)
+        results.append(RankedSection(round(score, 4), title or "Untitled", line, text, spans))
+    return results
+
+
+def _rank_by_scan(path, terms, k, within=None):
+    """Fallback when the index cannot be opened: one streaming pass over the library."""
+    wanted = set(terms)
+    frequencies = {}
+    lengths = {}
+    bodies = {}
+    document_count = 0
+    total_tokens = 0
+    for i, (title, line, _, lines) in enumerate(iter_sections(path)):
+        counts = search_index.token_counts(title or "")
+        for text in lines:
+            counts.update(search_index.token_counts(text))
+        document_count += 1
+        size = sum(counts.values())
+        total_tokens += size
+        hits = wanted.intersection(counts)
+        if hits and (within is None or line in within):
+            lengths[i] = size
+            bodies[i] = (title or "Untitled", line, lines)
+            for term in hits:
+                frequencies.setdefault(term, {})[i] = counts[term]
+
+    scores = _score(terms, frequencies, lengths, document_count, total_tokens)
+    results = []
+    for i, score in _top(scores, k):
+        title, line, lines = bodies[i]
+        text, spans = snippet(lines, terms)
+        results.append(RankedSection(round(score, 4), title, line, text, spans))
+    return results
+
+
+def rank_sections(path, text, k=10, within=None):
+    """
+    Return up to k RankedSections for the words of text, best first. A section's
+    header counts as part of its text. Words are matched as whole index tokens.
+    within, a set of header line numbers (1 for text before the first header),
+    limits the ranking to those sections; the statistics still cover them all.
+    """
+    terms = query_terms(text)
+    if not terms or k <= 0:
+        return []
+    if storage.kind(path) == storage.SQLITE:
+        return _rank_fts(path, terms, k, within)
+    conn = search_index.open_index(path)
+    if conn is None:
+        return _rank_by_scan(path, terms, k, within)
+    return _rank_indexed(path, conn, terms, k, within)
+
+
+def rank_matches(path, text, hits, k=10):
+    """
+    Order the sections holding the matching lines `hits` ([(line_number, line)],
+    as Search, Delete and section search find them): those sections are ranked
+    with BM25 for the words of text, and the ones it cannot score (the text is
+    only part of a word there) follow in file order.
+    Returns (number of sections with a hit, up to k RankedSections); unscored ones
+    have score 0 and a snippet cut around their first matching line.
+    """
+    library = get_library(path)
+    sections = library.sections
+    first_hit = {}
+    for line_number, line in hits:
+        i = library.section_index_at_line(line_number)
+        if i >= 0 and sections[i].line == line_number:
+            continue  # headers are not part of a section's searchable content
+        first_hit.setdefault(i, line)
+
+    headers = {section.line: i for i, section in enumerate(sections)}
+    within = {sections[i].line if i >= 0 else 1 for i in first_hit}
+    total = len(first_hit)
+    results = rank_sections(path, text, k, within) if first_hit else []
+    for match in results:
+        first_hit.pop(headers.get(match.line, -1), None)
+    pattern = re.compile(re.escape(text.strip()), re.IGNORECASE)
+    for i in sorted(first_hit)[:k - len(results)]:
+        line = first_hit[i].strip()
+        spans = [match.span() for match in pattern.finditer(line) if match.end() > match.start()]
+        snippet_text, spans = _window(line, spans)
+        title, header_line = ("Untitled", 1) if i < 0 else (sections[i].title, sections[i].line)
+        results.append(RankedSection(0.0, title, header_line, snippet_text, spans))
+    return total, results
@@ -0,0 +1,333 @@
+# studyvault/search.py
+#
+# One search engine for Search, Delete and section search. A query is compiled
+# once into a bytes pattern and run over an mmap of the library in large chunks;
+# line numbers come from counting newlines between hits, so lines that do not
+# match are never split, decoded or lower-cased. While journal edits are pending
+# the library is read through the journal's piece table in section-aligned parts
+# instead, so a search never rewrites the file; other backends hand over their
+# segments or section rows one buffer at a time.
+
+import re
+import shlex
+from bisect import bisect_right
+from functools import lru_cache
+from studyvault.fileio import mapped
+from studyvault.instrument import count
+from studyvault.journal import load as load_journal, open_library
+from studyvault.library import get_library
+from studyvault.parser import header_title
+from studyvault import storage
+
+MODES = ("literal", "regex", "all", "any")
+# Bytes scanned per step; chunks always end on a line boundary.
+SCAN_CHUNK = 8 * 1024 * 1024
+
+
+def _case_variants(char):
+    variants = {char, char.lower(), char.upper(), char.casefold(), char.title()}
+    # The buffer is searched with ASCII letters lower-cased (bytes.lower()).
+    return sorted({variant.encode('utf-8').lower() for variant in variants}, key=len, reverse=True)
+
+
+def char_pattern(char):
+    """Regex source matching one character case-insensitively in an ASCII-lower-cased UTF-8 buffer."""
+    variants = _case_variants(char) if not char.isascii() else [char.encode('utf-8').lower()]
+    if len(variants) == 1:
+        return re.escape(variants[0])
+    return b"(?:" + b"|".join(re.escape(v) for v in variants) + b")"
+
+
+def _literal_pattern(text):
+    """Regex source matching text case-insensitively in an ASCII-lower-cased UTF-8 buffer."""
+    return b"".join(char_pattern(char) for char in text)
+
+
+def _index_safe(text):
+    """True when every case variant of text lower-cases back to text.lower(), as the search index assumes."""
+    return all(
+        len(variant.decode('utf-8').lower()) == 1 and variant.decode('utf-8').lower() == char.lower()
+        for char in text if not char.isascii()
+        for variant in _case_variants(char)
+    )
+
+
+class Query:
+    """
+    A compiled search. `literal` matches the text case-insensitively; `regex` runs a
+    regular expression (case-insensitive for ASCII letters); `all` and `any` split the
+    text into terms (quotes keep phrases together) and need every or any term on a line.
+    """
+
+    def __init__(self, text, mode="literal"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown search mode '{mode}'.")
+        self.text = text
+        self.mode = mode
+        # Literal patterns run against bytes.lower() copies, regexes against raw bytes.
+        self.lowered = mode != "regex"
+        self.required = []
+
+        if mode == "regex":
+            try:
+                self.pattern = re.compile(text.encode('utf-8'), re.IGNORECASE | re.MULTILINE)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression: {e}")
+            return
+
+        if mode == "literal":
+            terms = [text]
+        else:
+            try:
+                terms = [term for term in shlex.split(text) if term] or [text]
+            except ValueError:
+                terms = text.split() or [text]
+        self.terms = terms
+
+        patterns = [_literal_pattern(term) for term in terms]
+        if mode == "any":
+            self.pattern = re.compile(b"|".join(patterns))
+        else:
+            # Scan for the longest term; check the others only on lines that have it.
+            order = sorted(range(len(terms)), key=lambda i: -len(terms[i]))
+            self.pattern = re.compile(patterns[order[0]])
+            self.required = [re.compile(patterns[i]) for i in order[1:]]
+
+    @property
+    def index_text(self):
+        """The literal the search index can answer this query with, or None."""
+        if self.mode == "literal" and _index_safe(self.text):
+            return self.text
+        return None
+
+    def prepare(self, data):
+        return data.lower() if self.lowered else data
+
+    def match_in(self, data, start, end):
+        """True if a line data[start:end] of a prepare()d buffer matches."""
+        if self.pattern.search(data, start, end) is None:
+            return False
+        return all(pattern.search(data, start, end) for pattern in self.required)
+
+    def matches(self, line):
+        """True if one line (str or bytes) matches."""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        data = self.prepare(line)
+        return self.match_in(data, 0, len(data))
+
+    def remove(self, line):
+        """Return the bytes line with every match of the query cut out (its line ending is kept)."""
+        ending = line[len(line.rstrip(b"\r\n")):]
+        line = line[:len(line) - len(ending)]
+        data = self.prepare(line)
+        patterns = [self.pattern] + self.required
+        spans = sorted(m.span() for pattern in patterns for m in pattern.finditer(data) if m.end() > m.start())
+        pieces = []
+        position = 0
+        for start, end in spans:
+            if end <= position:
+                continue
+            pieces.append(line[position:max(start, position)])
+            position = end
+        pieces.append(line[position:])
+        pieces.append(ending)
+        return b"".join(pieces)
+
+
+@lru_cache(maxsize=64)
+def compile_query(text, mode="literal"):
+    """Return the (cached) Query for text and mode; raises ValueError for a bad regex."""
+    return Query(text, mode)
+
+
+def _buffers(path, start=0, end=None):
+    """
+    Yield (offset, first_line, buffer) for the parts of the library overlapping
+    [start, end): an mmap of the whole .md file, or the segments or section rows of
+    another backend. Every part after the first starts on a section header.
+    """
+    backend = storage.backend(path)
+    if backend is not None:
+        yield from backend.scan(path, start, end)
+        return
+    if load_journal(path) is not None:
+        yield from _journal_parts(path, start, end)
+        return
+    with mapped(path) as buffer:
+        yield 0, 1, buffer
+
+
+def _journal_parts(path, start=0, end=None):
+    """
+    Yield (offset, first_line, bytes) for a library with pending journal edits: runs
+    of whole sections of about SCAN_CHUNK bytes, read through the piece table.
+    """
+    library = get_library(path)
+    # (offset, line) of every point a part may start at: the top and each header.
+    cuts = [(0, 1)] + [(section.offset, section.line) for section in library.sections if section.offset]
+    cuts.append((library.size, None))
+    with open_library(path) as f:
+        i = 0
+        while i < len(cuts) - 1:
+            offset, first_line = cuts[i]
+            j = i + 1
+            while j < len(cuts) - 1 and cuts[j + 1][0] - offset <= SCAN_CHUNK:
+                j += 1
+            part_end = cuts[j][0]
+            if (end is None or offset < end) and part_end > start:
+                f.seek(offset)
+                yield offset, first_line, f.read(part_end - offset)
+            i = j
+
+
+def _line_start_at_or_after(buffer, position):
+    if position <= 0:
+        return 0
+    if buffer[position - 1:position] == b"\n":
+        return position
+    newline = buffer.find(b"\n", position)
+    return len(buffer) if newline == -1 else newline + 1
+
+
+def iter_matching_lines(buffer, query, start=0, end=None):
+    """
+    Yield (line_start, line_end, newlines_before) for each line of buffer[start:end]
+    that matches. start must be a line start; line_end excludes the newline and
+    newlines_before counts the newlines between start and the line.
+    """
+    end = len(buffer) if end is None else end
+    newlines = 0
+    chunk_start = start
+    scanned = 0
+    try:
+        while chunk_start < end:
+            chunk_end = min(chunk_start + SCAN_CHUNK, end)
+            if chunk_end < end:
+                cut = buffer.rfind(b"\n", chunk_start, chunk_end)
+                if cut == -1:
+                    cut = buffer.find(b"\n", chunk_end, end)
+                chunk_end = end if cut == -1 else cut + 1
+            data = query.prepare(buffer[chunk_start:chunk_end])
+            scanned += len(data)
+
+            position = 0
+            counted = 0
+            size = len(data)
+            while position < size:
+                match = query.pattern.search(data, position)
+                if match is None:
+                    break
+                line_start = data.rfind(b"\n", 0, match.start()) + 1
+                line_end = data.find(b"\n", match.start())
+                if line_end == -1:
+                    line_end = size
+                # A regex may run past the end of the line, and `all` needs its other terms.
+                if (match.end() > line_end or query.required) and not query.match_in(data, line_start, line_end):
+                    position = line_end + 1
+                    continue
+                newlines += data.count(b"\n", counted, line_start)
+                counted = line_start
+                yield chunk_start + line_start, chunk_start + line_end, newlines
+                position = line_end + 1
+            newlines += data.count(b"\n", counted, size)
+            chunk_start = chunk_end
+    finally:
+        count(bytes_read=scanned, lines_scanned=newlines)
+
+
+def search_lines(path, query):
+    """Return [(line_number, stripped_line)] for every matching line."""
+    results = []
+    for _, first_line, buffer in _buffers(path):
+        results.extend(
+            (first_line + newlines, buffer[line_start:line_end].decode('utf-8').strip())
+            for line_start, line_end, newlines in iter_matching_lines(buffer, query)
+        )
+    return results
+
+
+def _headers(buffer, start, end):
+    """Return ([offset], [title]) of the '## ' header lines starting in [start, end)."""
+    offsets, titles = [], []
+    position = start
+    while True:
+        found = buffer.find(b"## ", position, end)
+        if found == -1:
+            break
+        line_start = buffer.rfind(b"\n", 0, found) + 1
+        line_end = buffer.find(b"\n", found)
+        line_end = len(buffer) if line_end == -1 else line_end + 1
+        title = header_title(buffer[line_start:line_end])
+        if title is not None and line_start >= start:
+            offsets.append(line_start)
+            titles.append(title)
+        position = line_end
+    return offsets, titles
+
+
+def _next_header(buffer, position):
+    """Return (offset, title) of the first header line starting at or after position."""
+    while True:
+        found = buffer.find(b"## ", position)
+        if found == -1:
+            return len(buffer), None
+        line_start = buffer.rfind(b"\n", 0, found) + 1
+        line_end = buffer.find(b"\n", found)
+        line_end = len(buffer) if line_end == -1 else line_end + 1
+        title = header_title(buffer[line_start:line_end])
+        if title is not None and line_start >= position:
+            return line_start, title
+        position = line_end
+
+
+def _content_lines(buffer, start, end):
+    """Stripped lines of buffer[start:end], split on '\\n' like the section parser."""
+    lines = buffer[start:end].decode('utf-8').split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return [line.strip() for line in lines]
+
+
+def search_sections(path, query, start=0, end=None):
+    """
+    Return [(section_title, [stripped content lines])] for sections with a matching
+    content line (headers are not searched). With a byte range, only sections whose
+    header starts in [start, end) are considered; the preamble belongs to start 0.
+    """
+    results = []
+    for offset, _, buffer in _buffers(path, start, end):
+        local_end = None if end is None else end - offset
+        results.extend(_sections_in(buffer, query, max(start - offset, 0), local_end))
+    return results
+
+
+def _sections_in(buffer, query, start, end):
+    """search_sections() over one buffer, with start and end relative to it."""
+    size = len(buffer)
+    end = size if end is None else min(end, size)
+    region_start = 0 if start == 0 else _next_header(buffer, _line_start_at_or_after(buffer, start))[0]
+    region_end = size if end >= size else _next_header(buffer, _line_start_at_or_after(buffer, end))[0]
+    if region_start >= region_end:
+        return []
+
+    hits = [line_start for line_start, _, _ in iter_matching_lines(buffer, query, region_start, region_end)]
+    if not hits:
+        return []
+    offsets, titles = _headers(buffer, region_start, region_end)
+
+    results = []
+    last = None
+    for line_start in hits:
+        i = bisect_right(offsets, line_start) - 1
+        if i == last or (i >= 0 and offsets[i] == line_start):
+            continue  # already reported, or the hit is the header line itself
+        last = i
+        if i < 0:
+            title, body_start = "Untitled", region_start
+        else:
+            title = titles[i]
+            body_start = buffer.find(b"\n", offsets[i]) + 1 or region_end
+        body_end = offsets[i + 1] if i + 1 < len(offsets) else region_end
+        results.append((title, _content_lines(buffer, body_start, body_end)))
+    return results
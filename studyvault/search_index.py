@@ -0,0 +1,458 @@
+# studyvault/search_index.py
+
+import os
+import re
+import sqlite3
+from collections import Counter
+from studyvault.fileio import sidecar_path, file_signature, remove_file
+from studyvault.journal import open_library
+from studyvault.parser import split_lines
+from studyvault.instrument import count
+from studyvault import changes, storage
+
+INDEX_SUFFIX = "search"
+INDEX_VERSION = "3"
+TOKEN_RE = re.compile(r"\w+")
+BATCH_SIZE = 10000
+# Above this share of candidate lines a sequential pass beats seeking line by line.
+DENSE_CANDIDATES = 0.05
+# Ranges summed per statement by tokens_in_ranges (three bound values each, under
+# SQLite's historical limit of 999).
+RANGES_PER_QUERY = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS lines (id INTEGER PRIMARY KEY, line INTEGER NOT NULL, offset INTEGER NOT NULL,
+                                  length INTEGER NOT NULL, tokens INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS lines_by_line ON lines (line);
+CREATE INDEX IF NOT EXISTS lines_by_offset ON lines (offset);
+CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS postings (token TEXT NOT NULL, line_id INTEGER NOT NULL, tf INTEGER NOT NULL DEFAULT 1);
+CREATE INDEX IF NOT EXISTS postings_by_token ON postings (token);
+CREATE INDEX IF NOT EXISTS postings_by_line ON postings (line_id);
+"""
+# Postings point at a line's stable id, not its number, so an edit only renumbers
+# the (much smaller) lines table.
+
+# Open index connections, kept for the life of the process so repeated searches stay cheap.
+_connections = {}
+
+
+def index_path(path):
+    """Return the path of the inverted index stored next to a library."""
+    return sidecar_path(path, INDEX_SUFFIX)
+
+
+def tokenize(text):
+    """Return the set of lower-cased word tokens in text."""
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+def token_counts(text):
+    """Return a Counter of the lower-cased word tokens in text."""
+    return Counter(TOKEN_RE.findall(text.lower()))
+
+
+def _connect(path):
+    conn = _connections.get(path)
+    if conn is None:
+        # The background warm-up (studyvault.warmup) may open it; it never runs alongside a command.
+        conn = sqlite3.connect(index_path(path), check_same_thread=False)
+        conn.executescript(SCHEMA)
+        _connections[path] = conn
+    return conn
+
+
+def close_index(path):
+    """Close the cached connection for a library, if any."""
+    conn = _connections.pop(path, None)
+    if conn is not None:
+        conn.close()
+
+
+def _encode_signature(signature):
+    return ":".join([INDEX_VERSION] + [str(part) for part in signature])
+
+
+def _stored_signature(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+    return row[0] if row else None
+
+
+def _set_signature(conn, signature):
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)",
+        (_encode_signature(signature),),
+    )
+
+
+def total_tokens(conn):
+    """Return the number of word tokens in the library (for average section length)."""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'tokens'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _add_tokens(conn, delta):
+    conn.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES ('tokens', ?)",
+        (str(total_tokens(conn) + delta),),
+    )
+
+
+def _next_line_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM lines").fetchone()[0]
+
+
+def _insert_lines(conn, rows, first_id):
+    """
+    Insert (line, offset, raw_bytes) rows, numbered with ids from first_id on, together
+    with their postings and term frequencies. Returns the number of word tokens inserted.
+    """
+    line_rows = []
+    posting_rows = []
+    vocabulary = set()
+    inserted = 0
+    for line_id, (line_number, offset, raw) in enumerate(rows, first_id):
+        counts = token_counts(raw.decode('utf-8'))
+        size = sum(counts.values())
+        inserted += size
+        line_rows.append((line_id, line_number, offset, len(raw), size))
+        vocabulary.update(counts)
+        posting_rows.extend((token, line_id, tf) for token, tf in counts.items())
+
+    conn.executemany("INSERT INTO lines (id, line, offset, length, tokens) VALUES (?, ?, ?, ?, ?)", line_rows)
+    conn.executemany("INSERT INTO postings (token, line_id, tf) VALUES (?, ?, ?)", posting_rows)
+    conn.executemany("INSERT OR IGNORE INTO tokens (token) VALUES (?)", ((t,) for t in vocabulary))
+    return inserted
+
+
+def build_index(path):
+    """Tokenize the whole library and rebuild its inverted index from scratch."""
+    conn = _connect(path)
+    signature = file_signature(path)
+    # Dropping (rather than emptying) the tables also upgrades an index from an older schema.
+    conn.executescript("DROP TABLE IF EXISTS meta; DROP TABLE IF EXISTS lines; "
+                       "DROP TABLE IF EXISTS tokens; DROP TABLE IF EXISTS postings;" + SCHEMA)
+
+    batch = []
+    offset = 0
+    inserted = 0
+    with open_library(path) as f:
+        for line_number, raw in enumerate(f, 1):
+            batch.append((line_number, offset, raw))
+            offset += len(raw)
+            if len(batch) >= BATCH_SIZE:
+                inserted += _insert_lines(conn, batch, batch[0][0])
+                batch = []
+    if batch:
+        inserted += _insert_lines(conn, batch, batch[0][0])
+
+    _add_tokens(conn, inserted)
+    _set_signature(conn, signature)
+    conn.commit()
+    return conn
+
+
+def open_index(path):
+    """
+    Return an up-to-date index connection for the library. If the library changed
+    behind our back, the changed lines are patched in when the change can be
+    localized (see studyvault.changes), else the index is rebuilt. Returns None if
+    the index cannot be used.
+    """
+    try:
+        conn = _connect(path)
+        if _stored_signature(conn) != _encode_signature(file_signature(path)):
+            changes.resync(path)
+            if _stored_signature(conn) != _encode_signature(file_signature(path)):
+                conn = build_index(path)
+                changes.remember(path)
+        return conn
+    except (sqlite3.Error, OSError):
+        close_index(path)
+        return None
+
+
+def token_clauses(keyword):
+    """
+    Translate the query into token lookups. A token bounded by non-word characters on
+    both sides must appear verbatim in a matching line; a token at the edge of the query
+    may be the prefix, suffix or middle of a longer token in the line.
+    Returns (rank, sql_condition, argument) tuples, cheapest lookups first.
+    """
+    lowered = keyword.lower()
+    clauses = []
+    for match in TOKEN_RE.finditer(lowered):
+        token = match.group()
+        open_left = match.start() == 0
+        open_right = match.end() == len(lowered)
+        if not open_left and not open_right:
+            clauses.append((0, "token = ?", token))
+        elif not open_left:
+            clauses.append((1, "token GLOB ?", token + "*"))
+        elif not open_right:
+            clauses.append((2, "token GLOB ?", "*" + token))
+        else:
+            clauses.append((3, "token GLOB ?", "*" + token + "*"))
+    clauses.sort(key=lambda clause: (clause[0], -len(clause[2])))
+    return clauses
+
+
+def candidate_lines(conn, keyword):
+    """
+    Return the sorted line numbers that may contain keyword, or None if the query
+    has no word characters and cannot be answered from postings.
+    """
+    clauses = token_clauses(keyword)
+    if not clauses:
+        return None
+
+    # Exact and prefix lookups use the token index; only fall back to a vocabulary
+    # scan for a single edge token when nothing cheaper is available.
+    cheap = [clause for clause in clauses if clause[0] <= 1] or clauses[:1]
+    candidates = None
+    for rank, condition, argument in cheap:
+        if rank == 0:
+            tokens = [argument]
+        else:
+            tokens = [row[0] for row in conn.execute(f"SELECT token FROM tokens WHERE {condition}", (argument,))]
+        found = set()
+        for token in tokens:
+            found.update(row[0] for row in conn.execute(
+                "SELECT lines.line FROM postings JOIN lines ON lines.id = postings.line_id "
+                "WHERE postings.token = ?", (token,)))
+        candidates = found if candidates is None else candidates & found
+        if not candidates:
+            break
+    return sorted(candidates)
+
+
+def term_postings(conn, token):
+    """Return [(line_number, term_frequency)] for one exact token, in line order."""
+    return conn.execute(
+        "SELECT lines.line, postings.tf FROM postings JOIN lines ON lines.id = postings.line_id "
+        "WHERE postings.token = ? ORDER BY lines.line", (token,)).fetchall()
+
+
+def tokens_in_ranges(conn, ranges):
+    """
+    Return {key: token_count} for (key, first_line, last_line) ranges (inclusive),
+    summed a few hundred ranges per statement. The ranges travel as a VALUES list
+    rather than a temporary table, so concurrent readers can share the connection.
+    """
+    totals = {}
+    for start in range(0, len(ranges), RANGES_PER_QUERY):
+        chunk = ranges[start:start + RANGES_PER_QUERY]
+        values = ",".join(["(?, ?, ?)"] * len(chunk))
+        totals.update(conn.execute(
+            f"WITH ranges (key, first, last) AS (VALUES {values}) "
+            "SELECT ranges.key, SUM(lines.tokens) FROM ranges "
+            "JOIN lines ON lines.line BETWEEN ranges.first AND ranges.last GROUP BY ranges.key",
+            [field for entry in chunk for field in entry]))
+    return {key: totals.get(key, 0) for key, _, _ in ranges}
+
+
+def read_lines(path, conn, line_numbers):
+    """Yield (line_number, text) for the given line numbers, read by byte offset."""
+    with open_library(path) as f:
+        for start in range(0, len(line_numbers), 500):
+            chunk = line_numbers[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT line, offset, length FROM lines WHERE line IN ({placeholders}) ORDER BY line",
+                chunk,
+            ).fetchall()
+            count(bytes_read=sum(row[2] for row in rows), lines_scanned=len(rows))
+            for line_number, offset, length in rows:
+                f.seek(offset)
+                yield line_number, f.read(length).decode('utf-8')
+
+
+def read_lines_sequential(path, line_numbers):
+    """Yield (line_number, text) for the given line numbers in one sequential pass."""
+    wanted = set(line_numbers)
+    with open_library(path) as f:
+        line_number = 0
+        try:
+            for line_number, raw in enumerate(f, 1):
+                if line_number in wanted:
+                    yield line_number, raw.decode('utf-8')
+        finally:
+            count(bytes_read=f.tell(), lines_scanned=line_number)
+
+
+def search(path, query):
+    """
+    Return [(line_number, stripped_line)] for lines matching a search.Query, answered
+    from postings plus a verify pass over candidate lines only. Returns None when the
+    index is unavailable or cannot narrow the query (regex and multi-term queries).
+    """
+    keyword = query.index_text
+    if keyword is None:
+        return None
+    if storage.kind(path) == storage.SQLITE:
+        # The library carries its own FTS index; no sidecar is kept for it.
+        from studyvault import sqlite_store
+        return sqlite_store.search(path, query)
+    conn = open_index(path)
+    if conn is None:
+        return None
+    lines = candidate_lines(conn, keyword)
+    if lines is None:
+        return None
+
+    total = conn.execute("SELECT MAX(line) FROM lines").fetchone()[0] or 0
+    if len(lines) > total * DENSE_CANDIDATES:
+        candidates = read_lines_sequential(path, lines)
+    else:
+        candidates = read_lines(path, conn, lines)
+
+    return [
+        (line_number, text.strip())
+        for line_number, text in candidates
+        if query.matches(text)
+    ]
+
+
+def _line_containing(conn, offset):
+    return conn.execute(
+        "SELECT line, offset, length FROM lines WHERE offset <= ? ORDER BY offset DESC LIMIT 1",
+        (offset,),
+    ).fetchone()
+
+
+def _affected_regions(conn, splices):
+    """
+    Map each splice onto the whole lines it touches, merging splices that share lines.
+    Returns [first_line, last_line, start_offset, end_offset, byte_delta] in old coordinates.
+    """
+    if not splices:
+        return []
+    start = _line_containing(conn, splices[0].offset)
+    if start is None:
+        return [[1, 0, 0, 0, len(splice.new) - len(splice.old)] for splice in splices]
+    # Splices are sorted and do not overlap, so one ordered scan over the touched
+    # offsets finds every containing line, however many splices there are.
+    end = max(splice.offset + len(splice.old) for splice in splices)
+    rows = conn.execute("SELECT line, offset, length FROM lines WHERE offset BETWEEN ? AND ? ORDER BY offset",
+                        (start[1], end))
+    current = next(rows)
+    following = next(rows, None)
+
+    def containing(offset):
+        nonlocal current, following
+        while following is not None and following[1] <= offset:
+            current, following = following, next(rows, None)
+        return current
+
+    regions = []
+    for splice in splices:
+        first = containing(splice.offset)
+        last = containing(splice.offset + len(splice.old))
+        region = [first[0], last[0], first[1], last[1] + last[2]]
+        delta = len(splice.new) - len(splice.old)
+
+        if regions and region[0] <= regions[-1][1]:
+            previous = regions[-1]
+            previous[1] = max(previous[1], region[1])
+            previous[3] = max(previous[3], region[3])
+            previous[4] += delta
+        else:
+            regions.append(region + [delta])
+    return regions
+
+
+def apply_splices(path, splices, before):
+    """
+    Patch the index after splices were written to the library. Only the touched lines
+    are re-tokenized; every later line is renumbered by a single UPDATE of the lines
+    table (postings refer to line ids and stay put). `before` is the library's signature prior to the write;
+    if the index was not current for it, it is left to be rebuilt by the next search.
+    """
+    if not os.path.exists(index_path(path)):
+        return
+    try:
+        conn = _connect(path)
+        if before is None or _stored_signature(conn) != _encode_signature(before):
+            return
+
+        regions = _affected_regions(conn, splices)
+        shifts = []
+        new_rows = []
+        byte_shift = 0
+        line_shift = 0
+        with open_library(path) as f:
+            for first_line, last_line, start, end, delta in regions:
+                f.seek(start + byte_shift)
+                new_lines = split_lines(f.read(end - start + delta))
+                offset = start + byte_shift
+                for i, raw in enumerate(new_lines):
+                    new_rows.append((first_line + line_shift + i, offset, raw))
+                    offset += len(raw)
+                byte_shift += delta
+                line_shift += len(new_lines) - (last_line - first_line + 1)
+                shifts.append((last_line, line_shift, byte_shift))
+
+        removed = _drop_lines(conn, [(first_line, last_line) for first_line, last_line, _, _, _ in regions])
+        if any(line_delta or byte_delta for _, line_delta, byte_delta in shifts):
+            _shift_rows(conn, shifts)
+        _add_tokens(conn, _insert_lines(conn, new_rows, _next_line_id(conn)) - removed)
+        _set_signature(conn, file_signature(path))
+        conn.commit()
+    except (sqlite3.Error, OSError):
+        close_index(path)
+        remove_file(index_path(path))
+
+
+def _drop_lines(conn, ranges):
+    """
+    Delete the lines in the (first_line, last_line) ranges and their postings, in a
+    few set-based statements. Returns the number of tokens they held.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS ranges "
+                 "(key INTEGER PRIMARY KEY, first INTEGER, last INTEGER)")
+    conn.execute("DELETE FROM ranges")
+    conn.executemany("INSERT INTO ranges (first, last) VALUES (?, ?)", ranges)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS dropped (id INTEGER PRIMARY KEY, tokens INTEGER)")
+    conn.execute("DELETE FROM dropped")
+    conn.execute("INSERT INTO dropped SELECT lines.id, lines.tokens FROM ranges "
+                 "JOIN lines ON lines.line BETWEEN ranges.first AND ranges.last")
+    removed = conn.execute("SELECT COALESCE(SUM(tokens), 0) FROM dropped").fetchone()[0]
+    conn.execute("DELETE FROM postings WHERE line_id IN (SELECT id FROM dropped)")
+    conn.execute("DELETE FROM lines WHERE id IN (SELECT id FROM dropped)")
+    return removed
+
+
+def restamp(path, before, after):
+    """The library's signature changed from `before` to `after` without its content changing."""
+    if not os.path.exists(index_path(path)):
+        return
+    try:
+        conn = _connect(path)
+        if _stored_signature(conn) == _encode_signature(before):
+            _set_signature(conn, after)
+            conn.commit()
+    except sqlite3.Error:
+        close_index(path)
+
+
+def _shift_rows(conn, shifts):
+    """
+    Renumber the lines after the edited regions. `shifts` holds (last_line, line_shift,
+    byte_shift) per region, cumulative, so a line after region k moves by entry k.
+    """
+    if len(shifts) == 1:
+        last_line, line_shift, byte_shift = shifts[0]
+        conn.execute("UPDATE lines SET line = line + ?, offset = offset + ? WHERE line > ?",
+                     (line_shift, byte_shift, last_line))
+        return
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS shifts "
+                 "(after_line INTEGER PRIMARY KEY, line_shift INTEGER, byte_shift INTEGER)")
+    conn.execute("DELETE FROM shifts")
+    conn.executemany("INSERT INTO shifts VALUES (?, ?, ?)", shifts)
+    pick = "SELECT {} FROM shifts WHERE after_line < {}.line ORDER BY after_line DESC LIMIT 1"
+    conn.execute(
+        f"UPDATE lines SET line = line + ({pick.format('line_shift', 'lines')}), "
+        f"offset = offset + ({pick.format('byte_shift', 'lines')}) WHERE line > ?",
+        (shifts[0][0],),
+    )
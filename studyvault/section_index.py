@@ -0,0 +1,86 @@
+# studyvault/section_index.py
+
+from studyvault.parser import iter_sections
+from studyvault.fileio import sidecar_path, file_signature, library_size, load_json, write_json, remove_file
+from studyvault.journal import open_library
+from studyvault.instrument import count
+from studyvault import changes, storage
+
+INDEX_SUFFIX = "sections"
+INDEX_VERSION = 1
+
+
+def index_path(path):
+    """Return the path of the section index stored next to a library."""
+    return sidecar_path(path, INDEX_SUFFIX)
+
+
+def build_section_index(path):
+    """
+    Scan the library once and return a list of [title, line_number, byte_offset, byte_length]
+    for every '## ' section. The length runs up to the next section header or the end of file.
+    """
+    sections = [
+        [title, line_number, offset, 0]
+        for title, line_number, offset, _ in iter_sections(path, with_lines=False)
+        if title is not None
+    ]
+    end = library_size(path)
+    for i, entry in enumerate(sections):
+        next_offset = sections[i + 1][2] if i + 1 < len(sections) else end
+        entry[3] = next_offset - entry[2]
+    return sections
+
+
+def load_section_index(path):
+    """
+    Return the section index for a library, rebuilding the sidecar file when the
+    library's size or modification time no longer matches the stored signature
+    and the change cannot be patched in (see studyvault.changes).
+    """
+    if storage.kind(path) == storage.SQLITE:
+        from studyvault import sqlite_store
+        return sqlite_store.section_rows(path)
+    signature = file_signature(path)
+    data = load_json(index_path(path))
+    if data and data.get("version") == INDEX_VERSION and data.get("signature") == signature:
+        return data["sections"]
+    if data and changes.resync(path):
+        # Edited outside StudyVault; only the changed sections were re-read.
+        data = load_json(index_path(path))
+        if data and data.get("signature") == signature:
+            return data["sections"]
+
+    sections = build_section_index(path)
+    save_section_index(path, signature, sections)
+    changes.remember(path)
+    return sections
+
+
+def save_section_index(path, signature, sections):
+    """Store section rows in the sidecar, stamped with the library signature they describe."""
+    if storage.kind(path) == storage.SQLITE:
+        return  # read from the library's own row index instead
+    write_json(index_path(path), {
+        "version": INDEX_VERSION,
+        "signature": signature,
+        "sections": sections,
+    })
+
+
+def invalidate_section_index(path):
+    """Drop the sidecar index after the library was rewritten."""
+    remove_file(index_path(path))
+
+
+def read_section(path, offset, length):
+    """Read one section straight from its byte offset without touching the rest of the file."""
+    backend = storage.backend(path)
+    if backend is not None:
+        data = backend.read_range(path, offset, length)
+    else:
+        with open_library(path) as f:
+            f.seek(offset)
+            data = f.read(length)
+    count(bytes_read=len(data))
+    return data.decode('utf-8')
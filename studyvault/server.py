@@ -0,0 +1,374 @@
+# studyvault/server.py
+#
+# `studyvault serve`: a local asyncio server that keeps the libraries in
+# data_libraries/ parsed and indexed in one process, so a query costs neither an
+# interpreter start nor a re-parse. Requests are JSON operations, the same ones
+# `studyvault batch` reads (studyvault.commands.run_operation), sent over HTTP/1.1
+# on a TCP port or a Unix socket:
+#
+#   curl -s localhost:8765/search -H 'Content-Type: application/json' \
+#        -d '{"library": "physics", "keyword": "momentum"}'
+#   curl -s --unix-socket /tmp/sv.sock http://sv/op -H 'Content-Type: application/json' \
+#        -d '{"op": "index", "library": "physics"}'
+#
+# Any web page the user opens can send requests to localhost, so the server only
+# touches data_libraries/ and exports/: libraries are given by name, never as a
+# path, and an "output" is a file name written to exports/. Bodies must be sent as
+# application/json (a page cannot send that cross-origin without the browser
+# asking first), and a request whose Host or Origin names another site is refused.
+#
+# Operations run on a thread pool. Each library has a readers-writer lock: searches
+# and index listings of a library run side by side, every other operation on it
+# runs alone. A read only shares the lock once the library is settled, meaning its
+# journal is folded in and its section map and search index match the file, so
+# concurrent reads never build or write anything; the first read after a change
+# settles the library under the exclusive lock. Only the most recently used
+# libraries keep their SQLite connections open; the rest reopen them on demand.
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from studyvault import commands, file_manager
+from studyvault.console import console
+from studyvault.fileio import file_signature
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Operations that only read a library once it is settled.
+READ_OPERATIONS = ("search", "index")
+# Not served: export-all runs its own process pool over every library, and both
+# take directories anywhere on disk.
+UNSERVED_OPERATIONS = ("export-all", "import")
+# Where a served operation's "output" file name is written.
+EXPORT_DIR = "exports"
+# Host names a request may address (the bound host is added when serving on TCP).
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+# URL paths that name an operation, besides the operation names themselves.
+ALIASES = {"sections": "index"}
+MAX_BODY = 64 * 1024 * 1024
+# Libraries whose database connections (SQLite backend, search index) stay open.
+MAX_OPEN_LIBRARIES = 64
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 415: "Unsupported Media Type", 500: "Internal Server Error"}
+
+
+class LibraryLock:
+    """A readers-writer lock for one library; waiting writers keep new readers out."""
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    async def acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writing and not self._writers_waiting)
+            self._readers += 1
+
+    async def release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            self._condition.notify_all()
+
+    async def acquire_write(self):
+        async with self._condition:
+            self._writers_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writing and not self._readers)
+            finally:
+                self._writers_waiting -= 1
+            self._writing = True
+
+    async def release_write(self):
+        async with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
+def _is_bare_name(name):
+    """True for a plain file name: no directory part, drive or '..'."""
+    return bool(name) and not any(sep in name for sep in ("/", "\\", ":")) and ".." not in name
+
+
+def confine(operation):
+    """
+    Check that an operation only names files the server may touch and return the
+    operation to run: "library" must be a library name and "output" a file name,
+    which is placed in exports/. Raises commands.OperationError otherwise.
+    """
+    library = operation.get("library")
+    if isinstance(library, str) and not _is_bare_name(library):
+        raise commands.OperationError("Field 'library' must be a library name, not a path.")
+    output = operation.get("output")
+    if output is not None:
+        if not isinstance(output, str) or not _is_bare_name(output):
+            raise commands.OperationError("Field 'output' must be a file name; it is written to exports/.")
+        operation = dict(operation, output=os.path.join(EXPORT_DIR, output))
+    return operation
+
+
+def _host_name(host):
+    """'localhost:8765' -> 'localhost'; IPv6 literals keep their brackets."""
+    name, colon, port = host.rpartition(":")
+    if not colon or "]" in port:
+        return host.lower()
+    return name.lower()
+
+
+def settle(path):
+    """
+    Bring a library's caches in line with its file: fold in the journal and load
+    the section map and search index. Returns the signature they describe.
+    """
+    from studyvault import library, search_index, storage
+    from studyvault.edits import compact
+
+    compact(path)
+    library.get_library(path)
+    if storage.kind(path) != storage.SQLITE:
+        search_index.open_index(path)
+    return file_signature(path)
+
+
+def release(path):
+    """Close a library's database connections; they are reopened on next use."""
+    from studyvault import search_index, sqlite_store
+    sqlite_store.close(path)
+    search_index.close_index(path)
+
+
+class VaultServer:
+    """Serves JSON operations against warm libraries; see the module comment."""
+
+    def __init__(self, workers=None, host=None):
+        # Host names requests may address; None (a Unix socket) skips the Host check.
+        self.host_names = None
+        if host is not None:
+            self.host_names = set(LOCAL_HOSTS) | {f"[{host}]" if ":" in host else host.lower()}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="studyvault-serve")
+        self.locks = {}
+        self.settled = {}
+        # Libraries with open connections, least recently used first.
+        self.open_libraries = OrderedDict()
+        # The catalog (list, create) is one shared file.
+        self.catalog_lock = None
+
+    def _lock(self, path):
+        lock = self.locks.get(path)
+        if lock is None:
+            lock = self.locks[path] = LibraryLock()
+        return lock
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+
+    async def warm(self):
+        """Settle every library in data_libraries/ on the thread pool while requests are served."""
+        names = await self._call(file_manager.list_markdown_files)
+        await asyncio.gather(*(self._settle(file_manager.get_library_path(name)) for name in names))
+        return len(names)
+
+    async def _settle(self, path):
+        lock = self._lock(path)
+        await lock.acquire_write()
+        try:
+            self.settled[path] = await self._call(settle, path)
+        except Exception:
+            # Reported to whoever asks for this library; the others still warm up.
+            self.settled.pop(path, None)
+        finally:
+            await lock.release_write()
+        await self._used(path)
+
+    async def _used(self, path):
+        """
+        Mark a library as recently used and close the connections of the least
+        recently used ones beyond MAX_OPEN_LIBRARIES. Called with no lock held, so
+        taking another library's lock cannot deadlock.
+        """
+        self.open_libraries[path] = True
+        self.open_libraries.move_to_end(path)
+        while len(self.open_libraries) > MAX_OPEN_LIBRARIES:
+            oldest, _ = self.open_libraries.popitem(last=False)
+            lock = self._lock(oldest)
+            await lock.acquire_write()
+            try:
+                await self._call(release, oldest)
+            finally:
+                await lock.release_write()
+
+    def _is_settled(self, path):
+        try:
+            return self.settled.get(path) == file_signature(path)
+        except OSError:
+            return False
+
+    async def run(self, operation):
+        """Run one operation dict under the right lock and return its JSON-ready result."""
+        op = operation.get("op")
+        if op in UNSERVED_OPERATIONS:
+            return {"ok": False, "error": f"'{op}' is not available from the server."}
+        try:
+            operation = confine(operation)
+        except commands.OperationError as e:
+            return {"ok": False, "error": str(e)}
+        if op in ("list", "create") or not isinstance(operation.get("library"), str):
+            if self.catalog_lock is None:
+                self.catalog_lock = asyncio.Lock()
+            async with self.catalog_lock:
+                return await self._call(commands.run_operation, operation)
+
+        path = commands.resolve_library(operation["library"])
+        try:
+            return await self._run_locked(path, op, operation)
+        finally:
+            await self._used(path)
+
+    async def _run_locked(self, path, op, operation):
+        lock = self._lock(path)
+        if op in READ_OPERATIONS:
+            await lock.acquire_read()
+            try:
+                if self._is_settled(path):
+                    return await self._call(commands.run_operation, operation)
+            finally:
+                await lock.release_read()
+
+        await lock.acquire_write()
+        try:
+            self.settled.pop(path, None)
+            if op in READ_OPERATIONS and os.path.exists(path):
+                try:
+                    self.settled[path] = await self._call(settle, path)
+                except Exception:
+                    pass  # the operation runs anyway and reports what is wrong
+            return await self._call(commands.run_operation, operation)
+        finally:
+            await lock.release_write()
+
+    def refuse(self, method, headers):
+        """
+        Return (status, body) for a request that may have come from a web page on
+        another site, or None if it can be served.
+        """
+        if self.host_names is not None and _host_name(headers.get("host", "")) not in self.host_names:
+            return 403, {"ok": False, "error": "Requests must be addressed to this machine (Host header)."}
+        origin = headers.get("origin")
+        if origin is not None:
+            scheme, _, rest = origin.partition("://")
+            if scheme.lower() != "http" or _host_name(rest) not in (self.host_names or LOCAL_HOSTS):
+                return 403, {"ok": False, "error": f"Requests from {origin} are not allowed."}
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            return 415, {"ok": False, "error": "Send operations as Content-Type: application/json."}
+        return None
+
+    async def respond(self, method, target, body):
+        """Map one HTTP request to (status, JSON-ready body)."""
+        route = target.split("?", 1)[0].strip("/")
+        if method == "GET" and route == "health":
+            return 200, {"ok": True, "settled": len(self.settled)}
+        if route != "op" and ALIASES.get(route, route) not in commands.OPERATIONS:
+            return 404, {"ok": False, "error": f"Unknown path '/{route}'."}
+        if method != "POST":
+            return 405, {"ok": False, "error": "Send operations with POST."}
+        try:
+            operation = json.loads(body.decode('utf-8') or "{}")
+            if not isinstance(operation, dict):
+                raise ValueError("the body must be a JSON object")
+        except ValueError as e:
+            return 400, {"ok": False, "error": f"Invalid JSON: {e}"}
+        if route != "op":
+            operation.setdefault("op", ALIASES.get(route, route))
+        result = await self.run(operation)
+        if "id" in operation:
+            result["id"] = operation["id"]
+        return 200, result
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it open between them."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Without a valid request line or length the stream cannot be followed further.
+                    status, result, keep_alive = 400, {"ok": False, "error": "Malformed HTTP request."}, False
+                else:
+                    if length > MAX_BODY:
+                        status, result, keep_alive = 413, {"ok": False, "error": "Request body too large."}, False
+                    else:
+                        body = await reader.readexactly(length) if length else b""
+                        try:
+                            status, result = (self.refuse(method.upper(), headers)
+                                              or await self.respond(method.upper(), target, body))
+                        except Exception as e:
+                            status, result = 500, {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                        keep_alive = version != "HTTP/1.0" and headers.get("connection", "").lower() != "close"
+
+                payload = json.dumps(result, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # the client went away, or sent a line longer than the stream limit
+        finally:
+            writer.close()
+
+
+async def _serve(host, port, socket_path, workers):
+    vault = VaultServer(workers, None if socket_path else host)
+    if socket_path:
+        server = await asyncio.start_unix_server(vault.handle, path=socket_path)
+        where = f"unix socket {socket_path}"
+    else:
+        server = await asyncio.start_server(vault.handle, host, port)
+        where = f"http://{host}:{server.sockets[0].getsockname()[1]}"
+    console.print(f"[bold green][+][/bold green] Serving data_libraries/ on {where} (Ctrl+C to stop)")
+    count = await vault.warm()
+    console.print(f"[bold green][+][/bold green] {count} libraries loaded and indexed.")
+    # Per-operation messages would only interleave; results go back to the clients.
+    console.quiet = True
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        vault.executor.shutdown(wait=True)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, workers=None):
+    """Run the server until interrupted. Returns the process exit status."""
+    if socket_path and os.path.exists(socket_path):
+        os.remove(socket_path)
+    try:
+        asyncio.run(_serve(host, port, socket_path, workers))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        console.print(f"[bold red][!][/bold red] Could not start the server: {e}")
+        return 1
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+    return 0
@@ -0,0 +1,383 @@
+# studyvault/shards.py
+#
+# Sharded storage backend (see studyvault.storage). A sharded library is a directory
+# named like the library file (physics.md/) holding segment files of whole sections,
+# each about the segment size chosen when it was sharded at most, and a manifest
+# listing them in order with their sizes and line counts. Readers see the
+# concatenation through open_reader() and only open the segments their reads fall
+# in. A write rewrites just the segments its splices touch into new files and
+# commits by replacing the manifest, so its cost is bounded by the segment size, not
+# the library size. Section titles map to segments through the section index
+# (title -> byte offset) and the segment offsets in the manifest.
+
+import io
+import json
+import os
+import shutil
+from bisect import bisect_right
+from studyvault.fileio import mapped
+from studyvault.instrument import count
+from studyvault.parser import header_title
+
+MANIFEST = "manifest.json"
+FORMAT = 1
+SEGMENT_BYTES = 1024 * 1024
+READ_BUFFER = 64 * 1024
+
+# (manifest stat key, manifest, layout, segment offsets) keyed by library path.
+_manifests = {}
+
+
+def manifest_path(path):
+    return os.path.join(path, MANIFEST)
+
+
+def _cached(path):
+    st = os.stat(manifest_path(path))
+    key = (st.st_size, st.st_mtime_ns)
+    cached = _manifests.get(path)
+    if cached is not None and cached[0] == key:
+        return cached, st
+    with open(manifest_path(path), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT:
+        raise OSError(f"Unsupported shard manifest format in {path}")
+    # [(offset, first_line, segment_path, size)], worked out once per manifest.
+    layout = []
+    offset = 0
+    line = 1
+    for segment in manifest["segments"]:
+        layout.append((offset, line, os.path.join(path, segment["file"]), segment["size"]))
+        offset += segment["size"]
+        line += segment["lines"]
+    cached = _manifests[path] = (key, manifest, layout, [entry[0] for entry in layout])
+    return cached, st
+
+
+def load_manifest(path):
+    """Return (manifest, stat of the manifest file); parsed once per manifest change."""
+    cached, st = _cached(path)
+    return cached[1], st
+
+
+def signature(path):
+    """[logical size, manifest mtime_ns, generation] of a sharded library."""
+    (_, manifest, layout, _), st = _cached(path)
+    size = layout[-1][0] + layout[-1][3] if layout else 0
+    return [size, st.st_mtime_ns, manifest["generation"]]
+
+
+def segments(path):
+    """Return [(offset, first_line, segment_path, size)] for every segment, in order."""
+    return _cached(path)[0][2]
+
+
+class _ShardReader(io.RawIOBase):
+    """Raw, seekable reader over the concatenated segments (wrapped in a BufferedReader)."""
+
+    def __init__(self, path):
+        super().__init__()
+        (_, _, layout, starts), _ = _cached(path)
+        self._layout = layout
+        self._starts = starts
+        self._size = layout[-1][0] + layout[-1][3] if layout else 0
+        self._position = 0
+        self._open_index = None
+        self._file = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        # One segment per call; BufferedReader keeps calling for the rest.
+        while self._position < self._size:
+            i = bisect_right(self._starts, self._position) - 1
+            if i != self._open_index:
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self._layout[i][2], 'rb')
+                self._open_index = i
+            self._file.seek(self._position - self._starts[i])
+            data = self._file.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                self._position += len(data)
+                return len(data)
+            self._position = self._starts[i + 1] if i + 1 < len(self._starts) else self._size
+        return 0
+
+    def close(self):
+        if not self.closed and self._file is not None:
+            self._file.close()
+        super().close()
+
+
+def open_reader(path):
+    """Open a sharded library for binary reading as one file."""
+    return io.BufferedReader(_ShardReader(path), READ_BUFFER)
+
+
+def read_range(path, offset, length):
+    """Read length logical bytes at offset, opening only the segment when the range fits in one."""
+    (_, _, layout, starts), _ = _cached(path)
+    i = bisect_right(starts, offset) - 1
+    if i >= 0 and offset + length <= starts[i] + layout[i][3]:
+        with open(layout[i][2], 'rb') as f:
+            f.seek(offset - starts[i])
+            return f.read(length)
+    with open_reader(path) as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def scan(path, start=0, end=None):
+    """Yield (offset, first_line, mmap) for each segment overlapping [start, end)."""
+    for offset, first_line, segment_path, size in segments(path):
+        if (end is not None and offset >= end) or offset + size <= start:
+            continue
+        with mapped(segment_path) as buffer:
+            yield offset, first_line, buffer
+
+
+def _fsync_directory(path):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _starts_section(data, position):
+    """True if the line starting at position is a '## ' header."""
+    end = data.find(b"\n", position)
+    return header_title(data[position:len(data) if end == -1 else end + 1]) is not None
+
+
+def _cut_before(data, start, limit):
+    """Offset of the last header line starting in (start, limit], or None."""
+    position = limit
+    while position > start:
+        newline = data.rfind(b"\n", start, position)
+        if newline == -1:
+            return None
+        if newline + 1 <= limit and newline + 1 > start and _starts_section(data, newline + 1):
+            return newline + 1
+        position = newline
+    return None
+
+
+def _cut_after(data, start):
+    """Offset of the first header line starting after start, or None."""
+    position = start
+    while True:
+        newline = data.find(b"\n", position)
+        if newline == -1 or newline + 1 >= len(data):
+            return None
+        if _starts_section(data, newline + 1):
+            return newline + 1
+        position = newline + 1
+
+
+def split_segments(data, limit):
+    """Split bytes into pieces of about limit bytes at most, each starting at a section header."""
+    pieces = []
+    start = 0
+    while len(data) - start > limit:
+        cut = _cut_before(data, start, start + limit)
+        if cut is None:
+            # A single section larger than the limit stays whole.
+            cut = _cut_after(data, start + limit)
+        if cut is None:
+            break
+        pieces.append(data[start:cut])
+        start = cut
+    if start < len(data):
+        pieces.append(data[start:])
+    return pieces
+
+
+def _write_segment(path, manifest, data):
+    name = f"{manifest['next']:06d}.md"
+    manifest["next"] += 1
+    with open(os.path.join(path, name), 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    count(bytes_written=len(data))
+    return {"file": name, "size": len(data), "lines": data.count(b"\n")}
+
+
+def _write_manifest(path, manifest):
+    tmp_path = manifest_path(path) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path(path))
+    _fsync_directory(path)
+    _manifests.pop(path, None)
+
+
+def group_splices(starts, splices):
+    """Group sorted splices into runs of consecutive pieces: [[first, last, [splices]]]."""
+    groups = []
+    for splice in splices:
+        first = max(bisect_right(starts, splice.offset) - 1, 0)
+        end = splice.offset + len(splice.old)
+        last = max(bisect_right(starts, end - 1) - 1, first) if splice.old else first
+        if groups and first <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], last)
+            groups[-1][2].append(splice)
+        else:
+            groups.append([first, last, [splice]])
+    return groups
+
+
+def _spliced(data, base, splices):
+    """data (the bytes starting at logical offset base) with the splices applied."""
+    pieces = []
+    position = 0
+    for splice in splices:
+        pieces.append(data[position:splice.offset - base])
+        pieces.append(splice.new)
+        position = splice.offset - base + len(splice.old)
+    pieces.append(data[position:])
+    return b"".join(pieces)
+
+
+def rewrite_runs(starts, splices, read):
+    """
+    Work out the new content of the runs of pieces (segments, rows) that sorted splices
+    touch: [[first, last, splices, data]]. starts holds each piece's logical offset and
+    read(first, last) returns the current bytes of pieces first..last. Runs are widened
+    until their content starts on a section header and ends with a newline, so every
+    piece but the first keeps starting on a header.
+    """
+    done = []
+    for first, last, group in group_splices(starts, splices):
+        if not starts:
+            first, last = 0, -1
+        while True:
+            if done and first <= done[-1][1]:
+                previous = done.pop()
+                first, last, group = previous[0], max(last, previous[1]), previous[2] + group
+            data = _spliced(read(first, last), starts[first] if starts else 0, group)
+            if first > 0 and data and not _starts_section(data, 0):
+                first -= 1
+                continue
+            if last + 1 < len(starts) and data and not data.endswith(b"\n"):
+                last += 1
+                continue
+            break
+        done.append([first, last, group, data])
+    return done
+
+
+def apply_splices(path, splices):
+    """
+    Write sorted, non-overlapping splices (logical offsets) into a sharded library.
+    Only the segments they touch are read and rewritten, as new files; replacing the
+    manifest commits the write, and the replaced segment files are removed after it.
+    """
+    manifest, _ = load_manifest(path)
+    manifest = dict(manifest)
+    segment_bytes = manifest["segment_bytes"]
+    old = manifest["segments"]
+    starts = []
+    position = 0
+    for segment in old:
+        starts.append(position)
+        position += segment["size"]
+
+    def read(first, last):
+        return b"".join(_read_segment(path, segment) for segment in old[first:last + 1])
+
+    done = rewrite_runs(starts, splices, read)
+    updated = []
+    removed = []
+    cursor = 0
+    for first, last, _, data in done:
+        updated.extend(old[cursor:first])
+        updated.extend(_write_segment(path, manifest, piece) for piece in split_segments(data, segment_bytes))
+        removed.extend(old[first:last + 1])
+        cursor = last + 1
+    updated.extend(old[cursor:])
+
+    manifest["segments"] = updated
+    manifest["generation"] += 1
+    _write_manifest(path, manifest)
+    for segment in removed:
+        try:
+            os.remove(os.path.join(path, segment["file"]))
+        except FileNotFoundError:
+            pass
+
+
+def _read_segment(path, segment):
+    with open(os.path.join(path, segment["file"]), 'rb') as f:
+        data = f.read()
+    count(bytes_read=len(data))
+    return data
+
+
+def from_markdown(path, segment_bytes=SEGMENT_BYTES):
+    """
+    Convert a single-file library (with no pending journal) into a sharded one. The
+    segments are built next to it and swapped in with two renames; if the process
+    stops between them, the original file is left as <library>.md.unsharded.
+    """
+    building = path + ".sharding"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    manifest = {"format": FORMAT, "generation": 1, "next": 1, "segment_bytes": segment_bytes, "segments": []}
+    pending = []
+    pending_size = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            if pending_size + len(raw) > segment_bytes and pending and header_title(raw) is not None:
+                manifest["segments"].append(_write_segment(building, manifest, b"".join(pending)))
+                pending, pending_size = [], 0
+            pending.append(raw)
+            pending_size += len(raw)
+        count(bytes_read=f.tell())
+    if pending:
+        manifest["segments"].append(_write_segment(building, manifest, b"".join(pending)))
+    _write_manifest(building, manifest)
+
+    original = path + ".unsharded"
+    os.replace(path, original)
+    os.replace(building, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    os.remove(original)
+
+
+def to_markdown(path):
+    """Write a sharded library back as one .md file (through a temporary file and renames)."""
+    tmp_path = path + ".unsharding"
+    with open_reader(path) as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, READ_BUFFER * 4)
+        dst.flush()
+        os.fsync(dst.fileno())
+        count(bytes_read=dst.tell(), bytes_written=dst.tell())
+    old = path + ".sharded"
+    os.replace(path, old)
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+    shutil.rmtree(old, ignore_errors=True)
+    _manifests.pop(path, None)
@@ -0,0 +1,496 @@
+# studyvault/sqlite_store.py
+#
+# SQLite storage backend (see studyvault.storage). The library is one SQLite
+# database at its path with a row per section (text before the first header is a
+# row of its own), ordered by a sparse position. The library's bytes are the rows'
+# bodies concatenated, so readers and writers work on it exactly as on the other
+# backends, and converting back to Markdown gives the original file byte for byte.
+#
+# Titles, sizes and line counts sit in a covering index, so the section map is
+# read without touching any text. An FTS5 index over the bodies, kept in step by
+# triggers, answers searches and BM25 ranking. Every write is one transaction that
+# replaces just the rows its splices touch.
+
+import io
+import os
+import sqlite3
+from bisect import bisect_right
+from itertools import accumulate
+from studyvault.fileio import remove_file
+from studyvault.instrument import count
+from studyvault.parser import header_title
+from studyvault.search import iter_matching_lines
+from studyvault.search_index import token_clauses
+from studyvault.shards import rewrite_runs
+
+FORMAT = "1"
+# Rows are numbered this far apart, so new sections fit in without renumbering.
+GAP = 1 << 16
+READ_BUFFER = 64 * 1024
+SCAN_CHUNK = 8 * 1024 * 1024
+# Rows fetched per query once a reader is going through the library in order.
+FETCH_ROWS = 256
+IMPORT_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, position INTEGER NOT NULL, title TEXT,
+                                     size INTEGER NOT NULL, lines INTEGER NOT NULL, body BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS sections_by_position ON sections (position, id, size, lines, title);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(
+    body, content='sections', content_rowid='id', tokenize="unicode61 remove_diacritics 0 tokenchars '_'");
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_terms USING fts5vocab(sections_fts, 'row');
+CREATE TRIGGER IF NOT EXISTS sections_insert AFTER INSERT ON sections BEGIN
+    INSERT INTO sections_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS sections_delete AFTER DELETE ON sections BEGIN
+    INSERT INTO sections_fts (sections_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+"""
+# The FTS tokenizer keeps '_' inside words like the search index's \w+ tokens, so
+# its terms are never split finer than a query's.
+
+# (pid, connection) per library path; a connection is never used across a fork.
+_connections = {}
+# Section layout per library path, checked against the stored generation.
+_layouts = {}
+
+
+def _connect(path):
+    cached = _connections.get(path)
+    if cached is not None and cached[0] == os.getpid():
+        return cached[1]
+    # The background warm-up (studyvault.warmup) may open it; it never runs alongside a command.
+    conn = sqlite3.connect(path, check_same_thread=False)
+    _connections[path] = (os.getpid(), conn)
+    return conn
+
+
+def close(path):
+    """Close the cached connection for a library and forget its layout."""
+    cached = _connections.pop(path, None)
+    _layouts.pop(path, None)
+    if cached is not None and cached[0] == os.getpid():
+        cached[1].close()
+
+
+class _Layout:
+    """Row order of one library: per row its id, position, title, size and line count."""
+
+    __slots__ = ("generation", "ids", "positions", "titles", "sizes", "lines", "starts", "first_lines",
+                 "size", "_index")
+
+    def __init__(self, generation, rows):
+        self.generation = generation
+        self.ids = [row[0] for row in rows]
+        self.positions = [row[1] for row in rows]
+        self.titles = [row[2] for row in rows]
+        self.sizes = [row[3] for row in rows]
+        self.lines = [row[4] for row in rows]
+        self._totals()
+
+    def _totals(self):
+        self.starts = list(accumulate([0] + self.sizes))
+        self.size = self.starts.pop()
+        self.first_lines = list(accumulate([1] + self.lines))[:-1]
+        self._index = None
+
+    def snapshot(self):
+        """A copy later writes do not change (they rebind the lists, never mutate them)."""
+        copy = _Layout.__new__(_Layout)
+        for name in _Layout.__slots__:
+            setattr(copy, name, getattr(self, name))
+        return copy
+
+    def index_of(self, row_id):
+        if self._index is None:
+            self._index = {row_id: i for i, row_id in enumerate(self.ids)}
+        return self._index.get(row_id)
+
+    def replace(self, first, last, rows):
+        """Swap rows first..last for new (id, position, title, size, lines) rows; lists are rebuilt, not mutated."""
+        for name, column in zip(("ids", "positions", "titles", "sizes", "lines"), range(5)):
+            values = getattr(self, name)
+            setattr(self, name, values[:first] + [row[column] for row in rows] + values[last + 1:])
+
+    def find(self, offset):
+        """Index of the row holding the byte at offset (the last row for the end)."""
+        return max(bisect_right(self.starts, offset) - 1, 0)
+
+
+def _generation(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    if row is None:
+        raise OSError("Not a StudyVault SQLite library.")
+    return int(row[0])
+
+
+def _layout(path):
+    conn = _connect(path)
+    generation = _generation(conn)
+    layout = _layouts.get(path)
+    if layout is None or layout.generation != generation:
+        rows = conn.execute("SELECT id, position, title, size, lines FROM sections ORDER BY position").fetchall()
+        layout = _layouts[path] = _Layout(generation, rows)
+    return layout
+
+
+def signature(path):
+    """[logical size, database mtime_ns, generation] of an SQLite library."""
+    layout = _layout(path)
+    return [layout.size, os.stat(path).st_mtime_ns, layout.generation]
+
+
+def section_rows(path):
+    """[title, line, offset, length] for every '## ' section, straight from the row index."""
+    layout = _layout(path)
+    return [
+        [title, line, offset, size]
+        for title, line, offset, size in zip(layout.titles, layout.first_lines, layout.starts, layout.sizes)
+        if title is not None
+    ]
+
+
+def _bodies(conn, layout, first, last):
+    """Yield the bodies of rows first..last, in order."""
+    if last < first:
+        return
+    fetched = 0
+    for (body,) in conn.execute("SELECT body FROM sections WHERE position BETWEEN ? AND ? ORDER BY position",
+                                (layout.positions[first], layout.positions[last])):
+        fetched += 1
+        yield body
+    if fetched != last - first + 1:
+        raise OSError("The library changed while it was being read.")
+
+
+class _RowReader(io.RawIOBase):
+    """Raw, seekable reader over the concatenated rows (wrapped in a BufferedReader)."""
+
+    def __init__(self, path):
+        super().__init__()
+        self._conn = _connect(path)
+        self._layout = _layout(path).snapshot()
+        self._position = 0
+        self._rows = {}
+        self._next = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._layout.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def _body(self, i):
+        body = self._rows.get(i)
+        if body is None:
+            # One row for a seek, a window of rows once reading runs on in order.
+            last = min(i + (FETCH_ROWS if i == self._next else 1), len(self._layout.ids)) - 1
+            self._rows = dict(zip(range(i, last + 1), list(_bodies(self._conn, self._layout, i, last))))
+            self._next = last + 1
+            body = self._rows[i]
+        return body
+
+    def readinto(self, buffer):
+        layout = self._layout
+        filled = 0
+        while filled < len(buffer) and self._position < layout.size:
+            i = layout.find(self._position)
+            skip = self._position - layout.starts[i]
+            data = self._body(i)[skip:skip + len(buffer) - filled]
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self._position += len(data)
+        return filled
+
+
+def open_reader(path):
+    """Open an SQLite library for binary reading as one file."""
+    return io.BufferedReader(_RowReader(path), READ_BUFFER)
+
+
+def read_range(path, offset, length):
+    """Read length logical bytes at offset; a range inside one row is cut out by SQLite."""
+    layout = _layout(path)
+    i = layout.find(offset)
+    if layout.ids and offset + length <= layout.starts[i] + layout.sizes[i]:
+        row = _connect(path).execute("SELECT substr(body, ?, ?) FROM sections WHERE id = ?",
+                                     (offset - layout.starts[i] + 1, length, layout.ids[i])).fetchone()
+        return row[0] if row else b""
+    with open_reader(path) as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def scan(path, start=0, end=None):
+    """Yield (offset, first_line, bytes) runs of whole rows, about SCAN_CHUNK each, overlapping [start, end)."""
+    layout = _layout(path)
+    if not layout.ids:
+        return
+    first = layout.find(start)
+    last = len(layout.ids) - 1 if end is None else layout.find(max(end - 1, 0))
+    pieces = []
+    size = 0
+    run_start = first
+    for i, body in enumerate(_bodies(_connect(path), layout, first, last), first):
+        pieces.append(body)
+        size += len(body)
+        if size >= SCAN_CHUNK or i == last:
+            yield layout.starts[run_start], layout.first_lines[run_start], b"".join(pieces)
+            pieces, size, run_start = [], 0, i + 1
+
+
+def _split(data):
+    """Split bytes into section rows: a piece per '## ' header line, plus any text before the first."""
+    cuts = [0]
+    position = 0
+    while True:
+        found = data.find(b"## ", position)
+        if found == -1:
+            break
+        line_start = data.rfind(b"\n", 0, found) + 1
+        line_end = data.find(b"\n", found)
+        line_end = len(data) if line_end == -1 else line_end + 1
+        if line_start > cuts[-1] and header_title(data[line_start:line_end]) is not None:
+            cuts.append(line_start)
+        position = line_end
+    cuts.append(len(data))
+    return [data[a:b] for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+def _row(body):
+    """(title, size, lines, body) for one section row."""
+    end = body.find(b"\n")
+    return header_title(body if end == -1 else body[:end + 1]), len(body), body.count(b"\n"), body
+
+
+def _slots(layout, first, last, wanted):
+    """
+    Positions for `wanted` new rows replacing rows first..last, or None when there is
+    no room between the neighbours (the caller renumbers and asks again).
+    """
+    positions = layout.positions
+    if last - first + 1 == wanted:
+        return positions[first:last + 1]
+    if not positions:
+        return [GAP * (j + 1) for j in range(wanted)]
+    # Runs split the space between them at the midpoints, so two runs next to each
+    # other never hand out the same positions.
+    low = positions[first] - GAP * (wanted + 1) if first == 0 else (positions[first - 1] + positions[first]) // 2 + 1
+    if last + 1 >= len(positions):
+        high = positions[last] + GAP * (wanted + 1)
+    else:
+        high = (positions[last] + positions[last + 1]) // 2
+    step = (high - low) // (wanted + 1)
+    if step < 1:
+        return None
+    return [low + step * (j + 1) for j in range(wanted)]
+
+
+def _renumber(conn, layout, spacing):
+    positions = [spacing * (i + 1) for i in range(len(layout.ids))]
+    conn.executemany("UPDATE sections SET position = ? WHERE id = ?", zip(positions, layout.ids))
+    layout.positions = positions
+
+
+def apply_splices(path, splices):
+    """
+    Write sorted, non-overlapping splices (logical offsets) into an SQLite library in
+    one transaction. Only the rows they touch are read and replaced; the FTS index
+    follows through triggers.
+    """
+    conn = _connect(path)
+    layout = _layout(path)
+
+    def read(first, last):
+        data = b"".join(_bodies(conn, layout, first, last))
+        count(bytes_read=len(data))
+        return data
+
+    runs = [(first, last, _split(data)) for first, last, _, data in rewrite_runs(layout.starts, splices, read)]
+    try:
+        _write_runs(conn, layout, runs)
+    except BaseException:
+        _layouts.pop(path, None)
+        raise
+
+
+def _write_runs(conn, layout, runs):
+    with conn:
+        slots = [_slots(layout, first, last, len(pieces)) for first, last, pieces in runs]
+        if None in slots:
+            # Spread the rows out far enough for the largest run to fit.
+            _renumber(conn, layout, GAP * (max(len(pieces) for _, _, pieces in runs) + 2))
+            slots = [_slots(layout, first, last, len(pieces)) for first, last, pieces in runs]
+
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sections").fetchone()[0]
+        written = 0
+        # Back to front, so the row indexes of earlier runs stay valid while the layout changes.
+        for (first, last, pieces), positions in reversed(list(zip(runs, slots))):
+            old_ids = layout.ids[first:last + 1]
+            conn.executemany("DELETE FROM sections WHERE id = ?", ((row_id,) for row_id in old_ids))
+            rows = []
+            for position, body in zip(positions, pieces):
+                title, size, lines, body = _row(body)
+                rows.append((next_id, position, title, size, lines, body))
+                next_id += 1
+                written += size
+            conn.executemany("INSERT INTO sections (id, position, title, size, lines, body) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            layout.replace(first, last, [row[:5] for row in rows])
+
+        layout.generation += 1
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'generation'", (str(layout.generation),))
+    layout._totals()
+    count(bytes_written=written)
+
+
+def _create(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [("format", FORMAT), ("generation", "1")])
+    return conn
+
+
+def _replace(tmp_path, path):
+    """Move a finished database or file over the library path, after fsyncing it."""
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    close(path)
+    os.replace(tmp_path, path)
+
+
+def from_markdown(path):
+    """Convert a single-file library (with no pending journal) into an SQLite one, row by row."""
+    tmp_path = path + ".converting"
+    remove_file(tmp_path)
+    conn = _create(tmp_path)
+    try:
+        batch = []
+        row = []
+        position = 0
+        with open(path, 'rb') as f:
+            for raw in f:
+                if row and header_title(raw) is not None:
+                    position += GAP
+                    batch.append((position,) + _row(b"".join(row)))
+                    row = []
+                    if len(batch) >= IMPORT_BATCH:
+                        conn.executemany("INSERT INTO sections (position, title, size, lines, body) "
+                                         "VALUES (?, ?, ?, ?, ?)", batch)
+                        batch = []
+                row.append(raw)
+            count(bytes_read=f.tell())
+        if row:
+            batch.append((position + GAP,) + _row(b"".join(row)))
+        conn.executemany("INSERT INTO sections (position, title, size, lines, body) VALUES (?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    _replace(tmp_path, path)
+
+
+def to_markdown(path):
+    """Write an SQLite library back as one .md file, byte for byte what it holds."""
+    tmp_path = path + ".converting"
+    with open_reader(path) as src, open(tmp_path, 'wb') as dst:
+        while True:
+            data = src.read(SCAN_CHUNK)
+            if not data:
+                break
+            dst.write(data)
+        count(bytes_written=dst.tell())
+    _replace(tmp_path, path)
+
+
+def _candidates(conn, keyword):
+    """Row ids whose FTS terms may hold keyword, or None if it has no word characters."""
+    clauses = token_clauses(keyword)
+    if not clauses:
+        return None
+    cheap = [clause for clause in clauses if clause[0] <= 1] or clauses[:1]
+    candidates = None
+    for rank, _, argument in cheap:
+        if rank == 0:
+            expressions = [f'"{argument}"']
+        elif rank == 1:
+            expressions = [f'"{argument[:-1]}"*']
+        else:
+            terms = [row[0] for row in conn.execute("SELECT term FROM sections_terms WHERE term GLOB ?", (argument,))]
+            expressions = [" OR ".join(f'"{term}"' for term in terms[i:i + 200]) for i in range(0, len(terms), 200)]
+        found = set()
+        for expression in expressions:
+            found.update(row[0] for row in conn.execute(
+                "SELECT rowid FROM sections_fts WHERE sections_fts MATCH ?", (expression,)))
+        candidates = found if candidates is None else candidates & found
+        if not candidates:
+            break
+    return candidates
+
+
+def search(path, query):
+    """
+    Return [(line_number, stripped_line)] for lines matching a search.Query, reading
+    only the sections the FTS index names. Returns None when the index cannot narrow
+    the query (regex and multi-term queries), like search_index.search().
+    """
+    keyword = query.index_text
+    if keyword is None:
+        return None
+    conn = _connect(path)
+    layout = _layout(path)
+    ids = _candidates(conn, keyword)
+    if ids is None:
+        return None
+
+    rows = sorted(i for i in (layout.index_of(row_id) for row_id in ids) if i is not None)
+    results = []
+    for start in range(0, len(rows), 500):
+        chunk = rows[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        bodies = dict(conn.execute(f"SELECT id, body FROM sections WHERE id IN ({placeholders})",
+                                   [layout.ids[i] for i in chunk]))
+        for i in chunk:
+            body = bodies[layout.ids[i]]
+            results.extend(
+                (layout.first_lines[i] + newlines, body[line_start:line_end].decode('utf-8').strip())
+                for line_start, line_end, newlines in iter_matching_lines(body, query)
+            )
+    return results
+
+
+def rank(path, terms, k, within=None):
+    """
+    Return up to k (score, title, line, body) for the sections best matching any of
+    the terms, by FTS5's BM25, best first; ties go to the earlier section. within,
+    a set of first line numbers, limits the ranking to those sections.
+    """
+    conn = _connect(path)
+    layout = _layout(path)
+    expression = " OR ".join(f'"{term}"' for term in terms)
+    if within is None:
+        scored = conn.execute("SELECT rowid, -bm25(sections_fts) FROM sections_fts WHERE sections_fts MATCH ? "
+                              "ORDER BY rank LIMIT ?", (expression, k)).fetchall()
+    else:
+        scored = conn.execute("SELECT rowid, -bm25(sections_fts) FROM sections_fts WHERE sections_fts MATCH ?",
+                              (expression,)).fetchall()
+    best = sorted((-score, layout.index_of(row_id), row_id) for row_id, score in scored)
+    best = [entry for entry in best if entry[1] is not None
+            and (within is None or layout.first_lines[entry[1]] in within)][:k]
+    results = []
+    for negated, i, row_id in best:
+        (body,) = conn.execute("SELECT body FROM sections WHERE id = ?", (row_id,)).fetchone()
+        count(bytes_read=len(body))
+        results.append((-negated, layout.titles[i], layout.first_lines[i], body.decode('utf-8')))
+    return results
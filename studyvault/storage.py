@@ -0,0 +1,59 @@
+# studyvault/storage.py
+#
+# Storage backends. A library is addressed by its path (physics.md) and is always
+# read and written as one byte string; what sits at the path decides how those
+# bytes are kept:
+#
+#   markdown  a plain .md file, with pending edits in its journal (the default)
+#   sharded   a directory of section-aligned segment files (studyvault.shards)
+#   sqlite    an SQLite database with one row per section (studyvault.sqlite_store)
+#
+# The markdown backend is studyvault.journal. The others are modules providing
+# signature(path), open_reader(path), read_range(path, offset, length),
+# apply_splices(path, splices) and scan(path, start, end), plus from_markdown() and
+# to_markdown() conversions. journal.open_library() and logical_signature(),
+# edits.commit() and the search engine dispatch through backend(), so file_manager
+# and the CLI work the same on every backend.
+
+import os
+import stat
+
+MARKDOWN = "markdown"
+SHARDED = "sharded"
+SQLITE = "sqlite"
+KINDS = (MARKDOWN, SHARDED, SQLITE)
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# Kind of each regular file seen, keyed by path and checked against its stat.
+_kinds = {}
+
+
+def kind(path, st=None):
+    """Return which backend stores the (existing) library at path."""
+    st = st if st is not None else os.stat(path)
+    if stat.S_ISDIR(st.st_mode):
+        return SHARDED
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _kinds.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        found = SQLITE if f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC else MARKDOWN
+    _kinds[path] = (key, found)
+    return found
+
+
+def module(name):
+    """Return the backend module for a kind, or None for plain Markdown."""
+    if name == SHARDED:
+        from studyvault import shards
+        return shards
+    if name == SQLITE:
+        from studyvault import sqlite_store
+        return sqlite_store
+    return None
+
+
+def backend(path, st=None):
+    """Return the backend module of a library, or None for a plain Markdown file."""
+    return module(kind(path, st))
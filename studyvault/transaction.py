@@ -0,0 +1,164 @@
+# studyvault/transaction.py
+
+import os
+import re
+from studyvault.edits import Splice, commit
+from studyvault.library import get_library
+from studyvault.parser import iter_lines
+from studyvault.search import compile_query
+
+
+class Transaction:
+    """
+    Queue many edits against one library and apply them with a single read and a
+    single atomic write. Line numbers and section positions always refer to the
+    library as it was when the transaction started, so queued edits never shift
+    each other. Edits touching the same line are applied in the order queued.
+
+        with Transaction(path) as tx:
+            tx.update("colour", "color")
+            tx.delete("TODO", [12, 48])
+            tx.append("Glossary", "end", "new entry")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.operations = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def update(self, old_text, new_text):
+        """Replace the first occurrence of old_text (which must fit on one line)."""
+        if "\n" in old_text:
+            raise ValueError("Transaction updates cannot span lines.")
+        self.operations.append(("update", old_text.encode('utf-8'), new_text.encode('utf-8')))
+
+    def delete(self, keyword, target_lines, mode="literal"):
+        """Delete keyword (case-insensitive, like Search) from the given line numbers."""
+        self.operations.append(("delete", compile_query(keyword, mode), set(target_lines)))
+
+    def append(self, section_title, position_type, new_data, reference=None, direction="after"):
+        """Insert new_data at the start or end of a section, or before/after one of its lines."""
+        self.operations.append(
+            ("append", f"## {section_title}".strip(), position_type, reference, direction,
+             (new_data + "\n").encode('utf-8'))
+        )
+
+    def _resolve_insertions(self):
+        """
+        Turn append operations into {line_number: [(op_index, bytes)]}, meaning "insert
+        before this line". Positions in the last section are checked against the file
+        length after the pass; None stands for the end of the file.
+        """
+        library = get_library(self.path)
+        insertions = {}
+        for index, operation in enumerate(self.operations):
+            if operation[0] != "append":
+                continue
+            _, header, position_type, reference, direction, data = operation
+            section = library.find_by_title(header)
+            if section is None:
+                continue
+
+            i = library.section_index_at_line(section.line)
+            next_line = library.sections[i + 1].line if i + 1 < len(library.sections) else None
+
+            if position_type == "start":
+                before = section.line + 1
+            elif position_type == "end":
+                before = next_line
+            elif position_type == "line" and isinstance(reference, int) and reference >= 1 \
+                    and (next_line is None or reference <= next_line - section.line - 1):
+                before = section.line + reference + (1 if direction == "after" else 0)
+            else:
+                continue
+            insertions.setdefault(before, []).append((index, data))
+        return insertions
+
+    def commit(self):
+        """
+        Apply every queued edit in one pass and write the library once, atomically.
+        Returns a list of booleans telling which queued operations took effect.
+        """
+        results = [False] * len(self.operations)
+        self.results = results
+        if not self.operations or not os.path.exists(self.path):
+            return results
+
+        insertions = self._resolve_insertions()
+        deletes = {}
+        updates = []
+        for index, operation in enumerate(self.operations):
+            if operation[0] == "delete":
+                for line_number in operation[2]:
+                    deletes.setdefault(line_number, []).append((index, operation))
+            elif operation[0] == "update":
+                updates.append((index, operation))
+        pattern = _any_of(updates)
+        compiled_for = len(updates)
+
+        splices = []
+        size = 0
+        last_line = b""
+        total_lines = 0
+        for line_number, offset, raw in iter_lines(self.path):
+            size = offset + len(raw)
+            last_line = raw
+            total_lines = line_number
+
+            touched = list(deletes.get(line_number, ()))
+            if pattern is not None and pattern.search(raw):
+                touched.extend(item for item in updates if item[1][1] in raw)
+            line = raw
+            for index, operation in sorted(touched, key=lambda item: item[0]):
+                if operation[0] == "update":
+                    if operation[1] not in line:
+                        continue
+                    line = line.replace(operation[1], operation[2], 1)
+                else:
+                    if not operation[1].matches(line):
+                        continue
+                    line = operation[1].remove(line)
+                results[index] = True
+            if any(operation[0] == "update" for _, operation in touched):
+                updates = [item for item in updates if not results[item[0]]]
+                # The pattern may keep matching applied updates; that only costs a
+                # containment check, so rebuild it once most of them are gone.
+                if len(updates) * 2 <= compiled_for:
+                    pattern = _any_of(updates)
+                    compiled_for = len(updates)
+
+            inserted = insertions.pop(line_number, [])
+            for index, _ in inserted:
+                results[index] = True
+            if inserted or line != raw:
+                splices.append(Splice(offset, raw, b"".join(data for _, data in inserted) + line))
+
+        # Whatever is left points at the end of the file (or past it, which is invalid).
+        tail = insertions.pop(total_lines + 1, []) + insertions.pop(None, [])
+        if tail:
+            tail.sort(key=lambda item: item[0])
+            data = b"".join(data for _, data in tail)
+            if last_line and not last_line.endswith(b"\n"):
+                data = b"\n" + data
+            splices.append(Splice(size, b"", data))
+            for index, _ in tail:
+                results[index] = True
+
+        if splices:
+            commit(self.path, splices, label=f"transaction of {len(self.operations)} edit(s)")
+        return results
+
+
+def _any_of(updates):
+    """Compile one regex that finds any pending update text, so most lines are skipped in C."""
+    if not updates:
+        return None
+    return re.compile(b"|".join(re.escape(operation[1]) for _, operation in updates))
@@ -0,0 +1,95 @@
+# studyvault/warmup.py
+#
+# Background warm-up for the interactive CLI. The menu spends most of its time
+# waiting in input(), so loading a library starts a daemon thread that folds
+# pending journal edits into the .md file (so a program editing it next does not
+# conflict with them) and builds its section map, newline offset table and search
+# index while the user types. The caches it fills are the ones commands already
+# use; none of them is safe to build and use at the same time, so the worker and
+# the commands take turns: the worker runs one stage at a time under a lock and
+# only while no command holds it. A command that starts during a stage waits for
+# that stage and then finds its result warm; anything the worker has not reached
+# yet is built by the command itself, as before. Writes invalidate through the
+# usual signature checks, and once warm the worker polls the file's stat to catch
+# edits made elsewhere.
+
+import threading
+from contextlib import contextmanager
+
+# Seconds between stat checks of the loaded library once it is warm.
+POLL_SECONDS = 2
+
+_lock = threading.RLock()
+_worker = None
+_cancel = None
+
+
+def _compact(path):
+    from studyvault.edits import compact
+    compact(path)
+
+
+def _warm_search_index(path):
+    from studyvault import search_index, storage
+    # SQLite libraries are searched through their own full-text index.
+    if storage.kind(path) != storage.SQLITE:
+        search_index.open_index(path)
+
+
+def _run(path, cancel):
+    from studyvault import changes, library, line_offsets
+    while True:
+        try:
+            key = changes.stat_key(path)
+        except OSError:
+            return
+        for stage in (_compact, library.get_library, line_offsets.get, _warm_search_index):
+            with _lock:
+                if cancel.is_set():
+                    return
+                try:
+                    stage(path)
+                except Exception:
+                    # Warming is best effort: a command hits (and reports) the same
+                    # problem itself if it matters, instead of a traceback mid-prompt.
+                    return
+        # Then poll the file, so an edit made outside StudyVault is patched into
+        # the caches (studyvault.changes) before the next command needs them.
+        while not cancel.wait(POLL_SECONDS):
+            try:
+                if changes.stat_key(path) != key:
+                    break
+            except OSError:
+                return
+        else:
+            return
+
+
+def start(path):
+    """
+    Start warming path's indexes in the background. An earlier worker is cancelled
+    without waiting for it, so this may be called while a command holds the lock.
+    """
+    global _worker, _cancel
+    if _cancel is not None:
+        _cancel.set()
+    _cancel = threading.Event()
+    _worker = threading.Thread(target=_run, args=(path, _cancel), name="studyvault-warmup", daemon=True)
+    _worker.start()
+
+
+def stop():
+    """Cancel the worker and wait for the stage it is running, if any (not under hold())."""
+    global _worker
+    if _worker is None:
+        return
+    _cancel.set()
+    _worker.join()
+    _worker = None
+
+
+@contextmanager
+def hold():
+    """Keep the worker paused while a command runs."""
+    with _lock:
+        yield
@@ -0,0 +1,40 @@
+# tests/test_cross_search.py
+
+import os
+
+from studyvault import cross_search, file_manager, journal
+from studyvault.console import console
+
+
+def write_library(path, target_bytes):
+    """A library of numbered sections just over target_bytes."""
+    filler = "plain filler text that matches nothing in particular\n" * 20
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Big Library\n")
+        n = 0
+        while f.tell() < target_bytes:
+            f.write(f"\n## Section {n}\n{filler}")
+            n += 1
+    return n
+
+
+def test_search_everywhere_on_journaled_library_over_one_chunk(tmp_path):
+    console.quiet = True
+    path = str(tmp_path / "big.md")
+    sections = write_library(path, cross_search.CHUNK_BYTES + 1024 * 1024)
+    assert len(cross_search._plan_chunks(path)) >= 2
+
+    # Edits near the start and the end stay pending in the journal.
+    assert file_manager.append_to_section(path, "Section 1", "end", None, "needle-early", confirm=False)
+    assert file_manager.append_to_section(path, f"Section {sections - 2}", "end", None, "needle-late",
+                                          confirm=False)
+    assert journal.load(path) is not None
+
+    results = dict(cross_search.search_everywhere("needle", str(tmp_path), workers=2))
+
+    titles = [title for title, _ in results["big.md"]]
+    assert titles == ["## Section 1", f"## Section {sections - 2}"]
+    assert "needle-late" in results["big.md"][1][1]
+    # Searching neither folded the journal in nor left temporary files behind.
+    assert journal.load(path) is not None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
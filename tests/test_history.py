@@ -0,0 +1,109 @@
+# tests/test_history.py
+
+import time
+
+import pytest
+
+from studyvault import edits, file_manager, history, journal
+from studyvault.console import console
+
+
+@pytest.fixture
+def library(tmp_path):
+    console.quiet = True
+    path = str(tmp_path / "notes.md")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# notes Library\n\n## One\nhello world\n\n## Two\nsecond line\n")
+    return path
+
+
+def read(path):
+    with journal.open_library(path) as f:
+        return f.read()
+
+
+def edit_many(path, count):
+    """Make `count` edits; return [(time after it, content after it)]."""
+    states = []
+    for i in range(count):
+        if i % 3 == 0:
+            assert file_manager.append_to_file(path, f"Topic {i}", f"notes {i}\nmore notes")
+        elif i % 3 == 1:
+            assert file_manager.update_text_in_file(path, "notes", f"note{i}")
+        else:
+            assert file_manager.append_to_section(path, "One", "end", None, f"line {i}", confirm=False)
+        states.append((time.time(), read(path)))
+        time.sleep(0.002)
+    return states
+
+
+def test_undo_redo_round_trip(library):
+    start = read(library)
+    states = [content for _, content in edit_many(library, 6)]
+
+    for expected in reversed([start] + states[:-1]):
+        assert file_manager.undo_last_edit(library)
+        assert read(library) == expected
+    assert not file_manager.undo_last_edit(library)
+    for expected in states:
+        assert file_manager.redo_last_edit(library)
+        assert read(library) == expected
+    assert not file_manager.redo_last_edit(library)
+
+    # A new edit after an undo drops what could have been redone.
+    assert file_manager.undo_last_edit(library)
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    assert not file_manager.redo_last_edit(library)
+
+
+def test_content_at_across_checkpoints(library, monkeypatch):
+    monkeypatch.setattr(history, "CHECKPOINT_MIN_BYTES", 0)
+    monkeypatch.setattr(history, "CHECKPOINT_RATIO", 0.3)
+    before = time.time()
+    start = read(library)
+    time.sleep(0.002)
+    states = edit_many(library, 9)
+    assert file_manager.undo_last_edit(library)
+    states.append((time.time(), read(library)))
+
+    kinds = [record.kind for record in history._load(library).records]
+    assert kinds.count(history.CHECKPOINT) >= 2
+    assert history.content_at(library, before) == start
+    for when, content in states:
+        assert history.content_at(library, when) == content
+
+
+def test_break_record_after_outside_edit(library, monkeypatch):
+    monkeypatch.setattr(history, "CHECKPOINT_MIN_BYTES", 0)
+    monkeypatch.setattr(history, "CHECKPOINT_RATIO", 0.3)
+    states = edit_many(library, 4)
+    edits.compact(library)
+    with open(library, 'ab') as f:
+        f.write(b"\nedited elsewhere\n")
+    outside = read(library)
+    time.sleep(0.002)
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    last = read(library)
+
+    listed, undo, _ = history.entries(library)
+    assert [entry.action for entry in listed][-2:] == ["outside edit", "edit"]
+    # States before the break come from the checkpoints taken before it.
+    for when, content in states:
+        assert history.content_at(library, when) == content
+    assert history.content_at(library, time.time()) == last
+
+    # Undo stops at the break.
+    assert undo.label
+    assert file_manager.undo_last_edit(library)
+    assert read(library) == outside
+    assert not file_manager.undo_last_edit(library)
+
+
+def test_content_at_before_break_needs_a_checkpoint(library):
+    states = edit_many(library, 2)
+    edits.compact(library)
+    with open(library, 'ab') as f:
+        f.write(b"\nedited elsewhere\n")
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    with pytest.raises(ValueError):
+        history.content_at(library, states[0][0])
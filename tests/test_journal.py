@@ -0,0 +1,133 @@
+# tests/test_journal.py
+
+import os
+
+import pytest
+
+from studyvault import commands, edits, file_manager, journal
+from studyvault.console import console
+
+
+@pytest.fixture
+def library(tmp_path):
+    console.quiet = True
+    path = str(tmp_path / "notes.md")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# notes Library\n\n## One\nhello world\n\n## Two\nsecond line\n")
+    return path
+
+
+def read(path):
+    with journal.open_library(path) as f:
+        return f.read().decode('utf-8')
+
+
+def append_outside(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_outside_edit_under_pending_journal_raises(library):
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    append_outside(library, "added elsewhere\n")
+
+    with pytest.raises(journal.JournalConflict):
+        file_manager.list_sections(library)
+    # The edit is still there to be reapplied.
+    assert os.path.exists(journal.journal_path(library))
+    assert not os.path.exists(journal.journal_path(library) + ".stale")
+
+
+def test_reapply_keeps_both_edits(library):
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    append_outside(library, "added elsewhere\n")
+
+    result = commands.run_operation({"op": "compact", "library": library, "resolve": "reapply"})
+    assert result == {"ok": True, "compacted": True, "reapplied": 1}
+    assert read(library) == ("# notes Library\n\n## One\nHELLO world\n\n## Two\nsecond line\n"
+                             "added elsewhere\n")
+    assert not os.path.exists(journal.journal_path(library))
+    assert file_manager.undo_last_edit(library)
+    assert "hello world" in read(library)
+
+
+def test_reapply_refuses_when_the_edited_text_changed(library):
+    assert file_manager.update_text_in_file(library, "second", "2nd")
+    with open(library, 'r+', encoding='utf-8') as f:
+        content = f.read().replace("second", "SECOND")
+        f.seek(0)
+        f.write(content)
+
+    assert edits.reapply(library) is None
+    assert os.path.exists(journal.journal_path(library))
+
+    result = commands.run_operation({"op": "compact", "library": library, "resolve": "discard"})
+    assert result["ok"] and os.path.exists(journal.journal_path(library) + ".stale")
+    assert "SECOND line" in read(library)
+
+
+def test_crash_after_compaction_rename_does_not_replay(library, monkeypatch):
+    assert file_manager.update_text_in_file(library, "world", "WORLD")
+    remove_file = journal.remove_file
+
+    def stop_before_removing_journal(path):
+        if path == journal.journal_path(library):
+            raise KeyboardInterrupt
+        remove_file(path)
+
+    monkeypatch.setattr(journal, "remove_file", stop_before_removing_journal)
+    with pytest.raises(KeyboardInterrupt):
+        journal.compact(library)
+    monkeypatch.undo()
+    journal._states.clear()
+
+    assert journal.load(library) is None
+    assert not os.path.exists(journal.journal_path(library))
+    assert read(library).count("WORLD") == 1
+
+
+def test_torn_last_record_is_dropped(library):
+    assert file_manager.update_text_in_file(library, "hello", "HELLO")
+    assert file_manager.update_text_in_file(library, "second", "2nd")
+    path = journal.journal_path(library)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 3)
+    journal._states.clear()
+
+    assert read(library) == "# notes Library\n\n## One\nHELLO world\n\n## Two\nsecond line\n"
+    intact = os.path.getsize(path)
+    assert intact < size - 3
+    # Later records follow the last intact one.
+    assert file_manager.update_text_in_file(library, "line", "LINE")
+    journal._states.clear()
+    assert read(library) == "# notes Library\n\n## One\nHELLO world\n\n## Two\nsecond LINE\n"
+    assert os.path.getsize(path) > intact
+
+
+def test_torn_new_journal_holds_no_edits(library):
+    with open(journal.journal_path(library), 'wb') as f:
+        f.write(journal.MAGIC[:3])
+    assert "hello world" in read(library)
+    assert not os.path.exists(journal.journal_path(library))
+
+
+def test_failed_compaction_replays_journal_once(library, monkeypatch):
+    assert file_manager.update_text_in_file(library, "hello", "hello hello")
+
+    def replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(journal.os, "replace", replace)
+    with pytest.raises(OSError):
+        journal.compact(library)
+    monkeypatch.undo()
+    journal._states.clear()
+
+    # The marker is there, but the rename never happened: replay as usual.
+    assert read(library).count("hello") == 2
+    assert not [name for name in os.listdir(os.path.dirname(library)) if name.endswith(".tmp")]
+    assert edits.compact(library)
+    assert not os.path.exists(journal.journal_path(library))
+    with open(library, encoding='utf-8') as f:
+        assert f.read().count("hello") == 2
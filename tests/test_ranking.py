@@ -0,0 +1,45 @@
+# tests/test_ranking.py
+
+import pytest
+
+from studyvault import commands, file_manager
+from studyvault.console import console
+
+
+@pytest.fixture(params=["markdown", "sharded", "sqlite"])
+def library(tmp_path, request):
+    console.quiet = True
+    path = str(tmp_path / "physics.md")
+    parts = ["# physics Library\n"]
+    parts += [f"\n## Mechanics{i}\nforces and momentum\n" for i in range(100)]
+    # Short decoys with both words, never the phrase: BM25's favourites.
+    for i in range(12):
+        parts.append(f"\n## Decoy{i}\nquantum field\n".replace("quantum field", "quantum and field"))
+    for i in range(30):
+        parts.append(f"\n## Filler{i}\nquantum field {'padding ' * (i + 1)}\n")
+    parts.append("\n## Best\nquantum field\nquantum field theory\nquantum field\n")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(parts))
+    if request.param != "markdown":
+        assert commands.run_operation({"op": "convert", "library": path, "to": request.param})["ok"]
+    return path
+
+
+def test_search_ranks_every_matching_section(library):
+    total, results = file_manager.search_ranked(library, "quantum field", 10)
+    assert total == 31
+    titles = [match.title for match in results]
+    assert titles[0] == "## Best"
+    assert not any(title.startswith("## Decoy") for title in titles)
+    scores = [match.score for match in results]
+    assert all(score > 0 for score in scores)
+    assert scores == sorted(scores, reverse=True)
+    # Shorter fillers score higher.
+    assert titles[1:] == [f"## Filler{i}" for i in range(9)]
+
+
+def test_search_keeps_substring_matches_after_ranked_ones(library):
+    total, results = file_manager.search_ranked(library, "uantum fiel", 50)
+    assert total == 31
+    assert all(match.score == 0.0 for match in results)
+    assert [match.title for match in results][:2] == ["## Filler0", "## Filler1"]
@@ -0,0 +1,22 @@
+# tests/test_render.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import markdown2
+
+from studyvault import render
+
+
+def section(i):
+    return (f"## Topic {i}\n\n"
+            f"Some *emphasis* and **bold {i}** with `code`.\n\n"
+            f"- item {i}\n- item {i + 1}\n\n"
+            f"| a | b |\n|---|---|\n| {i} | {i * 2} |\n\n"
+            f"```\nfenced {i}\n```\n")
+
+
+def test_render_section_from_many_threads():
+    texts = [section(i) for i in range(400)]
+    expected = [markdown2.markdown(text, extras=render.EXTRAS) for text in texts]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(render.render_section, texts)) == expected
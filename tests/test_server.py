@@ -0,0 +1,36 @@
+# tests/test_server.py
+
+import os
+
+import pytest
+
+from studyvault import commands, server
+
+
+@pytest.mark.parametrize("name", ["/etc/passwd", "../notes", "..", "sub/notes", "sub\\notes", "C:notes", ""])
+def test_confine_rejects_paths(name):
+    with pytest.raises(commands.OperationError):
+        server.confine({"op": "search", "library": name, "keyword": "x"})
+    with pytest.raises(commands.OperationError):
+        server.confine({"op": "export", "library": "physics", "output": name})
+
+
+def test_confine_places_output_in_exports():
+    operation = server.confine({"op": "export", "library": "physics.md", "output": "physics.pdf"})
+    assert operation["output"] == os.path.join(server.EXPORT_DIR, "physics.pdf")
+
+
+def test_refuse_cross_site_requests():
+    vault = server.VaultServer(workers=1, host="127.0.0.1")
+    try:
+        local = {"host": "localhost:8765", "content-type": "application/json; charset=utf-8"}
+        assert vault.refuse("POST", local) is None
+        assert vault.refuse("POST", dict(local, origin="http://127.0.0.1:8765")) is None
+        assert vault.refuse("GET", {"host": "[::1]:8765"}) is None
+
+        assert vault.refuse("POST", dict(local, **{"content-type": "text/plain"}))[0] == 415
+        assert vault.refuse("POST", dict(local, host="attacker.example:8765"))[0] == 403
+        assert vault.refuse("POST", dict(local, origin="http://attacker.example"))[0] == 403
+        assert vault.refuse("POST", dict(local, origin="null"))[0] == 403
+    finally:
+        vault.executor.shutdown()
@@ -0,0 +1,67 @@
+# tests/test_transaction.py
+
+import pytest
+
+from studyvault import commands, history, journal
+from studyvault.console import console
+from studyvault.transaction import Transaction
+
+CONTENT = ("# notes Library\n"
+           "\n## Colours\nthe colour red TODO\nthe colour blue\n"
+           "\n## Glossary\nterm one\nterm two TODO\n")
+
+
+@pytest.fixture
+def library(tmp_path):
+    console.quiet = True
+    path = str(tmp_path / "notes.md")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(CONTENT)
+    return path
+
+
+def read(path):
+    with journal.open_library(path) as f:
+        return f.read().decode('utf-8')
+
+
+def test_transaction_applies_edits_against_the_starting_lines(library):
+    with Transaction(library) as tx:
+        tx.append("Colours", "start", "inserted first")
+        tx.update("colour", "color")
+        tx.update("colour", "color")
+        tx.delete("todo", [4, 9])
+        tx.append("Glossary", "line", "between terms", reference=1)
+        tx.append("Glossary", "end", "last term")
+        tx.update("not there", "x")
+    assert tx.results == [True, True, True, True, True, True, False]
+    assert read(library) == ("# notes Library\n"
+                             "\n## Colours\ninserted first\nthe color red \nthe color blue\n"
+                             "\n## Glossary\nterm one\nbetween terms\nterm two \nlast term\n")
+    # One commit, so one entry to undo.
+    assert [entry.action for entry in history.entries(library)[0]] == ["edit"]
+
+
+def test_transaction_operation(library):
+    result = commands.run_operation({"op": "transaction", "library": library, "edits": [
+        {"op": "update", "old": "blue", "new": "green"},
+        {"op": "delete", "keyword": "TODO"},
+        {"op": "append", "section": "Glossary", "content": "term three"},
+    ]})
+    assert result == {"ok": True, "applied": [True, True, True]}
+    assert read(library) == ("# notes Library\n"
+                             "\n## Colours\nthe colour red \nthe colour green\n"
+                             "\n## Glossary\nterm one\nterm two \nterm three\n")
+
+
+@pytest.mark.parametrize("edits", [
+    [{"op": "store", "title": "x"}],
+    [{"op": "update", "old": "two\nlines", "new": "x"}],
+    [{"op": "append", "section": "Glossary", "position": "middle", "content": "x"}],
+    [{"op": "update", "old": "colour"}],
+    "not a list",
+])
+def test_transaction_operation_rejects_bad_edits(library, edits):
+    result = commands.run_operation({"op": "transaction", "library": library, "edits": edits})
+    assert not result["ok"] and "error" in result
+    assert read(library) == CONTENT